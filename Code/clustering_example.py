@@ -1,4 +1,3 @@
-import pandas as pd
 import tkinter as tk
 import numpy as np
 import matplotlib
@@ -11,67 +10,18 @@ from sklearn import preprocessing
 from sklearn import cluster
 from sklearn import manifold
 from mpl_toolkits.mplot3d import Axes3D
+import fileFeatures
 
 def read_pandas_csv(filename):
 	"""Read the contents of a csv file using pandas framework"""
 
-	df = pd.read_csv(filename)
+	return fileFeatures.readTrendCsv(filename)
 
-	#drop the temperature header, since it is the index pandas will use for the dataframe.
-	new_headers = df.columns.values.tolist()
-	new_headers = new_headers[1:]
+def create_dataframe_from_files(file_paths, cachePath = fileFeatures.FEATURE_CACHE):
+	"""From the files file_list create a dataframe containing the data corresponding to the summary of the files.
+	Every file is read once, in parallel across processes, and files unchanged since the last run come from the cache"""
 
-	#create the new dataframe with the appropriate headers
-	df = df.drop(new_headers[len(new_headers) - 1], axis=1)
-
-	#Replace the old headers by the new headers
-	new_headers[0] = new_headers[0].replace("[", "")
-	new_headers[len(new_headers) - 1] = new_headers[len(new_headers) - 1].replace("]", "")
-
-	for i in range(len(new_headers)):
-		new_headers[i] = new_headers[i].replace("'", "")
-
-	df.columns = new_headers
-
-	return df
-
-def create_dataframe_from_files(file_paths):
-	"""From the files file_list create a dataframe containing the data corresponding to the summary of the files"""
-
-	df_cols = list()
-
-	#create the structure of the dataframe
-	df_temp = read_pandas_csv(file_paths[0])
-	print(df_temp)
-	summary_stats = df_temp.describe()
-	column_names = df_temp.columns.values
-	temp_stats = summary_stats[column_names[0]]
-	describe_items = temp_stats.index
-
-	for column in column_names:
-		for item in describe_items:
-			df_cols.append(column.replace(" ", "") + '_' + item)
-
-	#Create dictionary to add all of the rows for the dataframe. This is more efficient than adding rows to the dataframe.
-	d = {}
-
-	for file_path in file_paths:
-		df_temp = read_pandas_csv(file_path)
-		date = df_temp.index.values[0].split()[0]
-		summary_stats = df_temp.describe()
-
-		col = list()
-
-		for column in df_temp.columns:
-			summary_stats_values = summary_stats[column].values
-			col.extend(summary_stats_values)
-		
-		d[date] = pd.Series(col, index = df_cols)
-
-	#Create the dataframe from the dictionary previously created
-	df = pd.DataFrame(d)
-
-	return df
+	return fileFeatures.featureFrame(fileFeatures.extractFeatures(list(file_paths), cachePath))
 
 def get_spaced_colors(n):
     max_value = 16581375 #255**3
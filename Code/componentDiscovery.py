@@ -0,0 +1,230 @@
+import re
+import zlib
+import time
+import collections
+
+#Fans are numbered by the digit of their points (sf3_cfm_tnd is supply fan 3), return fans come after the supply fans
+RETURN_FAN_OFFSET = 10
+DAMPER_NUMBERS = {'oa': 1, 'ra': 2, 'ea': 3}
+FILTER_NUMBERS = {'p': 1, 'f': 2} #pre-filter and final filter
+COIL_NUMBERS = {'chw': 1, 'cw': 1, 'hw': 2} #cooling and heating coil
+BASEMENT_FLOOR = 0 #'#vav-b-34' is VAV 34, after floor*100 + number
+
+#One combined pattern for the control program part of a path, the named group that matches gives the component
+_programRegex = re.compile(r'''^\#(?:
+	(?P<ahu>ahu)[-_](?P<ahuNumber>\d+)(?:(?P<vfdLetter>[a-z])_(?P<vfdSide>supply|return))?(?:_\d+)? |
+	(?P<vav>vav)-(?P<vavFloor>\d+|b)-(?P<vavNumber>\d+) |
+	(?P<sav>sav)-(?P<savFloor>\d+|b)-(?P<savNumber>\d+) |
+	(?P<thermafuser>.+)_thermafuser
+	)$''', flags = re.IGNORECASE | re.VERBOSE)
+
+#One combined pattern for the point part of a path, tells which sub-component of an AHU or VAV/SAV the point belongs to
+_pointRegex = re.compile(r'''^(?:
+	(?P<fanSide>[sr])f(?P<fanNumber>\d+)_ |
+	(?P<damperKind>oa|ra|ea)_dmpr |
+	(?P<filterKind>[pf])filter |
+	(?P<coilKind>chw|cw|hw)(?:_valve|cr|cs)
+	)''', flags = re.IGNORECASE | re.VERBOSE)
+
+Component = collections.namedtuple('Component', ['kind', 'key', 'parent', 'number', 'paths', 'guessedParent'], defaults = (False,))
+Component.__doc__ = """A discovered component. key is its natural key, e.g. ('Fan', 4, 3) for fan 3 of AHU 4,
+parent is the key of the component it hangs from and paths the DataPoints that belong to it.
+guessedParent is True when the parent was not read from the DataPoints but guessed (the AHU of a VAV/SAV's zone)"""
+
+
+def ahuKey(number):
+	return ('AHU', number)
+
+def vavKey(number):
+	return ('VAV', number)
+
+def savKey(number):
+	return ('SAV', number)
+
+
+class Topology(object):
+	"""Components found in the DataPoints, in dicts keyed by natural key"""
+
+	def __init__(self):
+
+		self._components = collections.OrderedDict()
+		self._pathComponents = {}
+
+	def add(self, kind, key, parent, number, path = None, guessedParent = False):
+		"""Register a component once, and the path under it"""
+
+		component = self._components.get(key)
+
+		if component is None:
+			component = Component(kind, key, parent, number, [], guessedParent)
+			self._components[key] = component
+
+		if path is not None:
+			component.paths.append(path)
+			self._pathComponents[path] = key
+
+		return component
+
+	def __len__(self):
+		return len(self._components)
+
+	def __contains__(self, key):
+		return key in self._components
+
+	def get(self, key):
+		return self._components.get(key)
+
+	def components(self, kind = None):
+		"""All the components, or those of one kind"""
+
+		if kind is None:
+			return list(self._components.values())
+
+		return [component for component in self._components.values() if component.kind == kind]
+
+	def componentOf(self, path):
+		"""Key of the component a path was assigned to"""
+
+		return self._pathComponents.get(path)
+
+	def counts(self):
+		return collections.Counter(component.kind for component in self._components.values())
+
+	def guessedParents(self):
+		"""Components whose parent was guessed, check them against the building before trusting the links"""
+
+		return [component for component in self._components.values() if component.guessedParent]
+
+
+def thermafuserNumber(controlProgram, name):
+	"""The Thermafuser table has no name column, so the number is a stable 31 bit hash of the control program and the
+	thermafuser name ('1C1A', '#1c1a_thermafuser'). It does not move when thermafusers are added or removed."""
+
+	text = (controlProgram or '').strip().upper() + '|' + name.strip().lower()
+
+	return zlib.crc32(text.encode('utf-8')) & 0x7fffffff
+
+def legacyThermafuserRenames(topology):
+	"""Map the keys thermafusers were stored under before thermafuserNumber(), their position in the sorted names of
+	every thermafuser of the topology, to their current keys. Pass it as renames to componentSync.sync so the rows are
+	renumbered in place. Only right for a topology discovered from the same full inventory the old numbers came from."""
+
+	names = sorted((component.paths[0].partition('/')[0], component.key) for component in topology.components('Thermafuser'))
+
+	return dict((('Thermafuser', number), key) for number, (name, key) in enumerate(names, 1))
+
+def _numberThermafusers(topology, thermafuserNames):
+
+	numbers = {}
+
+	for (controlProgram, name), paths in sorted(thermafuserNames.items(), key = lambda item: (str(item[0][0]), item[0][1])):
+		number = thermafuserNumber(controlProgram, name)
+
+		if numbers.setdefault(number, (controlProgram, name)) != (controlProgram, name):
+			raise ValueError("Thermafusers %s and %s hash to the same number %d" % (numbers[number], (controlProgram, name), number))
+
+		for path in paths:
+			topology.add('Thermafuser', ('Thermafuser', number), None, number, path)
+
+def discover(points):
+	"""Classify every DataPoint (anything with path and zone attributes) in a single pass.
+	AHUs come from '#ahu-4_...' paths, their fans, dampers, filters and coils from the point part of the path,
+	and the VFD programs ('#ahu_4a_supply') belong to supply/return fan A of AHU 4. VAVs and SAVs are
+	'#vav-<floor>-<number>' with number floor*100 + number, the basement floor 'b' counting as BASEMENT_FLOOR.
+	The DataPoints do not say which AHU feeds a VAV/SAV, so it is guessed to be the AHU of its zone and the component
+	is flagged with guessedParent, see Topology.guessedParents(). Thermafusers cannot be linked to a VAV/SAV from the
+	DataPoints so they are left without parent, their numbers come from thermafuserNumber().
+	Points may carry a controlProgram attribute, it goes into the thermafuser numbers."""
+
+	topology = Topology()
+	thermafuserNames = collections.defaultdict(list)
+
+	for point in points:
+		path = point.path
+		#The program is what comes before the first '/', points can be nested ('#vav-3-35/air_flow/flow_input')
+		program, _, suffix = path.partition('/')
+		programMatch = _programRegex.match(program)
+
+		if programMatch is None:
+			continue
+
+		groups = programMatch.groupdict()
+
+		if groups['thermafuser']:
+			thermafuserNames[(getattr(point, 'controlProgram', None), program)].append(path)
+			continue
+
+		if groups['ahu']:
+			ahuNumber = int(groups['ahuNumber'])
+			parent = topology.add('AHU', ahuKey(ahuNumber), None, ahuNumber).key
+
+			if groups['vfdSide']:
+				fanNumber = ord(groups['vfdLetter'].lower()) - ord('a') + 1
+				if groups['vfdSide'].lower() == 'return':
+					fanNumber += RETURN_FAN_OFFSET
+				topology.add('Fan', ('Fan', ahuNumber, fanNumber), parent, fanNumber, path)
+				continue
+
+		else:
+			if groups['vav']:
+				kind, floor, number = 'VAV', groups['vavFloor'], groups['vavNumber']
+			else:
+				kind, floor, number = 'SAV', groups['savFloor'], groups['savNumber']
+
+			number = (BASEMENT_FLOOR if floor.lower() == 'b' else int(floor))*100 + int(number)
+
+			#A guess, the AHU of the zone, flagged on the component
+			ahu = None
+			if point.zone is not None and str(point.zone).isdigit():
+				ahu = topology.add('AHU', ahuKey(int(point.zone)), None, int(point.zone)).key
+
+			parent = topology.add(kind, (kind, number), ahu, number, guessedParent = ahu is not None).key
+
+		pointMatch = _pointRegex.match(suffix)
+		pointGroups = pointMatch.groupdict() if pointMatch else {}
+
+		if pointGroups.get('fanSide') and parent[0] == 'AHU':
+			fanNumber = int(pointGroups['fanNumber'])
+			if pointGroups['fanSide'].lower() == 'r':
+				fanNumber += RETURN_FAN_OFFSET
+			topology.add('Fan', ('Fan', parent[1], fanNumber), parent, fanNumber, path)
+
+		elif pointGroups.get('damperKind') and parent[0] == 'AHU':
+			number = DAMPER_NUMBERS[pointGroups['damperKind'].lower()]
+			topology.add('Damper', ('Damper', parent[1], number), parent, number, path)
+
+		elif pointGroups.get('filterKind') and parent[0] == 'AHU':
+			number = FILTER_NUMBERS[pointGroups['filterKind'].lower()]
+			topology.add('Filter', ('Filter', parent[1], number), parent, number, path)
+
+		elif pointGroups.get('coilKind'):
+			number = COIL_NUMBERS[pointGroups['coilKind'].lower()]
+			topology.add('HEC', ('HEC',) + parent + (number,), parent, number, path)
+
+		else:
+			topology.add(parent[0], parent, topology.get(parent).parent, parent[1], path)
+
+	_numberThermafusers(topology, thermafuserNames)
+
+	return topology
+
+
+def benchmark(copies = 100):
+	"""Time discovery over the zone csvs repeated copies times"""
+
+	import pointInventory
+
+	inventory = pointInventory.PointInventory.fromCsv(['../csv_files/Zone3.csv', '../csv_files/Zone4.csv'], ['3', '4'])
+	points = list(inventory)
+	points = [point._replace(path = point.path.replace('/', '/%d_' % copy, 1) if copy else point.path) for copy in range(copies) for point in points]
+
+	begin = time.time()
+	topology = discover(points)
+	elapsed = time.time() - begin
+
+	print("%d DataPoints -> %d components in %.3f s %s" % (len(points), len(topology), elapsed, dict(topology.counts())))
+	print("%d VAV/SAV linked to the AHU of their zone, a guess" % len(topology.guessedParents()))
+
+
+if __name__ == '__main__':
+	benchmark()
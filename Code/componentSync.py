@@ -0,0 +1,300 @@
+import collections
+
+import sqlalchemy
+from sqlalchemy import select, bindparam, inspect
+
+from hvacDBMapping import *
+from componentDiscovery import ahuKey
+
+CHUNK_SIZE = 1000
+
+#Table, id column and number column of every component kind
+_kinds = collections.OrderedDict([
+	('AHU', (AHU.__table__, 'AHUNumber', 'AHUNumber')),
+	('Fan', (Fan.__table__, 'FanId', 'FanNumber')),
+	('Damper', (Damper.__table__, 'DamperId', 'DamperNumber')),
+	('Filter', (Filter.__table__, 'FilterId', 'FilterNumber')),
+	('VAV', (VAV.__table__, 'VAVId', 'VAVNumber')),
+	('SAV', (SAV.__table__, 'SAVId', 'SAVNumber')),
+	('HEC', (HEC.__table__, 'HECId', 'HECNumber')),
+	('Thermafuser', (Thermafuser.__table__, 'ThermafuserId', 'ThermafuserNumber')),
+])
+
+#Reading table and its component id column of every component kind, rows they reference are never deleted
+_readings = collections.OrderedDict([
+	('AHU', (AHUReading.__table__, 'AHUNumber')),
+	('Fan', (FanReading.__table__, 'FanId')),
+	('Damper', (DamperReading.__table__, 'DamperId')),
+	('Filter', (FilterReading.__table__, 'FilterId')),
+	('VAV', (VAVReading.__table__, 'VAVId')),
+	('SAV', (SAVReading.__table__, 'SAVId')),
+	('HEC', (HECReading.__table__, 'HECId')),
+	('Thermafuser', (ThermafuserReading.__table__, 'ThermafuserId')),
+])
+
+#Inserts go parents first, deletes children first
+_levels = [('AHU',), ('Fan', 'Damper', 'Filter', 'VAV', 'SAV'), ('HEC', 'Thermafuser')]
+
+StoredComponent = collections.namedtuple('StoredComponent', ['kind', 'key', 'parent', 'number', 'id'])
+
+SyncPlan = collections.namedtuple('SyncPlan', ['inserts', 'updates', 'deletes', 'kept'], defaults = ((),))
+SyncPlan.__doc__ = """Changes that bring the stored components in line with a topology.
+inserts are Components, updates (StoredComponent, new parent key, new number) triples and deletes StoredComponents.
+kept are the StoredComponents pruning would have deleted but that readings still reference."""
+
+
+def describeKey(key):
+	"""('Fan', 4, 3) -> 'Fan 4/3', ('HEC', 'VAV', 335, 1) -> 'HEC VAV 335/1'"""
+
+	if len(key) == 2:
+		return key[0] + ' ' + str(key[1])
+
+	return ' '.join(str(part) for part in key[:-1]) + '/' + str(key[-1])
+
+def readStored(connection):
+	"""Read every component table once and key the rows by natural key like componentDiscovery does.
+	Rows repeating a key (left by older migrations) come back in the second list."""
+
+	stored = {}
+	duplicates = []
+	parentKeys = {'VAV': {}, 'SAV': {}}
+
+	for kind, (table, idName, numberName) in _kinds.items():
+		for row in connection.execute(select(table).order_by(table.c[idName])).mappings():
+			number = row[numberName]
+
+			if kind == 'AHU':
+				parent = None
+			elif kind in ('Fan', 'Damper', 'Filter', 'VAV', 'SAV'):
+				parent = ahuKey(row['AHUNumber']) if row['AHUNumber'] is not None else None
+			elif row['VAVId'] is not None:
+				parent = parentKeys['VAV'].get(row['VAVId'], ('VAV', None))
+			elif row['SAVId'] is not None:
+				parent = parentKeys['SAV'].get(row['SAVId'], ('SAV', None))
+			elif kind == 'HEC':
+				parent = ahuKey(row['AHUNumber'])
+			else:
+				parent = None
+
+			if kind in ('AHU', 'VAV', 'SAV', 'Thermafuser'):
+				key = (kind, number)
+			elif kind == 'HEC':
+				key = ('HEC',) + parent + (number,)
+			else:
+				key = (kind, row['AHUNumber'], number)
+
+			component = StoredComponent(kind, key, parent, number, row[idName])
+
+			if kind in parentKeys:
+				parentKeys[kind][row[idName]] = key
+
+			if key in stored:
+				duplicates.append(component)
+			else:
+				stored[key] = component
+
+	return stored, duplicates
+
+def diff(topology, stored, duplicates = (), prune = False, referenced = frozenset(), renames = None):
+	"""Compare a discovered topology with the stored components using set operations on their natural keys.
+	A component whose parent the discovery cannot tell (thermafusers) keeps its stored parent, a stored row whose
+	number or parent differs from the discovered one is an update.
+	renames maps stored keys to the discovered keys they are now known by, e.g. thermafusers stored under their old
+	positional numbers, the row is renumbered in place so its id and readings stay.
+	With prune the stored components that were not discovered, and duplicated rows, are deleted, so only prune with a
+	topology discovered from the full inventory, every DataPoint of every zone. Rows whose (kind, id) is in referenced
+	are never deleted, they end up in kept."""
+
+	renames = dict((old, new) for old, new in (renames or {}).items() if old in stored and new not in stored and new in topology)
+	renamed = dict((new, stored[old]) for old, new in renames.items())
+
+	discovered = set(component.key for component in topology.components())
+	storedKeys = set(stored) - set(renames)
+
+	inserts = [topology.get(key) for key in discovered - storedKeys - set(renamed)]
+	candidates = ([stored[key] for key in storedKeys - discovered] + list(duplicates)) if prune else []
+	deletes = [component for component in candidates if (component.kind, component.id) not in referenced]
+	kept = [component for component in candidates if (component.kind, component.id) in referenced]
+
+	#Duplicated rows share the key of the row that stays, only pruned keys lose their component
+	deletedKeys = set(key for key in storedKeys - discovered if (stored[key].kind, stored[key].id) not in referenced) if prune else set()
+
+	updates = []
+	current = dict((key, stored[key]) for key in storedKeys - deletedKeys)
+	current.update(renamed)
+
+	for key, component in current.items():
+		new = topology.get(key)
+		parent = component.parent
+		number = component.number
+
+		if new is not None:
+			number = new.number
+			if new.parent is not None:
+				parent = new.parent
+
+		if parent in deletedKeys:
+			parent = None
+
+		if parent != component.parent or number != component.number:
+			updates.append((component, parent, number))
+
+	#Stored keys may hold None (rows without parent), so sort on their text
+	order = dict((kind, i) for i, kind in enumerate(_kinds))
+	inserts.sort(key = lambda component: (order[component.kind], str(component.key)))
+	updates.sort(key = lambda update: (order[update[0].kind], str(update[0].key)))
+	deletes.sort(key = lambda component: (order[component.kind], str(component.key), component.id))
+	kept.sort(key = lambda component: (order[component.kind], str(component.key), component.id))
+
+	return SyncPlan(inserts, updates, deletes, kept)
+
+def printPlan(plan):
+	"""Print the plan as a diff, + inserts, ~ updates, - deletes"""
+
+	for component in plan.inserts:
+		print("+ " + describeKey(component.key) + ("" if component.parent is None else " under " + describeKey(component.parent))
+			+ (" (guessed)" if getattr(component, 'guessedParent', False) else ""))
+
+	for component, parent, number in plan.updates:
+		change = ""
+		if number != component.number:
+			change += " number " + str(component.number) + " -> " + str(number)
+		if parent != component.parent:
+			change += " " + (describeKey(component.parent) if component.parent else "None") + " -> " + (describeKey(parent) if parent else "None")
+		print("~ " + describeKey(component.key) + ":" + change)
+
+	for component in plan.deletes:
+		print("- " + describeKey(component.key) + " (id " + str(component.id) + ")")
+
+	for component in plan.kept:
+		print("! " + describeKey(component.key) + " (id " + str(component.id) + ") not discovered, kept for its readings")
+
+	print("%d inserts, %d updates, %d deletes, %d kept" % (len(plan.inserts), len(plan.updates), len(plan.deletes), len(plan.kept)))
+
+def _parentColumns(kind, parent, ids):
+	"""Foreign key column values that link a component of the kind to its parent"""
+
+	if kind in ('Fan', 'Damper', 'Filter', 'VAV', 'SAV'):
+		return {'AHUNumber': parent[1] if parent is not None else None}
+
+	columns = {'VAVId': None, 'SAVId': None}
+
+	if kind == 'HEC':
+		columns['AHUNumber'] = None
+
+	if parent is None:
+		return columns
+	elif parent[0] == 'AHU':
+		columns['AHUNumber'] = parent[1]
+	else:
+		columns[parent[0] + 'Id'] = ids[parent]
+
+	return columns
+
+def _readIds(connection, kind, numbers, chunkSize):
+	"""Ids the DB assigned to new VAVs or SAVs, by natural key"""
+
+	table, idName, numberName = _kinds[kind]
+	ids = {}
+
+	for start in range(0, len(numbers), chunkSize):
+		query = select(table.c[idName], table.c[numberName]).where(table.c[numberName].in_(numbers[start:start + chunkSize]))
+		for componentId, number in connection.execute(query):
+			ids[(kind, number)] = componentId
+
+	return ids
+
+def applyPlan(connection, plan, stored, chunkSize = CHUNK_SIZE):
+	"""Write the plan with chunked executemany inserts, updates and deletes.
+	The caller owns the transaction, so either everything is written or nothing is."""
+
+	ids = dict((key, component.id) for key, component in stored.items())
+
+	for level in _levels:
+		for kind in level:
+			table, idName, numberName = _kinds[kind]
+			rows = []
+
+			for component in plan.inserts:
+				if component.kind == kind:
+					row = {numberName: component.number}
+					if kind != 'AHU':
+						row.update(_parentColumns(kind, component.parent, ids))
+					rows.append(row)
+
+			for start in range(0, len(rows), chunkSize):
+				connection.execute(table.insert(), rows[start:start + chunkSize])
+
+			if kind in ('VAV', 'SAV') and rows:
+				ids.update(_readIds(connection, kind, [row[numberName] for row in rows], chunkSize))
+
+	for kind, (table, idName, numberName) in _kinds.items():
+		rows = []
+
+		for component, parent, number in plan.updates:
+			if component.kind == kind:
+				row = _parentColumns(kind, parent, ids) if kind != 'AHU' else {}
+				row[numberName] = number
+				row['_id'] = component.id
+				rows.append(row)
+
+		if rows:
+			stmt = table.update().where(table.c[idName] == bindparam('_id'))
+			for start in range(0, len(rows), chunkSize):
+				connection.execute(stmt, rows[start:start + chunkSize])
+
+	for level in reversed(_levels):
+		for kind in level:
+			table, idName, numberName = _kinds[kind]
+			deleteIds = [component.id for component in plan.deletes if component.kind == kind]
+
+			for start in range(0, len(deleteIds), chunkSize):
+				connection.execute(table.delete().where(table.c[idName].in_(deleteIds[start:start + chunkSize])))
+
+def readReferenced(connection, components, chunkSize = CHUNK_SIZE):
+	"""(kind, id) of the components that have rows in their Reading table, or in its month tables when it is partitioned"""
+
+	tableNames = inspect(connection).get_table_names()
+	referenced = set()
+
+	for kind, (readingTable, idName) in _readings.items():
+		ids = sorted(set(component.id for component in components if component.kind == kind))
+
+		if not ids:
+			continue
+
+		names = [name for name in tableNames if name == readingTable.name or
+			(name.startswith(readingTable.name + '_') and name[len(readingTable.name) + 1:].isdigit())]
+
+		for name in names:
+			idColumn = sqlalchemy.column(idName)
+			readings = sqlalchemy.table(name, idColumn)
+
+			for start in range(0, len(ids), chunkSize):
+				query = select(idColumn).select_from(readings).where(idColumn.in_(ids[start:start + chunkSize])).distinct()
+				referenced.update((kind, componentId) for componentId in connection.execute(query).scalars())
+
+	return referenced
+
+def sync(connection, topology, dryRun = False, prune = False, renames = None, chunkSize = CHUNK_SIZE):
+	"""Bring the component tables in line with the topology. Reads the stored components once, and writes nothing
+	when there is nothing to change or in dry-run mode, where the diff is printed instead. Returns the plan.
+	Only pass prune = True with a topology discovered from the full inventory, a partial one (a single zone) would
+	delete every component of the other zones. Components readings reference are never deleted."""
+
+	stored, duplicates = readStored(connection)
+	referenced = set()
+
+	if prune:
+		discovered = set(component.key for component in topology.components())
+		candidates = [component for key, component in stored.items() if key not in discovered] + list(duplicates)
+		referenced = readReferenced(connection, candidates, chunkSize)
+
+	plan = diff(topology, stored, duplicates, prune, referenced, renames)
+
+	if dryRun:
+		printPlan(plan)
+	elif plan.inserts or plan.updates or plan.deletes:
+		applyPlan(connection, plan, stored, chunkSize)
+
+	return plan
@@ -0,0 +1,174 @@
+import threading
+import contextlib
+import collections
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload
+
+from hvacDBMapping import *
+
+#Most SELECTs loadTopology issues, whatever the size of the building. A level with no parents (e.g. no SAVs) skips
+#its children's query, and selectinload only splits a level in several queries past 500 parents
+TOPOLOGY_QUERIES = 12
+
+#Immutable nodes, the field names are those of the ORM properties so code can walk either
+AHUNode = collections.namedtuple('AHUNode', ['AHUNumber', 'fans', 'dampers', 'filters', 'hecs', 'vavs', 'savs'])
+FanNode = collections.namedtuple('FanNode', ['fanId', 'fanNumber'])
+DamperNode = collections.namedtuple('DamperNode', ['damperId', 'damperNumber'])
+FilterNode = collections.namedtuple('FilterNode', ['filterId', 'filterNumber'])
+HECNode = collections.namedtuple('HECNode', ['HECId', 'HECNumber'])
+VAVNode = collections.namedtuple('VAVNode', ['VAVId', 'VAVNumber', 'hecs', 'thermafusers'])
+SAVNode = collections.namedtuple('SAVNode', ['SAVId', 'SAVNumber', 'hecs', 'thermafusers'])
+ThermafuserNode = collections.namedtuple('ThermafuserNode', ['thermafuserId', 'thermafuserNumber'])
+
+
+class Topology(collections.namedtuple('Topology', ['ahus', 'unassignedThermafusers'])):
+	"""The AHU -> Fan/Damper/Filter/HEC/VAV/SAV -> HEC/Thermafuser tree, as tuples of nodes sorted by number,
+	plus the thermafusers that are not linked to a VAV or SAV"""
+
+	def ahu(self, number):
+
+		for ahu in self.ahus:
+			if ahu.AHUNumber == number:
+				return ahu
+
+		return None
+
+	def counts(self):
+		"""Number of components of every kind in the graph"""
+
+		counts = collections.Counter(AHU = len(self.ahus), Thermafuser = len(self.unassignedThermafusers))
+
+		for ahu in self.ahus:
+			counts.update(Fan = len(ahu.fans), Damper = len(ahu.dampers), Filter = len(ahu.filters), HEC = len(ahu.hecs),
+				VAV = len(ahu.vavs), SAV = len(ahu.savs))
+
+			for box in ahu.vavs + ahu.savs:
+				counts.update(HEC = len(box.hecs), Thermafuser = len(box.thermafusers))
+
+		return counts
+
+
+_cache = {}
+_cacheLock = threading.Lock()
+
+
+def _sorted(items, key):
+
+	return tuple(sorted(items, key = lambda item: (getattr(item, key) is None, getattr(item, key))))
+
+def _thermafuserNodes(thermafusers):
+
+	return _sorted((ThermafuserNode(thermafuser.thermafuserId, thermafuser.thermafuserNumber) for thermafuser in thermafusers), 'thermafuserNumber')
+
+def _hecNodes(hecs):
+
+	return _sorted((HECNode(hec.HECId, hec.HECNumber) for hec in hecs), 'HECNumber')
+
+def loadTopology(session):
+	"""Read the whole component tree in at most TOPOLOGY_QUERIES SELECTs, one per relationship level through selectinload,
+	and turn it into immutable nodes. The ORM objects live in a private session on the same connection, so the caller's
+	session and the objects it holds are left alone."""
+
+	with Session(bind = session.connection()) as private:
+		return _loadTopology(private)
+
+def _loadTopology(session):
+
+	vavs = selectinload(AHU._vavs)
+	savs = selectinload(AHU._savs)
+
+	ahus = session.query(AHU).options(
+		selectinload(AHU._fans), selectinload(AHU._dampers), selectinload(AHU._filters), selectinload(AHU._hecs),
+		vavs.selectinload(VAV._hecs), vavs.selectinload(VAV._thermafusers),
+		savs.selectinload(SAV._hecs), savs.selectinload(SAV._thermafusers)).all()
+
+	unassigned = session.query(Thermafuser).filter(Thermafuser._VAVId == None, Thermafuser._SAVId == None).all()
+
+	nodes = []
+
+	for ahu in ahus:
+		nodes.append(AHUNode(ahu.AHUNumber,
+			_sorted((FanNode(fan.fanId, fan.fanNumber) for fan in ahu.fans), 'fanNumber'),
+			_sorted((DamperNode(damper.damperId, damper.damperNumber) for damper in ahu.dampers), 'damperNumber'),
+			_sorted((FilterNode(filter.filterId, filter.filterNumber) for filter in ahu.filters), 'filterNumber'),
+			_hecNodes(ahu.hecs),
+			_sorted((VAVNode(vav.VAVId, vav.VAVNumber, _hecNodes(vav.hecs), _thermafuserNodes(vav.thermafusers)) for vav in ahu.vavs), 'VAVNumber'),
+			_sorted((SAVNode(sav.SAVId, sav.SAVNumber, _hecNodes(sav.hecs), _thermafuserNodes(sav.thermafusers)) for sav in ahu.savs), 'SAVNumber')))
+
+	return Topology(_sorted(nodes, 'AHUNumber'), _thermafuserNodes(unassigned))
+
+def getTopology(session, refresh = False):
+	"""Topology of the database the session is bound to, loaded once and shared until invalidate() or refresh"""
+
+	key = str(session.get_bind().url)
+
+	with _cacheLock:
+		if refresh or key not in _cache:
+			_cache[key] = loadTopology(session)
+
+		return _cache[key]
+
+def invalidate():
+	"""Forget the cached topologies, call it after the components change"""
+
+	with _cacheLock:
+		_cache.clear()
+
+
+@contextlib.contextmanager
+def countQueries(engine):
+	"""Count the statements run on an engine inside the block, the counter is the yielded list's length"""
+
+	statements = []
+
+	def before(connection, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+
+	event.listen(engine, 'before_cursor_execute', before)
+
+	try:
+		yield statements
+	finally:
+		event.remove(engine, 'before_cursor_execute', before)
+
+
+def check(csvFiles = ('../csv_files/Zone3.csv', '../csv_files/Zone4.csv'), zones = ('3', '4')):
+	"""Build the Zone3+4 components in the in-memory profile and check the loader's query count against lazy loading"""
+
+	import hvacDB
+	import componentSync
+	import componentDiscovery
+	import pointInventory
+
+	points = pointInventory.PointInventory.fromCsv(list(csvFiles), list(zones))
+	engine = hvacDB.getEngine(hvacDB.MEMORY_PROFILE)
+
+	with engine.begin() as connection:
+		componentSync.sync(connection, componentDiscovery.discover(points))
+
+	#Link a thermafuser so the VAV -> Thermafuser level has something to load
+	with hvacDB.session(hvacDB.MEMORY_PROFILE) as session:
+		session.query(Thermafuser).order_by(Thermafuser._thermafuserId).first().VAVId = session.query(VAV).first().VAVId
+
+	with hvacDB.session(hvacDB.MEMORY_PROFILE) as session, countQueries(engine) as statements:
+		topology = loadTopology(session)
+
+	if len(statements) > TOPOLOGY_QUERIES:
+		raise RuntimeError("loadTopology ran %d queries, more than %d" % (len(statements), TOPOLOGY_QUERIES))
+
+	with hvacDB.session(hvacDB.MEMORY_PROFILE) as session, countQueries(engine) as lazyStatements:
+		for ahu in session.query(AHU):
+			for relationship in (ahu.fans, ahu.dampers, ahu.filters, ahu.hecs, ahu.savs):
+				len(relationship)
+			for vav in ahu.vavs:
+				len(vav.hecs), len(vav.thermafusers)
+
+		if topology.counts()['Thermafuser'] != session.query(Thermafuser).count():
+			raise RuntimeError("the topology misses thermafusers")
+
+	print("selectinload: %d queries, lazy loading: %d queries, %s" % (len(statements), len(lazyStatements), dict(topology.counts())))
+
+
+if __name__ == '__main__':
+	check()
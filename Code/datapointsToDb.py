@@ -1,19 +1,20 @@
 #!/usr/bin/python
-import MySQLdb
 import csv
 import sqlalchemy
 import hvacDBMapping
 from sqlalchemy.orm import sessionmaker
 import traceback
+import inventoryLoader
+import hvacDB
 import datetime
 
 def connect_db():
-	"""Function used to connect to the database through MySQLdb"""
+	"""Function used to get a pooled DBAPI connection to the database"""
 
 	db = None
 
 	try:
-		db = MySQLdb.connect(host="localhost", user="dlaredorazo", passwd="@Dexsys13", db="HVAC")
+		db = hvacDB.getEngine().raw_connection()
 		cursor = db.cursor()
 		cursor.execute("SELECT VERSION()")
 		results = cursor.fetchone()
@@ -31,29 +32,6 @@ def connect_db():
 
 	return db
 
-def csvToDb(filepath, dbsession, zone):
-	"""Function used to read from csv files"""
-
-	count = 0
-
-	with open(filepath, 'r') as csvfile:
-		reader = csv.reader(csvfile)
-		for row in reader:
-			#skip the header
-			if (count == 0):
-				count += 1
-				continue
-			else:
-
-				#add the datapoints to the DB session
-				dataPoint = hvacDBMapping.DataPoint(path = row[6], server = row[0], location = row[1], branch = row[2], subBranch = row[3], controlProgram = row[4], point = row[5], zone = zone)
-				dbsession.add(dataPoint)
-				#print(dataPoint)
-
-		#commit changes to the database
-		dbsession.commit()
-
-
 def main():
 	"""Main function"""
 
@@ -62,27 +40,26 @@ def main():
 	
 	#Attempt connection to the database
 	try:
-		sqlengine = sqlalchemy.create_engine("mysql+mysqldb://dlaredorazo:@Dexsys13@localhost:3306/HVAC")
-		Session = sessionmaker(bind=sqlengine)
+		Session = hvacDB.getSessionFactory()
 		session = Session()
 
 		print("Connection successfull")
 	except Exception as e:
-		print(traceback.format.exc())
+		print(traceback.format_exc())
 		print("Error in connection")
 		return False
 	
 	#Attempt to write csv to the database
 	try:
-		#csvToDb(zone4FilepATH, session, "4")
+		#inventoryLoader.loadZoneCsvs(hvacDB.getEngine(), [zone4FilepATH], ["4"])
 		print("writting sucessfull")
 	except Exception as e:
-		print(traceback.format.exc())
+		print(traceback.format_exc())
 		print("writing error")
 		return False
 
 	#query example
-	for instance in session.query(hvacDBMapping.DataPoint).order_by(hvacDBMapping.DataPoint._path):
+	for instance in session.query(hvacDBMapping.DataPoint).order_by(hvacDBMapping.DataPoint._path).yield_per(1000):
 		print(instance.path, instance.point)
 
 	now = datetime.datetime.now()
@@ -144,7 +121,7 @@ def main():
 		session.commit()
 		print("writing of object: success")
 	except Exception as e:
-		print(traceback.format.exc())
+		print(traceback.format_exc())
 		print("writing of object: error")
 		return False
 	finally:
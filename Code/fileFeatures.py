@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import tempfile
+import warnings
+import threading
+import collections
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+#The statistics of DataFrame.describe(), in its order
+STATISTICS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+#Features of the files already summarized, by absolute path, with the mtime and size they had
+FEATURE_CACHE = os.path.join(os.path.expanduser('~'), '.hvac', 'features.json')
+CACHE_VERSION = 1
+
+FileFeatures = collections.namedtuple('FileFeatures', ['date', 'columns', 'values'])
+FileFeatures.__doc__ = """Summary of one daily csv file: the date of its first row, its numeric columns and the STATISTICS
+of every column, column after column"""
+
+
+def readTrendCsv(filename):
+	"""Read a daily trend csv, either written by trendWriters (a Time column then one column per path) or by the old
+	zonepull whose header is a python list"""
+
+	try:
+		df = pd.read_csv(filename)
+	except pd.errors.EmptyDataError:
+		return pd.DataFrame()
+
+	#files written by trendWriters have a proper header, the time column is the index, a file with the time column
+	#only is indexed by it too
+	if len(df.columns) < 2 or not str(df.columns.values[1]).startswith("["):
+		return df.set_index(df.columns.values[0])
+
+	#drop the temperature header, since it is the index pandas will use for the dataframe.
+	new_headers = df.columns.values.tolist()
+	new_headers = new_headers[1:]
+
+	#create the new dataframe with the appropriate headers
+	df = df.drop(new_headers[len(new_headers) - 1], axis=1)
+
+	#Replace the old headers by the new headers
+	new_headers[0] = new_headers[0].replace("[", "")
+	new_headers[len(new_headers) - 1] = new_headers[len(new_headers) - 1].replace("]", "")
+
+	for i in range(len(new_headers)):
+		new_headers[i] = new_headers[i].replace("'", "")
+
+	df.columns = new_headers
+
+	return df
+
+def summarize(values):
+	"""STATISTICS of every column of a 2D float array, NaN are skipped like describe() does. Returns a (statistics x columns) array"""
+
+	values = np.asarray(values, dtype = np.float64)
+	count = np.sum(~np.isnan(values), axis = 0)
+
+	#Without values the count is 0 and the rest NaN, np.nanpercentile would drop the statistics axis of an empty array
+	if values.size == 0:
+		return np.vstack([count, np.full((len(STATISTICS) - 1, values.shape[1]), np.nan)])
+
+	#All NaN columns give NaN statistics, as in describe(), without the warnings
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore', RuntimeWarning)
+		quartiles = np.nanpercentile(values, [0, 25, 50, 75, 100], axis = 0)
+		mean = np.nanmean(values, axis = 0)
+		std = np.nanstd(values, axis = 0, ddof = 1) if len(values) > 1 else np.full(values.shape[1], np.nan)
+
+	std[count < 2] = np.nan
+
+	return np.vstack([count, mean, std, quartiles])
+
+def fileFeatures(filepath):
+	"""Read a file once and summarize its numeric columns. A file without rows has no date and no features."""
+
+	df = readTrendCsv(filepath)
+
+	if len(df.index) == 0:
+		return FileFeatures(None, [], [])
+
+	numeric = df.select_dtypes(include = [np.number])
+
+	return FileFeatures(str(df.index.values[0]).split()[0], [str(column) for column in numeric.columns],
+		summarize(numeric.values).T.ravel().tolist())
+
+
+class FeatureCache(object):
+	"""FileFeatures of every file summarized before, valid while its mtime and size do not change, persisted in a JSON file"""
+
+	def __init__(self, filepath):
+
+		self._filepath = filepath
+		self._entries = {}
+		self._lock = threading.Lock()
+
+		if filepath and os.path.exists(filepath):
+			with open(filepath, 'r') as cacheFile:
+				cached = json.load(cacheFile)
+			if cached.get('version') == CACHE_VERSION:
+				self._entries = cached['files']
+
+	def __len__(self):
+		return len(self._entries)
+
+	@staticmethod
+	def signature(filepath):
+		"""(mtime in ns, size) of a file"""
+
+		status = os.stat(filepath)
+		return [status.st_mtime_ns, status.st_size]
+
+	def get(self, filepath, signature):
+		"""Cached features of the file, None when it was never summarized or changed since"""
+
+		entry = self._entries.get(os.path.abspath(filepath))
+
+		if entry is None or entry['signature'] != signature:
+			return None
+
+		return FileFeatures(entry['date'], entry['columns'], [np.nan if value is None else value for value in entry['values']])
+
+	def put(self, filepath, signature, features):
+
+		with self._lock:
+			self._entries[os.path.abspath(filepath)] = {'signature': signature, 'date': features.date, 'columns': features.columns,
+				'values': [None if value != value else value for value in features.values]} #JSON has no NaN
+
+	def save(self):
+		"""Write the cache atomically so a crash never leaves a truncated file"""
+
+		if not self._filepath:
+			return
+
+		with self._lock:
+			cached = {'version': CACHE_VERSION, 'files': dict(self._entries)}
+
+		cacheDir = os.path.dirname(self._filepath)
+		if cacheDir and not os.path.exists(cacheDir):
+			os.makedirs(cacheDir)
+
+		#A temporary file of its own, two processes saving at once must not write into the same one
+		descriptor, tmpPath = tempfile.mkstemp(prefix = os.path.basename(self._filepath), suffix = '.tmp', dir = cacheDir or None)
+
+		try:
+			with os.fdopen(descriptor, 'w') as cacheFile:
+				json.dump(cached, cacheFile)
+
+			os.replace(tmpPath, self._filepath)
+		except BaseException:
+			os.remove(tmpPath)
+			raise
+
+
+def extractFeatures(filepaths, cachePath = FEATURE_CACHE, maxWorkers = None):
+	"""FileFeatures of every file, in order. Files whose mtime and size match the cache are not read again, the others are
+	summarized in parallel by a process pool (maxWorkers processes, the number of CPUs by default) and added to the cache.
+	cachePath None disables the cache."""
+
+	cache = FeatureCache(cachePath)
+	signatures = [FeatureCache.signature(filepath) for filepath in filepaths]
+	features = [cache.get(filepath, signature) for filepath, signature in zip(filepaths, signatures)]
+	missing = [index for index, found in enumerate(features) if found is None]
+
+	if not missing:
+		return features
+
+	workers = min(maxWorkers or os.cpu_count() or 1, len(missing))
+
+	if workers > 1:
+		#A few chunks per worker, daily files are small and one task per file is dominated by the inter-process overhead
+		with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+			computed = list(executor.map(fileFeatures, [filepaths[index] for index in missing], chunksize = max(1, len(missing)//(4*workers))))
+	else:
+		computed = [fileFeatures(filepaths[index]) for index in missing]
+
+	for index, summary in zip(missing, computed):
+		features[index] = summary
+		cache.put(filepaths[index], signatures[index], summary)
+
+	cache.save()
+
+	return features
+
+def featureFrame(features):
+	"""DataFrame with one column per date and one row per '<column>_<statistic>', the layout clustering_example works on.
+	A date seen twice keeps its last file, files without rows are left out."""
+
+	byDate = collections.OrderedDict((summary.date, summary) for summary in features if summary.date is not None)
+	names = lambda summary: [column.replace(" ", "") + '_' + statistic for column in summary.columns for statistic in STATISTICS]
+
+	first = next(iter(byDate.values()), None)
+
+	if first is None:
+		return pd.DataFrame()
+
+	if all(summary.columns == first.columns for summary in byDate.values()):
+		return pd.DataFrame(np.array([summary.values for summary in byDate.values()]).T, index = names(first), columns = list(byDate))
+
+	#Files with different columns are aligned on the names
+	return pd.DataFrame(collections.OrderedDict((date, pd.Series(summary.values, index = names(summary))) for date, summary in byDate.items()))
+
+
+def benchmark(numDays = 365, numColumns = 20, directory = None):
+	"""Summarize a year of daily files of one control program: describe() per file, then extractFeatures cold and with the cache"""
+
+	import shutil
+	import tempfile
+	import trendWriters
+
+	directory = directory or tempfile.mkdtemp()
+	start = int(np.datetime64('2017-01-01T00:00:00').astype(np.int64))
+	paths = ['path%d' % column for column in range(numColumns)]
+	writer = trendWriters.CsvTrendWriter(directory, daily = True)
+
+	for day in range(numDays):
+		slots = start + day*86400 + 300*np.arange(288)
+		writer.write('cprog', slots, paths, np.random.rand(len(slots), numColumns))
+
+	writer.close()
+
+	filepaths = sorted(os.path.join(directory, 'cprog', name) for name in os.listdir(os.path.join(directory, 'cprog')))
+	cachePath = os.path.join(directory, 'features.json')
+
+	try:
+		begin = time.time()
+		described = {}
+		for filepath in filepaths:
+			df = readTrendCsv(filepath)
+			described[df.index.values[0].split()[0]] = df.describe()
+		describeTime = time.time() - begin
+
+		begin = time.time()
+		frame = featureFrame(extractFeatures(filepaths, cachePath))
+		coldTime = time.time() - begin
+
+		os.utime(filepaths[-1]) #one new day
+		begin = time.time()
+		cached = featureFrame(extractFeatures(filepaths, cachePath))
+		warmTime = time.time() - begin
+
+		date = sorted(described)[0]
+		expected = described[date]
+		assert np.allclose([frame[date][path + '_' + statistic] for path in paths for statistic in STATISTICS],
+			[expected[path][statistic] for path in paths for statistic in STATISTICS])
+		assert frame.equals(cached)
+
+		print("%d files: describe() %.2f s, one pass in a process pool %.2f s, cached with one new day %.2f s" % (len(filepaths),
+			describeTime, coldTime, warmTime))
+	finally:
+		shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	benchmark()
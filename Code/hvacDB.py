@@ -0,0 +1,151 @@
+import os
+import threading
+import contextlib
+import configparser
+
+import sqlalchemy
+from sqlalchemy.engine import URL
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import StaticPool
+
+#Connection settings are read from this file, then from HVAC_DB_<SETTING> environment variables, e.g. HVAC_DB_PASSWORD
+CONFIG_PATH = os.path.join(os.path.expanduser('~'), '.hvac', 'db.ini')
+
+DEFAULTS = {
+	'driver': 'mysql+mysqldb',
+	'host': 'localhost',
+	'port': '3306',
+	'user': 'dlaredorazo',
+	'password': '',
+	'database': 'HVAC',
+	'pool_size': '8', #connections kept open, enough for the pull workers and a loader
+	'max_overflow': '4',
+	'pool_timeout': '30',
+	'pool_recycle': '3600', #below MySQL's wait_timeout so idle connections are replaced before the server drops them
+	'local_infile': '0', #1 for readingLoader.loadBlockInfile
+}
+
+#'memory' is an SQLite database in memory with the schema created, shared by every session of the process, for tests
+MEMORY_PROFILE = 'memory'
+
+_engines = {}
+_sessionFactories = {}
+_scopedSessions = {}
+_lock = threading.Lock()
+
+
+def readConfig(profile = 'default', configPath = CONFIG_PATH, **overrides):
+	"""Settings of a profile: DEFAULTS, then the [profile] section of the config file, then the environment, then overrides"""
+
+	config = dict(DEFAULTS)
+	parser = configparser.ConfigParser()
+
+	if configPath and os.path.exists(configPath):
+		parser.read(configPath)
+		if parser.has_section(profile):
+			config.update(parser.items(profile))
+
+	for key in DEFAULTS:
+		value = os.environ.get('HVAC_DB_' + key.upper())
+		if value is not None:
+			config[key] = value
+
+	config.update((key, str(value)) for key, value in overrides.items())
+
+	return config
+
+def databaseUrl(config):
+	"""URL of the configured database, the password is escaped so characters like '@' are safe"""
+
+	return URL.create(config['driver'], username = config['user'], password = config['password'] or None, host = config['host'],
+		port = int(config['port']) if config['port'] else None, database = config['database'])
+
+def createEngine(profile = 'default', configPath = CONFIG_PATH, **overrides):
+	"""Build a new engine for a profile. MySQL engines get a QueuePool that pings connections before handing them out
+	and recycles them before the server times them out."""
+
+	if profile == MEMORY_PROFILE:
+		engine = sqlalchemy.create_engine('sqlite://', poolclass = StaticPool, connect_args = {'check_same_thread': False})
+		createSchema(engine)
+		return engine
+
+	config = readConfig(profile, configPath, **overrides)
+	connectArgs = {'local_infile': 1} if config['local_infile'] == '1' else {}
+
+	return sqlalchemy.create_engine(databaseUrl(config), pool_size = int(config['pool_size']), max_overflow = int(config['max_overflow']),
+		pool_timeout = int(config['pool_timeout']), pool_recycle = int(config['pool_recycle']), pool_pre_ping = True, connect_args = connectArgs)
+
+def createSchema(engine):
+	"""Create the missing tables of the schema, including the rollup and comfort tables, which are only added to
+	hvacDBMapping.Base.metadata when the modules defining them are imported"""
+
+	import hvacDBMapping
+	import readingRollups
+	import thermafuserComfort
+
+	hvacDBMapping.Base.metadata.create_all(engine)
+
+def getEngine(profile = 'default', **overrides):
+	"""Engine of a profile, created once per process and shared by every script and thread"""
+
+	key = (profile,) + tuple(sorted(overrides.items()))
+
+	with _lock:
+		if key not in _engines:
+			_engines[key] = createEngine(profile, **overrides)
+
+		return _engines[key]
+
+def getSessionFactory(profile = 'default', **overrides):
+	"""sessionmaker bound to the shared engine of a profile"""
+
+	key = (profile,) + tuple(sorted(overrides.items()))
+	engine = getEngine(profile, **overrides)
+
+	with _lock:
+		if key not in _sessionFactories:
+			_sessionFactories[key] = sessionmaker(bind = engine)
+
+		return _sessionFactories[key]
+
+def getScopedSession(profile = 'default', **overrides):
+	"""Thread-local session registry for threaded pullers, every thread gets its own session from the shared pool.
+	Call .remove() when a thread is done with it."""
+
+	key = (profile,) + tuple(sorted(overrides.items()))
+	factory = getSessionFactory(profile, **overrides)
+
+	with _lock:
+		if key not in _scopedSessions:
+			_scopedSessions[key] = scoped_session(factory)
+
+		return _scopedSessions[key]
+
+@contextlib.contextmanager
+def session(profile = 'default', **overrides):
+	"""Session that commits when the block ends, rolls back on error and always gives its connection back to the pool"""
+
+	current = getSessionFactory(profile, **overrides)()
+
+	try:
+		yield current
+		current.commit()
+	except Exception:
+		current.rollback()
+		raise
+	finally:
+		current.close()
+
+def disposeEngines():
+	"""Close every pooled connection, e.g. after forking worker processes"""
+
+	with _lock:
+		for registry in _scopedSessions.values():
+			registry.remove()
+
+		for engine in _engines.values():
+			engine.dispose()
+
+		_engines.clear()
+		_sessionFactories.clear()
+		_scopedSessions.clear()
@@ -103,6 +103,74 @@ class DataPoint(Base):
 		% (self._path, self._server, self._location, self._branch, self._subBranch, self._controlProgram, self._point, self._zone)
 
 
+class PathMapping(Base):
+	"""Class to map to the PathMappings table in the HVAC DB"""
+
+	__tablename__ = 'PathMappings'
+
+	_id = Column('Id', Integer, primary_key = True, autoincrement = True)
+	_path = Column('Path', String(255))
+	_componentType = Column('ComponentType', String(255))
+	_description = Column('Description', String(255))
+	_databaseMapping = Column('DatabaseMapping', String(255))
+
+	#Constructor
+
+	def __init__(self, path, componentType, description, databaseMapping, id = None):
+
+		self._id = id
+		self._path = path
+		self._componentType = componentType
+		self._description = description
+		self._databaseMapping = databaseMapping
+
+	#Properties
+
+	@property
+	def id(self):
+		return self._id
+
+	@id.setter
+	def id(self, value):
+		self._id = value
+
+	@property
+	def path(self):
+		return self._path
+
+	@path.setter
+	def path(self, value):
+		self._path = value
+
+	@property
+	def componentType(self):
+		return self._componentType
+
+	@componentType.setter
+	def componentType(self, value):
+		self._componentType = value
+
+	@property
+	def description(self):
+		return self._description
+
+	@description.setter
+	def description(self, value):
+		self._description = value
+
+	@property
+	def databaseMapping(self):
+		return self._databaseMapping
+
+	@databaseMapping.setter
+	def databaseMapping(self, value):
+		self._databaseMapping = value
+
+	def __str__(self):
+		return "<PathMapping(id = '%s', path = '%s', componentType = '%s', description = '%s', databaseMapping = '%s')>" \
+		% (self._id, self._path, self._componentType, self._description, self._databaseMapping)
+
+
 class AHU(Base):
 	"""Class to map to the Air_Handling_Unit table in the HVAC DB"""
 
@@ -209,8 +277,8 @@ class AHUReading(Base):
 
 	__tablename__ = 'Air_Handling_Unit_Reading'
 
-	_AHUNumber = Column('AHUNumber', String(255), ForeignKey("Air_Handling_Unit.AHUNumber"), primary_key = True)
-	_time_stamp = Column('Time_stamp', String(255), primary_key = True)
+	_AHUNumber = Column('AHUNumber', Integer, ForeignKey("Air_Handling_Unit.AHUNumber"), primary_key = True)
+	_time_stamp = Column('Time_stamp', DateTime, primary_key = True)
 	_zoneTemperature = Column('ZoneTemperature', Float)
 	_staticPressure = Column('StaticPressure', Float)
 	_returnAirTemperature = Column('ReturnAirTemperature', Float, nullable=True)
@@ -394,7 +462,7 @@ class AHUReading(Base):
 		return "<AHUReading(AHUNumber = '%s', Time_stamp = '%s', zoneTemperature = '%s', staticPressure = '%s', returnAirTemperature = '%s', supplyAirTemperature = '%s', \
 		exhaustAirTemperature = '%s', outsideAirTemperature = '%s',smokeDetector = '%s',outsideAirCo2 = '%s', returnAirCo2 = '%s',spare = '%s',hiStatic = '%s', \
 		ductstaticPressure = '%s',mixedAirTemperature = '%s', OSACFM = '%s', ahu = '%s')>" \
-		% (self._AHUNumber, self._Time_stamp, self._zoneTemperature, self._staticPressure, self._returnAirTemperature, self._supplyAirTemperature, \
+		% (self._AHUNumber, self._time_stamp, self._zoneTemperature, self._staticPressure, self._returnAirTemperature, self._supplyAirTemperature, \
 		 self._exhaustAirTemperature, self._outsideAirTemperature,self._smokeDetector,self._outsideAirCo2,self._returnAirCo2, self._spare, self._hiStatic, \
 		 self._ductstaticPressure, self._mixedAirTemperature, self._OSACFM, str(self._ahu))
 
@@ -1431,15 +1499,15 @@ class VAVReading(Base):
 
 	__tablename__ = 'Variable_Air_Volume_Reading'
 
-	_VAVId = Column('VAVId', String(255), ForeignKey("Variable_Air_Volume.VAVId"), primary_key = True)
-	_time_stamp = Column('Time_stamp', String(255), primary_key = True)
-	_VAVName = Column('VAVName', Float)
+	_VAVId = Column('VAVId', Integer, ForeignKey("Variable_Air_Volume.VAVId"), primary_key = True)
+	_time_stamp = Column('Time_stamp', DateTime, primary_key = True)
+	_VAVName = Column('VAVName', String(255))
 	_flowInput = Column('FlowInput', Float)
 	_miscSpareInput = Column('MiscSpareInput', Float, nullable=True)
 	_zoneTemperature = Column('ZoneTemperature', Float, nullable=True)
 	_dischargeTemperature = Column('DischargeTemperature', Float, nullable=True)
 	_condensateDetector = Column('CondensateDetector', Boolean, nullable=True)
-	_ductStaticPressure = Column('DuctStaticPressure', String(255), nullable=True)
+	_ductStaticPressure = Column('DuctStaticPressure', Float, nullable=True)
 	_zoneCO2 = Column('ZoneCO2', Float, nullable=True)
 	_damperPosition = Column('DamperPosition', Float, nullable=True)
 
@@ -0,0 +1,115 @@
+import os
+import csv
+import collections
+from datetime import datetime, timedelta
+
+import trendPull
+import trendClient
+import trendDecode
+import trendState
+import pointInventory
+import inventoryLoader
+
+#Settings, change these before running
+SERVER = "10.20.0.47"
+ZONE_FILE = "../csv_files/Zone4.csv"
+ZONE = "4"
+INVENTORY_SNAPSHOT = "hvac_data/Zone4/inventory.snapshot" #Rebuilt from ZONE_FILE whenever that file changes
+STATE_FILE = "hvac_data/Zone4/state.json"
+OUTPUT_DIR = "hvac_data/Zone4"
+LOOKBACK = timedelta(1) #How far back to go for paths that were never fetched
+MAX_WORKERS = 8
+
+
+def readZonePaths(filepath, zone = ZONE, snapshotPath = INVENTORY_SNAPSHOT):
+	"""Map every path of the zone to its normalized control program. The inventory snapshot is used while it was built
+	from this very file, it is rebuilt from the csv when the file moved or changed."""
+
+	inventory = pointInventory.PointInventory.loadOrBuild(snapshotPath,
+		lambda: pointInventory.PointInventory.fromCsv([filepath], [zone]), [filepath])
+
+	points = collections.OrderedDict()
+
+	for point in inventory.select(zone = zone):
+		points[point.path] = inventoryLoader.normalizeControlProgram(point.controlProgram)
+
+	return points
+
+
+class CsvSampleSink(object):
+	"""Append new samples to one long format (Time, Path, Value) csv per control program"""
+
+	def __init__(self, directory):
+
+		self._directory = directory
+
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+
+	def write(self, request, epochs, values):
+
+		filepath = os.path.join(self._directory, request.controlProgram + '.csv')
+		isNew = not os.path.exists(filepath)
+
+		with open(filepath, 'a', newline = '') as csvfile:
+			writer = csv.writer(csvfile)
+
+			if isNew:
+				writer.writerow(['Time', 'Path', 'Value'])
+
+			writer.writerows((trendState.toDatetime(epoch), request.path, value) for epoch, value in zip(epochs, values))
+
+			#On disk before the mark that covers these samples is saved
+			csvfile.flush()
+			os.fsync(csvfile.fileno())
+
+
+def pullIncremental(puller, points, marks, now, sink, lookback = LOOKBACK):
+	"""Request only (last_seen, now] for every path and hand the new samples to the sink.
+	A mark is moved and saved right after the sink took the samples, and samples at or before the mark are dropped,
+	so running this again, also after a crash, does not write anything twice. Returns the number of new samples."""
+
+	requests = []
+
+	for path, controlProgram in points.items():
+		startTime = trendState.windowStart(marks, path, now, lookback)
+
+		if startTime < now:
+			requests.append(trendPull.TrendRequest(path, controlProgram, startTime, now))
+
+	total = 0
+
+	for result in puller.pull(requests):
+		request = result.request
+
+		if result.error is not None:
+			print("no data from path " + request.path + " after " + str(result.attempts) + " attempts: " + str(result.error))
+			continue
+
+		epochs, values = trendDecode.decodeTrendData(result.data)
+		epochs, values = trendState.newSamples(marks, request.path, epochs, values)
+
+		if len(epochs) > 0:
+			sink.write(request, epochs, values)
+			marks.update(request.path, epochs.max())
+			marks.save()
+			total += len(epochs)
+
+	return total
+
+
+def main():
+	"""Pull everything new since the last run for the paths of the zone file"""
+
+	now = datetime.now().replace(microsecond = 0)
+	points = readZonePaths(ZONE_FILE)
+	marks = trendState.HighWaterMarks(STATE_FILE)
+	puller = trendPull.TrendPuller(trendClient.trendClientFactory(SERVER, poolSize = MAX_WORKERS), maxWorkers = MAX_WORKERS)
+
+	total = pullIncremental(puller, points, marks, now, CsvSampleSink(OUTPUT_DIR))
+
+	print("%d new samples for %d paths up to %s" % (total, len(points), now))
+
+
+if __name__ == '__main__':
+	main()
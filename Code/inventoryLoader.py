@@ -0,0 +1,108 @@
+import re
+import csv
+import time
+
+from hvacDBMapping import DataPoint
+from readingLoader import LoadStats, upsertStatement
+
+CHUNK_SIZE = 1000
+CSV_COLUMNS = ['server', 'location', 'branch', 'sub_branch', 'control_program', 'point', 'path']
+
+#Sub branches the csvs also spell in lower case, other names are kept as they are
+SUB_BRANCH_NAMES = {'short bar': 'Short Bar', 'long bar': 'Long Bar'}
+
+_spacesRegex = re.compile(r'\s+')
+#'Engineering 315, Reception 315A VAV-3-35' -> 'VAV-3-35', floors can be B for the basement
+_boxNameRegex = re.compile(r'\b((?:VAV|SAV)-[0-9B]+-\d+)\s*$', flags = re.IGNORECASE)
+
+
+def normalizeText(value):
+	"""Strip and collapse the whitespace of a csv field, empty fields are None"""
+
+	value = _spacesRegex.sub(' ', value).strip()
+
+	return value if value else None
+
+def normalizeControlProgram(name):
+	"""VAV/SAV control programs come with the rooms they serve in front of the box name, keep only the box name"""
+
+	if name is None:
+		return None
+
+	match = _boxNameRegex.search(name)
+
+	return match.group(1).upper() if match else name
+
+def normalizeSubBranch(name):
+	"""'Short bar' -> 'Short Bar', only the names in SUB_BRANCH_NAMES are rewritten"""
+
+	if name is None:
+		return None
+
+	return SUB_BRANCH_NAMES.get(name.lower(), name)
+
+def normalizeRow(row, zone):
+	"""Turn a zone csv row into a DataPoints row keyed by DB column name, or None if it is not a DataPoint row"""
+
+	if len(row) != len(CSV_COLUMNS):
+		return None
+
+	server, location, branch, subBranch, controlProgram, point, path = [normalizeText(value) for value in row]
+
+	if path is None or not path.startswith('#'):
+		return None
+
+	return {'Path': path, 'Server': server, 'Location': location, 'Branch': branch,
+		'SubBranch': normalizeSubBranch(subBranch),
+		'ControlProgram': normalizeControlProgram(controlProgram), 'Point': point, 'Zone': str(zone)}
+
+def readZoneCsv(filepath, zone):
+	"""Stream the normalized DataPoints rows of a zone csv, skipping the header and malformed rows"""
+
+	with open(filepath, 'r', newline = '', encoding = 'utf-8', errors = 'replace') as csvfile:
+		for row in csv.reader(csvfile):
+			normalized = normalizeRow(row, zone)
+			if normalized is not None:
+				yield normalized
+
+def loadDataPoints(connection, rows, chunkSize = CHUNK_SIZE):
+	"""Upsert DataPoints rows in chunked executemany inserts, a path that is already stored gets its columns overwritten"""
+
+	begin = time.time()
+	table = DataPoint.__table__
+	valueColumns = [column.name for column in table.columns if not column.primary_key]
+	#The csv is the whole truth about a path, a field it leaves empty is emptied
+	stmt = upsertStatement(table, valueColumns, connection.dialect.name, coalesce = False)
+
+	count = 0
+	chunk = {}
+
+	for row in rows:
+		chunk[row['Path']] = row #a path repeated in the csv keeps its last row
+
+		if len(chunk) == chunkSize:
+			connection.execute(stmt, list(chunk.values()))
+			count += len(chunk)
+			chunk = {}
+
+	if chunk:
+		connection.execute(stmt, list(chunk.values()))
+		count += len(chunk)
+
+	return LoadStats(count, time.time() - begin)
+
+def loadZoneCsvs(engine, filepaths, zones, chunkSize = CHUNK_SIZE):
+	"""Refresh the DataPoints of the zone csvs in one transaction, zones gives the zone of each file.
+	Running it again over the same files leaves the table unchanged."""
+
+	rows = 0
+	begin = time.time()
+
+	with engine.begin() as connection:
+		for filepath, zone in zip(filepaths, zones):
+			rows += loadDataPoints(connection, readZoneCsv(filepath, zone), chunkSize).rows
+
+	stats = LoadStats(rows, time.time() - begin)
+	print("loaded DataPoints: " + str(stats))
+
+	return stats
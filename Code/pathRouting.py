@@ -0,0 +1,190 @@
+import re
+import time
+import collections
+import numpy as np
+
+import hvacDBMapping
+from hvacDBMapping import PathMapping
+from readingLoader import ReadingBlock
+
+EPOCH_BITS = 34 #Epoch seconds stay below 2**34 until the year 2514
+EPOCH_MASK = (1 << EPOCH_BITS) - 1
+
+Route = collections.namedtuple('Route', ['readingClass', 'componentId', 'column'])
+
+_insertRegex = re.compile(r'values\s*\(\s*"([^"]*)"\s*,\s*"([^"]*)"\s*,\s*"([^"]*)"\s*,\s*"([^"]*)"\s*\)', flags = re.IGNORECASE)
+
+
+def pathSuffix(path):
+	"""Point part of a DataPoint path, '#1c1a_thermafuser/m073' -> 'm073'"""
+
+	return path.rsplit('/', 1)[-1]
+
+def componentKey(path):
+	"""Control program part of a DataPoint path, '#1c1a_thermafuser/m073' -> '#1c1a_thermafuser'"""
+
+	return path.rsplit('/', 1)[0]
+
+def readMappingsSql(filepath):
+	"""Read the PathMappings insert statements of Zonemappings.sql without a database"""
+
+	mappings = []
+
+	with open(filepath, 'r') as sqlfile:
+		for line in sqlfile:
+			match = _insertRegex.search(line)
+			if match:
+				mappings.append(PathMapping(*match.groups()))
+
+	return mappings
+
+def loadMappings(session):
+	"""Read the PathMappings table"""
+
+	return session.query(PathMapping).all()
+
+def readingClasses():
+	"""Map every Reading table name to its mapped class"""
+
+	classes = {}
+
+	for mapper in hvacDBMapping.Base.registry.mappers:
+		table = mapper.class_.__table__
+		if table.name.endswith('_Reading'):
+			classes[table.name] = mapper.class_
+
+	return classes
+
+def resolveMapping(databaseMapping, classes):
+	"""Turn 'Thermafuser_Reading.AirflowFeedback' into (ThermafuserReading, 'AirflowFeedback').
+	Mappings that name the component table ('Heat_Exchanger_Coil.WaterTemperature') go to its Reading table."""
+
+	tableName, column = databaseMapping.split('.', 1)
+
+	readingClass = classes.get(tableName) or classes.get(tableName + '_Reading')
+
+	if readingClass is None or column not in readingClass.__table__.c:
+		raise ValueError("PathMapping " + databaseMapping + " does not name a Reading column")
+
+	return readingClass, column
+
+
+class RoutingTable(object):
+	"""Compiled routes from every DataPoint path to the (Reading class, component id, column) its samples go to"""
+
+	def __init__(self, routes):
+
+		self._routes = routes
+
+	@classmethod
+	def compile(cls, paths, mappings, componentIds):
+		"""Build the table once at startup.
+		componentIds maps the control program part of a path ('#1c1a_thermafuser') to the id of its component.
+		Paths without a mapping for their suffix or without a component id are left unrouted."""
+
+		classes = readingClasses()
+		bySuffix = {}
+
+		for mapping in mappings:
+			bySuffix[mapping.path] = resolveMapping(mapping.databaseMapping, classes)
+
+		routes = {}
+
+		for path in paths:
+			target = bySuffix.get(pathSuffix(path))
+			componentId = componentIds.get(componentKey(path))
+
+			if target is not None and componentId is not None:
+				routes[path] = Route(target[0], componentId, target[1])
+
+		return cls(routes)
+
+	def __len__(self):
+		return len(self._routes)
+
+	def __contains__(self, path):
+		return path in self._routes
+
+	def route(self, path):
+		"""Route of the path or None"""
+
+		return self._routes.get(path)
+
+	def pivot(self, samples):
+		"""Pivot (path, epochs, values) samples into one ReadingBlock per Reading class, with one row per
+		(component id, time stamp) and one column per routed point. Cells no point filled are NaN.
+		Returns the blocks and the number of samples that had no route."""
+
+		grouped = collections.defaultdict(lambda: collections.defaultdict(list))
+		unrouted = 0
+
+		for path, epochs, values in samples:
+			route = self._routes.get(path)
+
+			if route is None:
+				unrouted += len(epochs)
+				continue
+
+			grouped[route.readingClass][route.column].append((route.componentId, epochs, values))
+
+		blocks = []
+
+		for readingClass, columns in grouped.items():
+			ids = []
+			epochs = []
+
+			for pieces in columns.values():
+				for componentId, pieceEpochs, pieceValues in pieces:
+					ids.append(np.full(len(pieceEpochs), componentId, dtype = np.int64))
+					epochs.append(np.asarray(pieceEpochs, dtype = np.int64))
+
+			#Pack (component id, epoch) into one int64 so the unique is a plain 1-D sort
+			keys = (np.concatenate(ids) << EPOCH_BITS) | np.concatenate(epochs)
+			uniqueKeys, inverse = np.unique(keys, return_inverse = True)
+
+			pivoted = {}
+			offset = 0
+
+			for column, pieces in columns.items():
+				cells = np.full(len(uniqueKeys), np.nan)
+
+				for componentId, pieceEpochs, pieceValues in pieces:
+					count = len(pieceEpochs)
+					cells[inverse[offset:offset + count]] = pieceValues
+					offset += count
+
+				pivoted[column] = cells
+
+			blocks.append(ReadingBlock(readingClass, uniqueKeys >> EPOCH_BITS, uniqueKeys & EPOCH_MASK, pivoted))
+
+		return blocks, unrouted
+
+
+def benchmark(numComponents = 1000, days = 7):
+	"""Route and pivot a week of 5 minute samples for numComponents thermafusers"""
+
+	mappings = [PathMapping(suffix, "Thermafuser Sensor", column, "Thermafuser_Reading." + column) for suffix, column in
+		[("m073", "AirflowFeedback"), ("m135", "OccupiedCoolingSetpoint"), ("m134", "OccupiedHeatingSetpoint"),
+		("m078", "RoomOccupied"), ("m190", "ZoneTemperature"), ("m186", "SupplyAir")]]
+
+	componentIds = dict(('#tf_%d' % i, i + 1) for i in range(numComponents))
+	paths = [key + '/' + mapping.path for key in componentIds for mapping in mappings]
+
+	begin = time.time()
+	table = RoutingTable.compile(paths, mappings, componentIds)
+	compileTime = time.time() - begin
+
+	epochs = 1488326400 + 300*np.arange(days*288, dtype = np.int64)
+	samples = [(path, epochs, np.random.rand(len(epochs))) for path in paths]
+
+	begin = time.time()
+	blocks, unrouted = table.pivot(samples)
+	pivotTime = time.time() - begin
+
+	total = len(paths)*len(epochs)
+	print("compiled %d routes in %.3f s, pivoted %d samples into %d rows in %.2f s (%.1f M samples/min)"
+		% (len(table), compileTime, total, len(blocks[0].ids), pivotTime, total/pivotTime*60/1e6))
+
+
+if __name__ == '__main__':
+	benchmark()
@@ -1,109 +1,481 @@
-import math
+import time
+import threading
+import collections
 import numpy
-import matplotlib.pyplot as plt
 
+#PMV/PPD thermal comfort indices of ISO 7730. Every function takes scalars or NumPy arrays, which are broadcast together.
+#Units: temperatures in C, relative humidity in %, air speed in m/s, clothing insulation Icl in m2K/W, metabolic rate M
+#and external work W in W/m2.
 
+CLO = 0.155 #m2K/W of 1 clo, e.g. Icl = 0.5*CLO for summer clothing
+MET = 58.15 #W/m2 of 1 met, e.g. M = 1.1*MET for office work
 
-def surfaceTemperatureClothingComputation(M, W, Icl, fcl, Tai, hc, Tcl):
+TOLERANCE = 1.5e-4 #on Tcl/100, i.e. 0.015 C
+MAX_ITERATIONS = 150
+NEWTON_TOLERANCE = 1e-6 #C, on the Newton step
+NEWTON_MAX_ITERATIONS = 20
+CHUNK_SIZE = 65536 #samples per pass, small enough for the temporaries to stay in the CPU cache
 
-	tolerance = 10**(-2)
-	iterations = 0
-	maxIterations = 100
+#Interpolation grids, one per (Icl, M, W) profile, the least recently used ones are dropped past GRID_CACHE_SIZE
+GRID_CACHE_SIZE = 8
+GRID_TOLERANCE = 0.02 #largest PMV error of the interpolation accepted by check(), a grid takes 13 MB
 
-	#Run until convergence or 1000 iterations are done
-	while (TclCurrent - TclPrevious > tolerance or iterations < maxIterations):
-		
-		TclCurrent = 35.7 - 0.028 * (M - W) - Icl * ( 3.96 * 10**(-8) * fcl
-			* ( math.pow(Tcl + 273, 4) - math.pow(Tr + 273, 4) )
-			- fcl * hc * (TclPrevious - Tai) )
+
+def ratioBodySurfaceAreaCoveredComputation(Icl):
+	"""Clothing area factor fcl"""
+
+	Icl = numpy.asarray(Icl, dtype = numpy.float64)
+
+	return numpy.where(Icl <= 0.078, 1.0 + 1.29*Icl, 1.05 + 0.645*Icl)
 
 def convectiveHeatTransferCoefficientComputation(Va, Tcl, Tai):
+	"""hc, the larger of the natural (2.38|Tcl - Tai|^0.25) and forced (12.1 sqrt(Va)) convection coefficients"""
 
-	hc1 = 2.38 * math.pow(Tcl - Tai, 0.25)
-	hc = 12.1 * math.sqrt(Va)
+	return numpy.maximum(2.38*numpy.abs(numpy.subtract(Tcl, Tai))**0.25, 12.1*numpy.sqrt(Va))
 
-	if hc1 > hc:
-		hc = hc1
+def waterVaporPressure(Hai, Tai):
+	"""Partial water vapour pressure Pa in Pa from the relative humidity in % and the air temperature"""
 
-	return hc
+	return 10*numpy.asarray(Hai, dtype = numpy.float64)*numpy.exp(16.6536 - 4030.183/(numpy.asarray(Tai, dtype = numpy.float64) + 235))
 
-def ratioBodySurfaceAreaCoveredComputation(Icl):
+def meanRadiantTemperatureComputation(Tg, Tai, Va, epsilon = 0.95, diameter = 0.15):
+	"""Mean radiant temperature from a globe thermometer (ISO 7726, forced convection), diameter in m"""
 
-	fcl = 0
+	temp = (numpy.asarray(Tg, dtype = numpy.float64) + 273)**4 + 1.1e8*numpy.asarray(Va, dtype = numpy.float64)**0.6*numpy.subtract(Tg, Tai)/(epsilon*diameter**0.4)
 
-	if Icl <= 0.0708:
-		fcl = 1 + 1.129*Icl
-	else:
-		fcl = 1.05 + 0.645*Icl
+	return temp**0.25 - 273
 
-	return fcl
+def surfaceTemperatureClothingComputation(M, W, Icl, fcl, Tai, Tr, Va, tolerance = TOLERANCE, maxIterations = MAX_ITERATIONS):
+	"""Clothing surface temperature Tcl of every sample, solving
+		Tcl = 35.7 - 0.028(M - W) - Icl(3.96e-8 fcl((Tcl + 273)^4 - (Tr + 273)^4) + fcl hc (Tcl - Tai))
+	with the damped fixed-point iteration of ISO 7730 annex D, on all the samples at once.
+	Samples leave the iteration as they converge, those still moving after maxIterations are NaN."""
 
-def TclComputation():
+	arrays = numpy.broadcast_arrays(*[numpy.asarray(value, dtype = numpy.float64) for value in (M, W, Icl, fcl, Tai, Tr, Va)])
+	shape = arrays[0].shape
+	M, W, Icl, fcl, Tai, Tr, Va = [numpy.ravel(array) for array in arrays]
 
-	TclArray = numpy.linspace(22, 40, num=1000)
-	Va = 0.1
-	Tai = 22
-	index = 0
-	M = 70
-	W = 0
-	Icl = 1
-	fcl = ratioBodySurfaceAreaCoveredComputation(Icl)
-	Tr = 22
-	gtArray = numpy.zeros(TclArray.shape)
+	Taa = Tai + 273
+	hcf = 12.1*numpy.sqrt(Va)
+	p1 = Icl*fcl
+	p2 = p1*3.96
+	p3 = p1*100
+	p4 = p1*Taa
+	p5 = 308.7 - 0.028*(M - W) + p2*((Tr + 273)/100)**4
 
-	for Tcl in TclArray:
-		hc = convectiveHeatTransferCoefficientComputation(Va, Tcl, Tai)
-		gtArray[index] = Tcl - 35.7 - 0.028 * (M - W) - Icl * ( 3.96 * 10**(-8) * fcl
-				* ( math.pow(Tcl + 273, 4) - math.pow(Tr + 273, 4) )
-				- fcl * hc * (Tcl - Tai) )
-		index += 1
+	#Tcl/100 in K, starting from a linear estimate
+	xn = (Taa + (35.5 - Tai)/(3.5*Icl + 0.1))/100
+	xf = xn*2
+	result = numpy.full(xn.shape, numpy.nan)
 
-	return TclArray, gtArray
+	active = numpy.arange(xn.size)
 
-	#print(gtArray)
+	for iteration in range(maxIterations):
+		converged = numpy.abs(xn - xf) <= tolerance
+		result[active[converged]] = xn[converged]
 
-def meanRadiantTemperatureComputation(Tg, Tai, Va, epsilon, diameter):
+		if converged.all():
+			break
 
-	temp = math.pow(Tg + 273, 4) + (1.10 * 10**8 * math.pow(Va, 0.6) * (Tg - Tai) )/(epsilon * pow(diameter, 0.4))
+		#Keep only the samples still iterating
+		if converged.any():
+			keep = ~converged
+			active = active[keep]
+			xn, xf, hcf, p2, p3, p4, p5, Taa = xn[keep], xf[keep], hcf[keep], p2[keep], p3[keep], p4[keep], p5[keep], Taa[keep]
 
-	Tr = math.pow(temp, 0.25) - 273
+		xf = (xf + xn)/2
+		hc = numpy.maximum(hcf, 2.38*numpy.abs(100*xf - Taa)**0.25)
+		xn = (p5 + p4*hc - p2*xf**4)/(100 + p3*hc)
 
-	return Tr
+	return (result*100 - 273).reshape(shape)
 
-def waterVaporPressure(Hai, Tai):
+def TclResidual(Tcl, M, W, Icl, fcl, Tai, Tr, Va):
+	"""Residual of the Tcl heat balance, Tcl - 35.7 + 0.028(M - W) + Icl(3.96e-8 fcl((Tcl + 273)^4 - (Tr + 273)^4) + fcl hc (Tcl - Tai)),
+	zero at the clothing surface temperature"""
+
+	hc = convectiveHeatTransferCoefficientComputation(Va, Tcl, Tai)
+
+	return Tcl - 35.7 + 0.028*(M - W) + Icl*fcl*(3.96e-8*((Tcl + 273)**4 - (Tr + 273)**4) + hc*(Tcl - Tai))
+
+def TclResidualDerivative(Tcl, Icl, fcl, Tai, Va):
+	"""d(TclResidual)/dTcl. Where natural convection wins hc(Tcl - Tai) = 2.38|Tcl - Tai|^1.25 sign(Tcl - Tai), whose
+	derivative is 1.25*2.38|Tcl - Tai|^0.25, otherwise hc = 12.1 sqrt(Va) is constant. The derivative is at least 1,
+	the residual is increasing and has a single root."""
+
+	difference = numpy.abs(numpy.subtract(Tcl, Tai))
+	natural = 2.38*difference**0.25
+	forced = 12.1*numpy.sqrt(Va)
+	convection = numpy.where(natural > forced, 1.25*natural, forced)
+
+	return 1 + Icl*fcl*(4*3.96e-8*(numpy.asarray(Tcl) + 273)**3 + convection)
+
+def surfaceTemperatureClothingNewton(M, W, Icl, fcl, Tai, Tr, Va, tolerance = NEWTON_TOLERANCE, maxIterations = NEWTON_MAX_ITERATIONS):
+	"""Clothing surface temperature of every sample by Newton-Raphson on TclResidual with its analytic derivative,
+	starting from the linear estimate of ISO 7730. All the inputs are broadcast together and solved at once, samples
+	leave the iteration when their step is below tolerance. Returns (Tcl, iterations), both in the broadcast shape,
+	Tcl is NaN where it did not converge in maxIterations."""
 
-	exponent = 16.6536 - 4030.183/(Tai + 235)
-	Pa = 10 * Hai * math.exp(exponent)
+	arrays = numpy.broadcast_arrays(*[numpy.asarray(value, dtype = numpy.float64) for value in (M, W, Icl, fcl, Tai, Tr, Va)])
+	shape = arrays[0].shape
+	M, W, Icl, fcl, Tai, Tr, Va = [numpy.ravel(array) for array in arrays]
 
+	Tcl = Tai + (35.5 - Tai)/(3.5*Icl + 0.1)
+	result = numpy.full(Tcl.shape, numpy.nan)
+	iterations = numpy.full(Tcl.shape, maxIterations, dtype = numpy.int64)
 
-def pmvComputation(Tai, Tg, Hai, Va, Icl, M):
+	#TclResidual and TclResidualDerivative sharing their powers, with the per sample constants taken out of the loop
+	p1 = Icl*fcl
+	constant = 0.028*(M - W) - 35.7 - p1*3.96e-8*(Tr + 273)**4
+	forced = 12.1*numpy.sqrt(Va)
 
-	epsilon = 1
-	diameter = 1
-	#hc = 
+	active = numpy.arange(Tcl.size)
+
+	for iteration in range(1, maxIterations + 1):
+		difference = Tcl - Tai
+		natural = 2.38*numpy.sqrt(numpy.sqrt(numpy.abs(difference)))
+		useNatural = natural > forced
+		Tk = Tcl + 273
+		Tk3 = Tk*Tk*Tk
+
+		residual = Tcl + constant + p1*(3.96e-8*Tk3*Tk + numpy.where(useNatural, natural, forced)*difference)
+		derivative = 1 + p1*(4*3.96e-8*Tk3 + numpy.where(useNatural, 1.25*natural, forced))
+
+		step = residual/derivative
+		Tcl = Tcl - step
+
+		converged = numpy.abs(step) <= tolerance
+		result[active[converged]] = Tcl[converged]
+		iterations[active[converged]] = iteration
+
+		if converged.all():
+			break
+
+		#Keep only the samples still iterating
+		if converged.any():
+			keep = ~converged
+			active = active[keep]
+			Tcl, Tai, p1, constant, forced = Tcl[keep], Tai[keep], p1[keep], constant[keep], forced[keep]
+
+	return result.reshape(shape), iterations.reshape(shape)
+
+def _pmvPpd(Tai, Tr, Hai, Va, Icl, M, W):
 
 	Pa = waterVaporPressure(Hai, Tai)
 	fcl = ratioBodySurfaceAreaCoveredComputation(Icl)
-	Tcl = surfaceTemperatureClothingComputation(M, W, Icl, fcl, Tai, hc, Tcl)
-	Tr = meanRadiantTemperatureComputation(Tg, Tai, Va, epsilon, diameter)
-	
-	pmv = (0.303 * math.exp(-0.036*M) + 0.028) * ( (M - W) 
-		- 3.05 * 10**(-3) * (5733 - 6.99 * (M - W) - Pa)
-		- 0.42 * ( (M - W) - 58.15 ) - 1.7 * 10**(-5) * M * (5867 - Pa)
-		- 0.0014 * M * (34 - Tai) - 3.96 * 10**(-8) * fcl 
-		* ( math.pow(Tcl + 273, 4) - math.pow(Tr + 273, 4) )
-		- fcl * hc * (Tcl - Tai) )
+	Tcl = surfaceTemperatureClothingNewton(M, W, Icl, fcl, Tai, Tr, Va)[0]
+	hc = convectiveHeatTransferCoefficientComputation(Va, Tcl, Tai)
+	MW = M - W
+
+	pmv = (0.303*numpy.exp(-0.036*M) + 0.028)*(MW
+		- 3.05e-3*(5733 - 6.99*MW - Pa)
+		- 0.42*(MW - 58.15)
+		- 1.7e-5*M*(5867 - Pa)
+		- 0.0014*M*(34 - Tai)
+		- 3.96e-8*fcl*((Tcl + 273)**4 - (Tr + 273)**4)
+		- fcl*hc*(Tcl - Tai))
+
+	return pmv, ppdComputation(pmv)
+
+def ppdComputation(pmv):
+	"""Predicted percentage of dissatisfied for a PMV"""
+
+	pmv = numpy.asarray(pmv, dtype = numpy.float64)
+
+	return 100 - 95*numpy.exp(-0.03353*pmv**4 - 0.2179*pmv**2)
+
+def pmvPpdComputation(Tai, Tr, Hai, Va, Icl, M, W = 0, chunkSize = CHUNK_SIZE):
+	"""PMV and PPD arrays for every sample, inputs broadcast together (e.g. arrays of readings with scalar Icl and M).
+	Samples whose Tcl does not converge, or with a NaN input, get NaN."""
+
+	arrays = numpy.broadcast_arrays(*[numpy.asarray(value, dtype = numpy.float64) for value in (Tai, Tr, Hai, Va, Icl, M, W)])
+	shape = arrays[0].shape
+	flat = [numpy.ravel(array) for array in arrays]
+
+	pmv = numpy.empty(flat[0].size)
+	ppd = numpy.empty(flat[0].size)
+
+	for first in range(0, flat[0].size, chunkSize):
+		chunk = slice(first, first + chunkSize)
+		pmv[chunk], ppd[chunk] = _pmvPpd(*[array[chunk] for array in flat])
+
+	return pmv.reshape(shape), ppd.reshape(shape)
+
+def pmvComputation(Tai, Tr, Hai, Va, Icl, M, W = 0):
+	"""PMV only, see pmvPpdComputation"""
+
+	return pmvPpdComputation(Tai, Tr, Hai, Va, Icl, M, W)[0]
+
+
+def TclComputation(Tai = 22, Tr = 22, Va = 0.1, Icl = CLO, M = 70, W = 0, TclArray = None):
+	"""Residual of the Tcl heat balance over a range of Tcl, its zero is the clothing surface temperature"""
+
+	if TclArray is None:
+		TclArray = numpy.linspace(22, 40, num = 1000)
+
+	fcl = ratioBodySurfaceAreaCoveredComputation(Icl)
+
+	return TclArray, TclResidual(TclArray, M, W, Icl, fcl, Tai, Tr, Va)
+
+def TclBruteForce(Tai, Tr, Va, Icl, M, W = 0, TclArray = None):
+	"""Tcl of one sample from the sign change of the residual over TclArray, evaluated one Tcl at a time,
+	linearly interpolated. The reference the solvers are checked against."""
+
+	if TclArray is None:
+		TclArray = numpy.linspace(22, 40, num = 1000)
+
+	fcl = float(ratioBodySurfaceAreaCoveredComputation(Icl))
+	residuals = [float(TclResidual(Tcl, M, W, Icl, fcl, Tai, Tr, Va)) for Tcl in TclArray]
+
+	for index in range(1, len(residuals)):
+		if residuals[index - 1] <= 0 <= residuals[index]:
+			low, high = residuals[index - 1], residuals[index]
+			return TclArray[index - 1] + (TclArray[index] - TclArray[index - 1])*(-low)/(high - low)
+
+	return numpy.nan
+
+def compareSolvers(numSamples = 200, batchSize = 1000000):
+	"""Agreement and speed of the Newton solver against the brute force and the fixed-point iteration"""
+
+	random = numpy.random.RandomState(0)
+	Tai = random.uniform(18, 30, numSamples)
+	Tr = Tai + random.uniform(-2, 2, numSamples)
+	Va = random.uniform(0.05, 0.5, numSamples)
+	Icl = random.uniform(0.3, 1.2, numSamples)*CLO
+	M = random.uniform(1.0, 2.0, numSamples)*MET
+	fcl = ratioBodySurfaceAreaCoveredComputation(Icl)
+
+	begin = time.time()
+	brute = numpy.array([TclBruteForce(*sample) for sample in zip(Tai, Tr, Va, Icl, M)])
+	bruteTime = (time.time() - begin)/numSamples
+
+	newton, iterations = surfaceTemperatureClothingNewton(M, 0, Icl, fcl, Tai, Tr, Va)
+	fixedPoint = surfaceTemperatureClothingComputation(M, 0, Icl, fcl, Tai, Tr, Va)
+
+	#The grid spacing is 0.018 C, the brute force is only as good as the linear interpolation between two points
+	assert numpy.nanmax(numpy.abs(newton - brute)) < 1e-3, numpy.nanmax(numpy.abs(newton - brute))
+	assert numpy.max(numpy.abs(newton - fixedPoint)) < 0.02
+	assert numpy.max(numpy.abs(TclResidual(newton, M, 0, Icl, fcl, Tai, Tr, Va))) < 1e-6
+
+	print("Newton: iterations mean %.2f max %d, max |Tcl - brute force| %.1e C, max |Tcl - fixed point| %.1e C" % (iterations.mean(),
+		iterations.max(), numpy.nanmax(numpy.abs(newton - brute)), numpy.max(numpy.abs(newton - fixedPoint))))
+
+	batch = [numpy.resize(array, batchSize) for array in (M, Icl, fcl, Tai, Tr, Va)]
+	batchM, batchIcl, batchFcl, batchTai, batchTr, batchVa = batch
+
+	begin = time.time()
+	surfaceTemperatureClothingNewton(batchM, 0, batchIcl, batchFcl, batchTai, batchTr, batchVa)
+	newtonTime = (time.time() - begin)/batchSize
+
+	begin = time.time()
+	surfaceTemperatureClothingComputation(batchM, 0, batchIcl, batchFcl, batchTai, batchTr, batchVa)
+	fixedPointTime = (time.time() - begin)/batchSize
+
+	print("per sample: brute force %.1f us, fixed point %.3f us, Newton %.3f us (%.0fx faster than the brute force)" % (bruteTime*1e6,
+		fixedPointTime*1e6, newtonTime*1e6, bruteTime/newtonTime))
+
+
+class PmvGrid(object):
+	"""PMV of one (Icl, M, W) profile tabulated over air temperature, radiant temperature and sqrt(air speed), evaluated
+	by trilinear interpolation. PMV is linear in the vapour pressure Pa with a slope that only depends on M, so the table
+	holds the PMV at Pa = 0 and the humidity term is added exactly. Samples outside the grid fall back to the exact solver.
+	error is the largest PMV error measured against the exact solver at random points when the grid was built."""
+
+	TAI = (10.0, 35.0, 101) #first, last, points
+	TR = (10.0, 35.0, 101)
+	SQRT_VA = (0.0, 1.5**0.5, 161) #fine enough for the kink where natural convection takes over
+
+	def __init__(self, Icl, M, W = 0, validationSamples = 100000):
+
+		self.Icl, self.M, self.W = Icl, M, W
+		self._axes = [numpy.linspace(*axis) for axis in (self.TAI, self.TR, self.SQRT_VA)]
+		self._first = [axis[0] for axis in self._axes]
+		self._step = [axis[1] - axis[0] for axis in self._axes]
+		self._size = [len(axis) for axis in self._axes]
+		self._strides = [self._size[1]*self._size[2], self._size[2], 1]
+
+		#d(PMV)/d(Pa) of the PMV equation
+		self._slope = (0.303*numpy.exp(-0.036*M) + 0.028)*(3.05e-3 + 1.7e-5*M)
+
+		Tai, Tr, sqrtVa = numpy.meshgrid(*self._axes, indexing = 'ij')
+		self._values = numpy.ravel(_pmvPpd(Tai, Tr, 0, sqrtVa**2, Icl, M, W)[0])
+
+		self.error = self._validate(validationSamples)
+
+	def _validate(self, numSamples):
+
+		random = numpy.random.RandomState(0)
+		Tai, Tr, sqrtVa = [random.uniform(axis[0], axis[-1], numSamples) for axis in self._axes]
+		Hai = random.uniform(0, 100, numSamples)
+		exact = _pmvPpd(Tai, Tr, Hai, sqrtVa**2, self.Icl, self.M, self.W)[0]
+
+		return float(numpy.max(numpy.abs(self._interpolate(Tai, Tr, sqrtVa) + self._slope*waterVaporPressure(Hai, Tai) - exact)))
+
+	def _interpolate(self, Tai, Tr, sqrtVa):
+
+		base = 0
+		weights = []
+
+		for sample, first, step, size, stride in zip((Tai, Tr, sqrtVa), self._first, self._step, self._size, self._strides):
+			position = (sample - first)/step
+			index = numpy.minimum(position.astype(numpy.int64), size - 2) #inputs are inside the grid, truncation is floor
+			weights.append(position - index)
+			base = base + index*stride
+
+		tai, tr, va = weights
+		values = self._values
+		sTai, sTr = self._strides[0], self._strides[1]
+
+		#The 8 corners of the cell of every sample, interpolated along sqrt(Va), then Tr, then Tai
+		low = values[base] + va*(values[base + 1] - values[base])
+		high = values[base + sTr] + va*(values[base + sTr + 1] - values[base + sTr])
+		near = low + tr*(high - low)
+
+		base = base + sTai
+		low = values[base] + va*(values[base + 1] - values[base])
+		high = values[base + sTr] + va*(values[base + sTr + 1] - values[base + sTr])
+		far = low + tr*(high - low)
+
+		return near + tai*(far - near)
+
+	def _pmv(self, Tai, Tr, Hai, Va):
+
+		sqrtVa = numpy.sqrt(Va)
+
+		inside = numpy.ones(Tai.shape, dtype = bool)
+		for sample, axis in zip((Tai, Tr, sqrtVa), self._axes):
+			inside &= (sample >= axis[0]) & (sample <= axis[-1]) #False for NaN too
+
+		if inside.all():
+			pmv = self._interpolate(Tai, Tr, sqrtVa)
+		else:
+			pmv = numpy.empty(Tai.shape)
+			pmv[inside] = self._interpolate(Tai[inside], Tr[inside], sqrtVa[inside])
+			outside = ~inside
+			pmv[outside] = _pmvPpd(Tai[outside], Tr[outside], 0, Va[outside], self.Icl, self.M, self.W)[0]
+
+		return pmv + self._slope*waterVaporPressure(Hai, Tai)
+
+	def pmv(self, Tai, Tr, Hai, Va, chunkSize = CHUNK_SIZE):
+		"""Interpolated PMV of every sample, inputs broadcast together"""
+
+		arrays = numpy.broadcast_arrays(*[numpy.asarray(value, dtype = numpy.float64) for value in (Tai, Tr, Hai, Va)])
+		shape = arrays[0].shape
+		flat = [numpy.ravel(array) for array in arrays]
+		pmv = numpy.empty(flat[0].size)
+
+		for first in range(0, pmv.size, chunkSize):
+			chunk = slice(first, first + chunkSize)
+			pmv[chunk] = self._pmv(*[array[chunk] for array in flat])
+
+		return pmv.reshape(shape)
+
+
+_grids = collections.OrderedDict()
+_gridLock = threading.Lock()
+
+def pmvGrid(Icl, M, W = 0):
+	"""Interpolation grid of a profile, built on first use and kept in an LRU cache of GRID_CACHE_SIZE profiles"""
+
+	key = (round(float(Icl), 9), round(float(M), 9), round(float(W), 9))
+
+	with _gridLock:
+		if key in _grids:
+			_grids.move_to_end(key)
+			return _grids[key]
+
+	grid = PmvGrid(*key)
+
+	with _gridLock:
+		_grids[key] = grid
+		_grids.move_to_end(key)
+
+		while len(_grids) > GRID_CACHE_SIZE:
+			_grids.popitem(last = False)
+
+	return grid
+
+def pmvPpdInterpolated(Tai, Tr, Hai, Va, Icl, M, W = 0):
+	"""pmvPpdComputation for a single (Icl, M, W) profile, read from the profile's interpolation grid"""
+
+	pmv = pmvGrid(Icl, M, W).pmv(Tai, Tr, Hai, Va)
+
+	return pmv, ppdComputation(pmv)
+
+
+def check():
+	"""Reference values of ISO 7730 table D.1"""
+
+	#Tai, Tr, Va, Hai, clo, met, PMV, PPD
+	cases = [(22, 22, 0.1, 60, 0.5, 1.2, -0.75, 17), (27, 27, 0.1, 60, 0.5, 1.2, 0.77, 17), (27, 27, 0.3, 60, 0.5, 1.2, 0.44, 9),
+		(23.5, 25.5, 0.1, 60, 0.5, 1.2, -0.01, 5), (23.5, 25.5, 0.3, 60, 0.5, 1.2, -0.55, 11), (19, 19, 0.1, 40, 1.0, 1.2, -0.60, 13),
+		(23.5, 23.5, 0.3, 40, 1.0, 1.2, 0.12, 5), (23, 21, 0.1, 40, 1.0, 1.2, 0.05, 5),
+		(23, 21, 0.3, 40, 1.0, 1.2, -0.16, 6), (22, 22, 0.1, 60, 0.5, 1.6, 0.05, 5), (27, 27, 0.1, 60, 0.5, 1.6, 1.17, 34),
+		(27, 27, 0.3, 60, 0.5, 1.6, 0.95, 24)]
+
+	Tai, Tr, Va, Hai, clo, met, expectedPmv, expectedPpd = [numpy.array(column) for column in zip(*cases)]
+	pmv, ppd = pmvPpdComputation(Tai, Tr, Hai, Va, clo*CLO, met*MET)
+
+	assert numpy.all(numpy.abs(pmv - expectedPmv) <= 0.01), pmv
+	assert numpy.all(numpy.abs(ppd - expectedPpd) <= 1), ppd
+
+	print("ISO 7730 table D.1 reproduced")
+
+def checkGrid(numSamples = 1000000):
+	"""Interpolation error of the grids of a few profiles against the exact solver, on fresh random samples that also
+	go outside the grids, and the LRU eviction"""
+
+	random = numpy.random.RandomState(1)
+	Tai = random.uniform(5, 40, numSamples)
+	Tr = Tai + random.uniform(-10, 10, numSamples)
+	Hai = random.uniform(0, 100, numSamples)
+	Va = random.uniform(0, 2, numSamples)
+	Tai[:10] = numpy.nan
+
+	for clo, met in [(0.5, 1.0), (0.5, 1.1), (1.0, 1.1), (0.7, 1.4), (1.0, 2.0)]:
+		grid = pmvGrid(clo*CLO, met*MET)
+		exact = pmvComputation(Tai, Tr, Hai, Va, clo*CLO, met*MET)
+		error = numpy.nanmax(numpy.abs(grid.pmv(Tai, Tr, Hai, Va) - exact))
+
+		assert grid.error <= GRID_TOLERANCE and error <= GRID_TOLERANCE, (clo, met, grid.error, error)
+		assert numpy.isnan(grid.pmv(Tai[:10], Tr[:10], Hai[:10], Va[:10])).all()
+
+		print("%.1f clo, %.1f met: largest PMV error %.4f at build, %.4f on new samples" % (clo, met, grid.error, error))
+
+	assert pmvGrid(0.5*CLO, 1.0*MET) is pmvGrid(0.5*CLO, 1.0*MET)
+
+	for met in numpy.linspace(1, 2, GRID_CACHE_SIZE):
+		pmvGrid(0.5*CLO, met*MET)
+
+	assert len(_grids) == GRID_CACHE_SIZE and (0.5*CLO, 1.0*MET, 0.0) in _grids and (1.0*CLO, 2.0*MET, 0.0) not in _grids
+
+def benchmark(numZones = 150, numSamples = 12*24*365):
+	"""PMV/PPD of a year of 5 minute readings of numZones zones"""
+
+	Tai = numpy.random.uniform(18, 30, (numZones, numSamples))
+	Hai = numpy.random.uniform(30, 70, (numZones, numSamples))
+
+	begin = time.time()
+	pmv, ppd = pmvPpdComputation(Tai, Tai, Hai, 0.1, 0.5*CLO, 1.1*MET)
+	elapsed = time.time() - begin
 
-	return pmv
+	print("%d samples in %.1f s (%.0f samples/s), %d not converged" % (pmv.size, elapsed, pmv.size/elapsed, numpy.isnan(pmv).sum()))
 
-#Start of the main program
-TclArray, gtArray = TclComputation()
+	begin = time.time()
+	interpolated, ppd = pmvPpdInterpolated(Tai, Tai, Hai, 0.1, 0.5*CLO, 1.1*MET)
+	elapsed = time.time() - begin
 
-plt.plot(TclArray, gtArray)
+	print("interpolated, grid built: %d samples in %.1f s (%.0f samples/s), largest difference %.4f" % (pmv.size, elapsed, pmv.size/elapsed,
+		numpy.max(numpy.abs(interpolated - pmv))))
 
-print(gtArray)
 
-plt.show()
-#plt.title('not equal, looks like ellipse', fontsize=10)
+if __name__ == '__main__':
+	import matplotlib.pyplot as plt
 
+	check()
+	checkGrid()
+	compareSolvers()
+	benchmark()
 
+	TclArray, gtArray = TclComputation()
+	plt.plot(TclArray, gtArray)
+	plt.show()
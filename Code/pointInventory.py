@@ -0,0 +1,192 @@
+import os
+import re
+import csv
+import gzip
+import pickle
+import collections
+
+from hvacDBMapping import DataPoint
+
+SNAPSHOT_VERSION = 2
+
+Point = collections.namedtuple('Point', ['path', 'server', 'location', 'branch', 'subBranch', 'controlProgram', 'point', 'zone', 'componentType'])
+
+#Checked in order against the control program part of the path, the first match gives the component type
+_componentPatterns = [
+	('Thermafuser', re.compile(r'thermafuser', flags = re.IGNORECASE)),
+	('VAV', re.compile(r'vav', flags = re.IGNORECASE)),
+	('SAV', re.compile(r'sav', flags = re.IGNORECASE)),
+	('AHU', re.compile(r'ahu', flags = re.IGNORECASE)),
+]
+
+
+def componentType(path):
+	"""Type of the component a DataPoint path belongs to, from its control program part"""
+
+	program = path.rsplit('/', 1)[0]
+
+	for name, pattern in _componentPatterns:
+		if pattern.search(program):
+			return name
+
+	return 'Other'
+
+
+class PointInventory(object):
+	"""In-memory inventory of the DataPoints with secondary indexes by zone, control program, point name and component type"""
+
+	_indexedFields = ('zone', 'controlProgram', 'point', 'componentType')
+
+	def __init__(self, points = ()):
+
+		self._points = {}
+		self._indexes = dict((field, collections.defaultdict(set)) for field in self._indexedFields)
+
+		for point in points:
+			self.add(point)
+
+	def add(self, point):
+		"""Add or replace a point"""
+
+		previous = self._points.get(point.path)
+
+		if previous is not None:
+			for field in self._indexedFields:
+				self._indexes[field][getattr(previous, field)].discard(point.path)
+
+		self._points[point.path] = point
+
+		for field in self._indexedFields:
+			self._indexes[field][getattr(point, field)].add(point.path)
+
+	def __len__(self):
+		return len(self._points)
+
+	def __contains__(self, path):
+		return path in self._points
+
+	def __iter__(self):
+		return iter(self._points.values())
+
+	def get(self, path):
+		return self._points.get(path)
+
+	def values(self, field):
+		"""Distinct values of an indexed field"""
+
+		return [value for value, paths in self._indexes[field].items() if paths]
+
+	def select(self, zone = None, controlProgram = None, point = None, componentType = None):
+		"""Points matching every given field, by intersecting the index sets smallest first"""
+
+		wanted = [(field, value) for field, value in zip(self._indexedFields, (zone, controlProgram, point, componentType)) if value is not None]
+
+		if not wanted:
+			return list(self._points.values())
+
+		candidates = sorted((self._indexes[field].get(value, set()) for field, value in wanted), key = len)
+		paths = set(candidates[0]).intersection(*candidates[1:])
+
+		return [self._points[path] for path in paths]
+
+	def groupBy(self, field):
+		"""Map every value of an indexed field to the list of paths with it, e.g. control program -> paths"""
+
+		return dict((value, sorted(paths)) for value, paths in self._indexes[field].items() if paths)
+
+	#Sources
+
+	@classmethod
+	def fromCsv(cls, filepaths, zones):
+		"""Build the inventory from zone csv files, zones gives the zone of each file"""
+
+		inventory = cls()
+
+		for filepath, zone in zip(filepaths, zones):
+			with open(filepath, 'r') as csvfile:
+				reader = csv.reader(csvfile)
+				next(reader, None) #skip the header
+
+				for row in reader:
+					if row:
+						inventory.add(Point(row[6], row[0], row[1], row[2], row[3], row[4], row[5], str(zone), componentType(row[6])))
+
+		return inventory
+
+	@classmethod
+	def fromSession(cls, session):
+		"""Build the inventory from the DataPoints table, reading plain columns instead of ORM objects"""
+
+		query = session.query(DataPoint._path, DataPoint._server, DataPoint._location, DataPoint._branch, DataPoint._subBranch,
+			DataPoint._controlProgram, DataPoint._point, DataPoint._zone)
+
+		return cls(Point(*(tuple(row) + (componentType(row[0]),))) for row in query)
+
+	#Snapshots
+
+	@staticmethod
+	def sourceSignature(filepaths):
+		"""(absolute path, mtime in ns, size) of every source file, a snapshot is only valid while this does not change"""
+
+		signature = []
+
+		for filepath in filepaths:
+			status = os.stat(filepath)
+			signature.append((os.path.abspath(filepath), status.st_mtime_ns, status.st_size))
+
+		return signature
+
+	def save(self, filepath, sources = ()):
+		"""Persist the inventory as a compressed snapshot, the indexes are rebuilt on load.
+		sources is the sourceSignature of the files it was built from."""
+
+		directory = os.path.dirname(filepath)
+		if directory and not os.path.exists(directory):
+			os.makedirs(directory)
+
+		tmpPath = filepath + '.tmp'
+		with gzip.open(tmpPath, 'wb') as snapshot:
+			pickle.dump((SNAPSHOT_VERSION, [tuple(source) for source in sources], [tuple(point) for point in self._points.values()]),
+				snapshot, protocol = pickle.HIGHEST_PROTOCOL)
+
+		os.replace(tmpPath, filepath)
+
+	@staticmethod
+	def _readSnapshot(filepath):
+
+		with gzip.open(filepath, 'rb') as snapshot:
+			saved = pickle.load(snapshot)
+
+		if saved[0] != SNAPSHOT_VERSION:
+			raise ValueError("Inventory snapshot " + filepath + " has version " + str(saved[0]))
+
+		return saved[1], saved[2]
+
+	@classmethod
+	def load(cls, filepath):
+
+		sources, rows = cls._readSnapshot(filepath)
+
+		return cls(Point(*row) for row in rows)
+
+	@classmethod
+	def loadOrBuild(cls, snapshotPath, build, sources = ()):
+		"""Load the snapshot if there is one built from the same sources, otherwise build the inventory with build() and
+		save it. sources are the files build() reads, the snapshot is rebuilt when their paths, mtimes or sizes changed
+		or when it was written by another SNAPSHOT_VERSION."""
+
+		signature = cls.sourceSignature(sources)
+
+		if os.path.exists(snapshotPath):
+			try:
+				saved, rows = cls._readSnapshot(snapshotPath)
+			except ValueError:
+				saved, rows = None, None
+
+			if saved == signature:
+				return cls(Point(*row) for row in rows)
+
+		inventory = build()
+		inventory.save(snapshotPath, signature)
+
+		return inventory
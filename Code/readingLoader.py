@@ -0,0 +1,192 @@
+import os
+import csv
+import math
+import time
+import tempfile
+import collections
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import DateTime, Boolean, func
+
+CHUNK_SIZE = 5000
+EPOCH = datetime(1970, 1, 1)
+
+ReadingBlock = collections.namedtuple('ReadingBlock', ['readingClass', 'ids', 'epochs', 'columns'])
+ReadingBlock.__doc__ = """Aligned readings of one Reading class. ids and epochs have one entry per row,
+columns maps a DB column name of the Reading table to an array of values (NaN is stored as NULL)"""
+
+
+class LoadStats(collections.namedtuple('LoadStats', ['rows', 'seconds'])):
+	"""Rows written by a load and the time it took"""
+
+	@property
+	def rowsPerSecond(self):
+		return self.rows/self.seconds if self.seconds > 0 else float('inf')
+
+	def __str__(self):
+		return "%d rows in %.2f s (%.0f rows/s)" % (self.rows, self.seconds, self.rowsPerSecond)
+
+
+def keyColumns(table):
+	"""Return the (component id, time stamp) primary key columns of a Reading table"""
+
+	idColumn = None
+	timeColumn = None
+
+	for column in table.primary_key.columns:
+		if column.name.lower() == 'time_stamp':
+			timeColumn = column
+		else:
+			idColumn = column
+
+	if idColumn is None or timeColumn is None:
+		raise ValueError(table.name + " is not keyed by (id, Time_stamp)")
+
+	return idColumn, timeColumn
+
+def _converter(column):
+	"""Function turning a raw block value into what the column stores, NaN becomes None"""
+
+	if isinstance(column.type, DateTime):
+		return lambda epoch: EPOCH + timedelta(seconds = int(epoch))
+	elif column.name.lower() == 'time_stamp':
+		return lambda epoch: str(EPOCH + timedelta(seconds = int(epoch)))
+	elif isinstance(column.type, Boolean):
+		return lambda value: None if math.isnan(value) else bool(value)
+	else:
+		return lambda value: None if math.isnan(value) else float(value)
+
+def blockRows(block):
+	"""Turn a ReadingBlock into the list of row dicts keyed by DB column name"""
+
+	table = block.readingClass.__table__
+	idColumn, timeColumn = keyColumns(table)
+	toTime = _converter(timeColumn)
+
+	names = list(block.columns.keys())
+	converters = [_converter(table.c[name]) for name in names]
+	values = [np.asarray(block.columns[name], dtype = np.float64).tolist() for name in names]
+
+	rows = []
+
+	for i, (componentId, epoch) in enumerate(zip(np.asarray(block.ids).tolist(), np.asarray(block.epochs).tolist())):
+		row = {idColumn.name: componentId, timeColumn.name: toTime(epoch)}
+
+		for name, convert, column in zip(names, converters, values):
+			row[name] = convert(column[i])
+
+		rows.append(row)
+
+	return rows
+
+def upsertStatement(table, columnNames, dialectName, coalesce = True):
+	"""INSERT that updates the value columns of rows whose (id, Time_stamp) already exist.
+	With coalesce a NULL in the new row keeps the stored value, so a block that lacks some columns for an already
+	loaded (id, Time_stamp) never erases them. Pass coalesce = False when the new row is meant to replace the old one."""
+
+	if dialectName == 'mysql':
+		from sqlalchemy.dialects.mysql import insert
+		stmt = insert(table)
+		new = lambda name: stmt.inserted[name]
+
+	elif dialectName == 'sqlite':
+		from sqlalchemy.dialects.sqlite import insert
+		stmt = insert(table)
+		new = lambda name: stmt.excluded[name]
+
+	else:
+		raise ValueError("Upserts are not supported for " + dialectName)
+
+	values = dict((name, func.coalesce(new(name), table.c[name]) if coalesce else new(name)) for name in columnNames)
+
+	if dialectName == 'mysql':
+		return stmt.on_duplicate_key_update(**values)
+
+	keys = [column.name for column in table.primary_key.columns]
+
+	if not columnNames:
+		return stmt.on_conflict_do_nothing(index_elements = keys)
+
+	return stmt.on_conflict_do_update(index_elements = keys, set_ = values)
+
+def loadBlock(connection, block, chunkSize = CHUNK_SIZE):
+	"""Write a ReadingBlock with batched executemany upserts, running it twice leaves the table unchanged"""
+
+	begin = time.time()
+	table = block.readingClass.__table__
+	rows = blockRows(block)
+	stmt = upsertStatement(table, list(block.columns.keys()), connection.dialect.name)
+
+	for start in range(0, len(rows), chunkSize):
+		connection.execute(stmt, rows[start:start + chunkSize])
+
+	return LoadStats(len(rows), time.time() - begin)
+
+def loadBlockInfile(connection, block):
+	"""MySQL fast path, write the block to a temporary file, LOAD DATA LOCAL INFILE it into a staging copy of the table
+	and move it over with the same COALESCE upsert as loadBlock, so existing values are never nulled.
+	The engine needs local_infile = 1 in its connect_args."""
+
+	begin = time.time()
+	table = block.readingClass.__table__
+	rows = blockRows(block)
+	valueNames = list(block.columns.keys())
+	names = [column.name for column in keyColumns(table)] + valueNames
+	staging = table.name + '_Staging'
+
+	fd, filepath = tempfile.mkstemp(suffix = '.csv')
+
+	try:
+		with os.fdopen(fd, 'w', newline = '') as csvfile:
+			writer = csv.writer(csvfile, lineterminator = '\n')
+			for row in rows:
+				writer.writerow(['\\N' if row[name] is None else (int(row[name]) if isinstance(row[name], bool) else row[name]) for name in names])
+
+		connection.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS %s" % staging)
+		connection.exec_driver_sql("CREATE TEMPORARY TABLE %s LIKE %s" % (staging, table.name))
+
+		#IGNORE skips a key repeated inside the block instead of failing the load
+		connection.exec_driver_sql("LOAD DATA LOCAL INFILE '%s' IGNORE INTO TABLE %s FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' (%s)"
+			% (filepath.replace('\\', '/'), staging, ', '.join(names)))
+
+		update = ', '.join("%s = COALESCE(VALUES(%s), %s.%s)" % (name, name, table.name, name) for name in valueNames) or \
+			', '.join("%s = %s.%s" % (name, table.name, name) for name in names[:1])
+		connection.exec_driver_sql("INSERT INTO %s (%s) SELECT %s FROM %s ON DUPLICATE KEY UPDATE %s"
+			% (table.name, ', '.join(names), ', '.join(names), staging, update))
+
+		connection.exec_driver_sql("DROP TEMPORARY TABLE %s" % staging)
+	finally:
+		os.remove(filepath)
+
+	return LoadStats(len(rows), time.time() - begin)
+
+def loadBlocks(engine, blocks, useInfile = False, chunkSize = CHUNK_SIZE, rollups = False, partitions = None, comfort = False):
+	"""Load all the blocks in one transaction, returns the LoadStats of the whole load.
+	With rollups the hourly/daily rollups the blocks touch are refreshed in the same transaction.
+	With comfort the comfort rows of new thermafuser readings are computed after the load, see thermafuserComfort.updateComfort.
+	With a readingPartitions.PartitionManager the blocks are written through it and the rollups read the raw
+	readings through partitions.select, so month tables are seen."""
+
+	rows = 0
+	begin = time.time()
+
+	with engine.begin() as connection:
+		for block in blocks:
+			if useInfile and connection.dialect.name == 'mysql':
+				stats = loadBlockInfile(connection, block)
+			elif partitions is not None:
+				stats = partitions.loadBlock(connection, block, chunkSize)
+			else:
+				stats = loadBlock(connection, block, chunkSize)
+			rows += stats.rows
+
+			if rollups:
+				import readingRollups
+				readingRollups.refreshBlock(connection, block, partitions)
+
+		if comfort and any(block.readingClass.__tablename__ == 'Thermafuser_Reading' for block in blocks):
+			import thermafuserComfort
+			thermafuserComfort.updateComfort(connection, partitions = partitions)
+
+	return LoadStats(rows, time.time() - begin)
@@ -0,0 +1,250 @@
+import os
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy import MetaData, Table, Column, String, Float, Integer, DateTime, inspect, select, and_, text
+
+from hvacDBMapping import AHUReading, VAVReading
+
+CHUNK_SIZE = 5000
+
+#Columns the older mappings stored with other types, by table
+LEGACY_COLUMNS = {
+	AHUReading.__tablename__: {'AHUNumber': String(255), 'Time_stamp': String(255)},
+	VAVReading.__tablename__: {'VAVId': String(255), 'Time_stamp': String(255), 'VAVName': Float, 'DuctStaticPressure': String(255)},
+}
+
+#Formats the older pulls stored time stamps in besides ISO, the WebCTRL trend format came in as it was
+LEGACY_TIME_FORMATS = ['%m/%d/%Y %I:%M:%S %p']
+MYSQL_LEGACY_TIME_FORMAT = '%m/%d/%Y %h:%i:%s %p'
+ISO_TIME_REGEX = '^[0-9]{4}-[0-9]{2}-[0-9]{2}[ T][0-9]{2}:[0-9]{2}:[0-9]{2}'
+
+
+def _plainTable(table, metadata, types = None):
+	"""Copy of a table without foreign keys, types overrides the type of some columns"""
+
+	types = types or {}
+
+	return Table(table.name, metadata, *[Column(column.name, types.get(column.name, column.type),
+		primary_key = column.primary_key, nullable = column.nullable) for column in table.columns])
+
+def legacyTable(table, metadata):
+	"""Copy of a Reading table with the column types of the older mapping, without foreign keys"""
+
+	return _plainTable(table, metadata, LEGACY_COLUMNS[table.name])
+
+def needsMigration(connection, table):
+	"""True if the stored table still has the string time stamps of the older mapping"""
+
+	inspector = inspect(connection)
+
+	if not inspector.has_table(table.name):
+		return False
+
+	for column in inspector.get_columns(table.name):
+		if column['name'] == 'Time_stamp':
+			return isinstance(column['type'], String)
+
+	return False
+
+def parseTimestamp(value):
+	"""datetime of a legacy time stamp string, ISO or one of LEGACY_TIME_FORMATS, None when it is neither"""
+
+	if value is None or isinstance(value, datetime):
+		return value
+
+	value = value.strip()
+
+	try:
+		return datetime.fromisoformat(value)
+	except ValueError:
+		pass
+
+	for timeFormat in LEGACY_TIME_FORMATS:
+		try:
+			return datetime.strptime(value, timeFormat)
+		except ValueError:
+			pass
+
+	return None
+
+def _converter(column):
+	"""Function turning a legacy value into what the new column stores"""
+
+	if isinstance(column.type, DateTime):
+		return parseTimestamp
+	elif isinstance(column.type, Integer):
+		return lambda value: None if value is None else int(value)
+	elif isinstance(column.type, Float):
+		def toFloat(value):
+			try:
+				return None if value is None else float(value)
+			except ValueError:
+				return None #non numeric readings like 'N/A'
+		return toFloat
+	elif isinstance(column.type, String):
+		return lambda value: None if value is None else str(value)
+
+	return lambda value: value
+
+def _migrateMysql(connection, table):
+	"""Convert the columns in place, InnoDB rebuilds the clustered index once.
+	Legacy time stamps are rewritten as ISO first, rows whose time stamp is still not ISO are moved to <table>_unparsed.
+	Returns the number of rows moved."""
+
+	changed = [table.c[name] for name in LEGACY_COLUMNS[table.name]]
+	unparsedName = table.name + '_unparsed'
+
+	if 'DuctStaticPressure' in table.c and 'DuctStaticPressure' in LEGACY_COLUMNS[table.name]:
+		connection.exec_driver_sql("UPDATE %s SET DuctStaticPressure = NULL WHERE DuctStaticPressure NOT REGEXP '^[-+]?[0-9]*\\\\.?[0-9]+([eE][-+]?[0-9]+)?$'"
+			% table.name)
+
+	connection.execute(text("UPDATE %s SET Time_stamp = DATE_FORMAT(STR_TO_DATE(Time_stamp, :legacy), '%%Y-%%m-%%d %%H:%%i:%%s') "
+		"WHERE Time_stamp NOT REGEXP :iso AND STR_TO_DATE(Time_stamp, :legacy) IS NOT NULL" % table.name),
+		{'legacy': MYSQL_LEGACY_TIME_FORMAT, 'iso': ISO_TIME_REGEX})
+
+	unparsed = connection.execute(text("SELECT COUNT(*) FROM %s WHERE Time_stamp NOT REGEXP :iso" % table.name), {'iso': ISO_TIME_REGEX}).scalar()
+
+	if unparsed:
+		connection.exec_driver_sql("CREATE TABLE IF NOT EXISTS %s LIKE %s" % (unparsedName, table.name))
+		connection.execute(text("INSERT INTO %s SELECT * FROM %s WHERE Time_stamp NOT REGEXP :iso" % (unparsedName, table.name)), {'iso': ISO_TIME_REGEX})
+		connection.execute(text("DELETE FROM %s WHERE Time_stamp NOT REGEXP :iso" % table.name), {'iso': ISO_TIME_REGEX})
+
+	connection.exec_driver_sql("ALTER TABLE %s %s" % (table.name, ', '.join("MODIFY COLUMN %s %s%s" % (column.name,
+		column.type.compile(dialect = connection.dialect), '' if column.nullable else ' NOT NULL') for column in changed)))
+
+	return unparsed
+
+def _migrateCopy(connection, table, chunkSize):
+	"""For databases that cannot change a column type (SQLite), copy the rows into a new table converting them in chunks.
+	Rows whose time stamp cannot be parsed are copied as they are to <table>_unparsed. Returns their number."""
+
+	legacyName = table.name + '_legacy'
+	connection.exec_driver_sql("ALTER TABLE %s RENAME TO %s" % (table.name, legacyName))
+	table.create(connection)
+
+	legacy = Table(legacyName, MetaData(), autoload_with = connection)
+	unparsedTable = Table(table.name + '_unparsed', MetaData(), *[Column(column.name, column.type) for column in legacy.columns])
+	names = [column.name for column in table.columns]
+	converters = [_converter(table.c[name]) for name in names]
+	unparsed = 0
+
+	result = connection.execution_options(yield_per = chunkSize).execute(select(*[legacy.c[name] for name in names]))
+
+	for rows in result.partitions():
+		converted = []
+		failed = []
+
+		for row in rows:
+			values = dict((name, convert(value)) for name, convert, value in zip(names, converters, row))
+
+			if values['Time_stamp'] is None:
+				failed.append(dict(zip(names, row)))
+			else:
+				converted.append(values)
+
+		if converted:
+			connection.execute(table.insert(), converted)
+
+		if failed:
+			unparsedTable.create(connection, checkfirst = True)
+			connection.execute(unparsedTable.insert(), failed)
+			unparsed += len(failed)
+
+	connection.exec_driver_sql("DROP TABLE %s" % legacyName)
+
+	return unparsed
+
+def migrateTable(connection, table, chunkSize = CHUNK_SIZE):
+	"""Move one Reading table from string keys to DATETIME time stamps and integer ids.
+	Returns the number of rows whose time stamp could not be parsed, they are kept in <table>_unparsed."""
+
+	if connection.dialect.name == 'mysql':
+		return _migrateMysql(connection, table)
+
+	return _migrateCopy(connection, table, chunkSize)
+
+def migrate(engine):
+	"""Migrate every Reading table that still has the older column types. Safe to run again, migrated tables are skipped."""
+
+	for readingClass in (AHUReading, VAVReading):
+		table = readingClass.__table__
+
+		with engine.begin() as connection:
+			if not needsMigration(connection, table):
+				continue
+
+			begin = time.time()
+			unparsed = migrateTable(connection, table)
+			print("migrated %s in %.2f s, %d rows with unparseable time stamps moved to %s_unparsed" % (table.name, time.time() - begin,
+				unparsed, table.name))
+
+
+def _tableBytes(connection, tableName):
+	"""Bytes used by a table and its indexes"""
+
+	if connection.dialect.name == 'mysql':
+		connection.exec_driver_sql("ANALYZE TABLE %s" % tableName)
+		return connection.exec_driver_sql("SELECT DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '%s'"
+			% tableName).scalar()
+
+	return connection.exec_driver_sql("SELECT SUM(pgsize) FROM dbstat WHERE name = '%s' OR name LIKE 'sqlite_autoindex_%s_%%'"
+		% (tableName, tableName)).scalar()
+
+def benchmark(url = None, numVAVs = 40, days = 14, queries = 200):
+	"""Compare the string keyed and the DATETIME/integer keyed VAV reading table: bytes used by the table and its indexes,
+	and latency of a one day range query for one VAV and of a one hour range query over all of them.
+	Runs on throwaway SQLite files, or on the database at url (the table is dropped and recreated there)."""
+
+	start = datetime(2017, 3, 1)
+	stamps = [start + timedelta(minutes = 5*i) for i in range(days*288)]
+	random.seed(0)
+
+	directory = tempfile.mkdtemp()
+
+	for label, makeTable, toId, toTime in [
+		('string keys', lambda metadata: legacyTable(VAVReading.__table__, metadata), str, str),
+		('DATETIME/integer keys', lambda metadata: _plainTable(VAVReading.__table__, metadata), int, lambda stamp: stamp)]:
+
+		engine = sqlalchemy.create_engine(url or 'sqlite:///' + os.path.join(directory, label.replace(' ', '_').replace('/', '_') + '.db'))
+		table = makeTable(MetaData())
+		table.drop(engine, checkfirst = True)
+		table.create(engine)
+
+		rows = [{'VAVId': toId(vav), 'Time_stamp': toTime(stamp), 'ZoneTemperature': 70 + random.random(), 'FlowInput': random.random()}
+			for vav in range(1, numVAVs + 1) for stamp in stamps]
+
+		begin = time.time()
+		with engine.begin() as connection:
+			for first in range(0, len(rows), CHUNK_SIZE):
+				connection.execute(table.insert(), rows[first:first + CHUNK_SIZE])
+		loadTime = time.time() - begin
+
+		with engine.connect() as connection:
+			size = _tableBytes(connection, table.name)
+
+			dayQuery = select(table.c.Time_stamp, table.c.ZoneTemperature).where(and_(table.c.VAVId == toId(7),
+				table.c.Time_stamp >= toTime(start + timedelta(3)), table.c.Time_stamp < toTime(start + timedelta(4))))
+			hourQuery = select(table.c.VAVId, table.c.ZoneTemperature).where(and_(table.c.Time_stamp >= toTime(start + timedelta(5)),
+				table.c.Time_stamp < toTime(start + timedelta(5, 3600))))
+
+			timings = []
+			for query in (dayQuery, hourQuery):
+				begin = time.time()
+				for i in range(queries):
+					count = len(connection.execute(query).all())
+				timings.append(((time.time() - begin)/queries*1000, count))
+
+		if url:
+			table.drop(engine)
+
+		print("%-22s %d rows: %.1f MB, load %.2f s, one VAV one day %.2f ms (%d rows), all VAVs one hour %.2f ms (%d rows)"
+			% (label, len(rows), size/1e6, loadTime, timings[0][0], timings[0][1], timings[1][0], timings[1][1]))
+
+
+if __name__ == '__main__':
+	import sys
+	benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,287 @@
+import re
+import time
+import collections
+from datetime import datetime
+
+import sqlalchemy
+from sqlalchemy import MetaData, Table, Column, inspect, select, union_all, and_
+
+import pathRouting
+import readingLoader
+
+_monthTableRegex = re.compile(r'^(?P<base>.+)_(?P<year>\d{4})(?P<month>\d{2})$')
+
+
+def monthStart(moment):
+	"""First instant of the month of moment"""
+
+	return datetime(moment.year, moment.month, 1)
+
+def nextMonth(month):
+
+	return datetime(month.year + month.month//12, month.month % 12 + 1, 1)
+
+def addMonths(month, count):
+	"""Month start count months after (or before, count < 0) month"""
+
+	index = month.year*12 + month.month - 1 + count
+	return datetime(index//12, index % 12 + 1, 1)
+
+def months(start, end):
+	"""Month starts of every month that overlaps [start, end)"""
+
+	month = monthStart(start)
+	result = []
+
+	while month < end:
+		result.append(month)
+		month = nextMonth(month)
+
+	return result
+
+def partitionName(month):
+	"""'p201703' for March 2017"""
+
+	return month.strftime('p%Y%m')
+
+def monthTableName(tableName, month):
+	"""'Thermafuser_Reading_201703' for March 2017"""
+
+	return tableName + month.strftime('_%Y%m')
+
+def readingTables():
+	"""Every *_Reading table of the mapping"""
+
+	return [readingClass.__table__ for readingClass in pathRouting.readingClasses().values()]
+
+
+class PartitionManager(object):
+	"""Monthly partitions of the Reading tables on their time stamp.
+	On MySQL these are RANGE COLUMNS partitions plus a catch-all pmax partition. New months are split out of pmax,
+	and expired months are dropped as whole partitions instead of row DELETEs.
+	On other databases (SQLite) every month is a table of its own named like 'Thermafuser_Reading_201703',
+	behind the same methods."""
+
+	def __init__(self, engine):
+
+		self._engine = engine
+		self._native = engine.dialect.name == 'mysql'
+		self._monthTables = {}
+
+	@property
+	def native(self):
+		"""True when the database partitions the tables itself"""
+
+		return self._native
+
+	#Inspection
+
+	def partitions(self, connection, table):
+		"""Month starts of the partitions (or month tables) a Reading table has, oldest first"""
+
+		if self._native:
+			names = connection.exec_driver_sql("SELECT PARTITION_NAME FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+				"AND TABLE_NAME = '%s' AND PARTITION_NAME IS NOT NULL" % table.name).scalars().all()
+			return sorted(datetime.strptime(name, 'p%Y%m') for name in names if name != 'pmax')
+
+		found = []
+
+		for name in inspect(connection).get_table_names():
+			match = _monthTableRegex.match(name)
+			if match and match.group('base') == table.name:
+				found.append(datetime(int(match.group('year')), int(match.group('month')), 1))
+
+		return sorted(found)
+
+	def monthTable(self, table, month):
+		"""Table object of the month table of a Reading table, without foreign keys"""
+
+		name = monthTableName(table.name, month)
+
+		if name not in self._monthTables:
+			self._monthTables[name] = Table(name, MetaData(), *[Column(column.name, column.type, primary_key = column.primary_key,
+				nullable = column.nullable) for column in table.columns])
+
+		return self._monthTables[name]
+
+	#Creation and rotation
+
+	def _foreignKeys(self, connection, table):
+
+		return connection.exec_driver_sql("SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS WHERE CONSTRAINT_SCHEMA = DATABASE() "
+			"AND TABLE_NAME = '%s'" % table.name).scalars().all()
+
+	def partitionTable(self, connection, table, ahead = 2, now = None, dropForeignKeys = False):
+		"""Partition an existing Reading table by month, from the month of its oldest row to ahead months after this one.
+		InnoDB does not allow foreign keys on partitioned tables, a table that has some raises a ValueError unless
+		dropForeignKeys allows dropping them first. On SQLite the rows are moved out of the table into the month tables."""
+
+		_, timeColumn = readingLoader.keyColumns(table)
+		oldest, newest = connection.execute(select(sqlalchemy.func.min(timeColumn), sqlalchemy.func.max(timeColumn))).one()
+		now = now or datetime.now()
+
+		if self._native:
+			if self.partitions(connection, table):
+				return
+
+			constraints = self._foreignKeys(connection, table)
+
+			if constraints and not dropForeignKeys:
+				raise ValueError("partitioning %s drops its foreign keys %s, pass dropForeignKeys = True to allow it"
+					% (table.name, ', '.join(constraints)))
+
+			for constraint in constraints:
+				connection.exec_driver_sql("ALTER TABLE %s DROP FOREIGN KEY %s" % (table.name, constraint))
+				print("dropped foreign key " + constraint + " of " + table.name)
+
+			first = monthStart(oldest) if oldest is not None else monthStart(now)
+			definitions = ["PARTITION %s VALUES LESS THAN ('%s')" % (partitionName(month), nextMonth(month).strftime('%Y-%m-%d'))
+				for month in months(first, addMonths(monthStart(now), ahead + 1))]
+
+			connection.exec_driver_sql("ALTER TABLE %s PARTITION BY RANGE COLUMNS(%s) (%s, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+				% (table.name, timeColumn.name, ', '.join(definitions)))
+			return
+
+		if oldest is not None:
+			for month in months(oldest, nextMonth(monthStart(newest))):
+				monthTable = self.monthTable(table, month)
+				monthTable.create(connection, checkfirst = True)
+				inMonth = and_(timeColumn >= month, timeColumn < nextMonth(month))
+				#The month table may already hold some of these keys, the rows moved in update them like a load would
+				move = readingLoader.upsertStatement(monthTable, [column.name for column in table.columns if not column.primary_key], connection.dialect.name)
+				connection.execute(move.from_select([column.name for column in table.columns], select(table).where(inMonth)))
+				connection.execute(table.delete().where(inMonth))
+
+		self.ensure(connection, table, monthStart(now), addMonths(monthStart(now), ahead + 1))
+
+	def ensure(self, connection, table, start, end):
+		"""Make sure every month overlapping [start, end) has its partition, new ones are split out of pmax"""
+
+		existing = set(self.partitions(connection, table))
+		missing = [month for month in months(start, end) if month not in existing]
+
+		if self._native:
+			if not existing:
+				raise ValueError(table.name + " is not partitioned, run partitionTable first")
+
+			#Ranges are contiguous, months before the newest partition are already covered by it
+			missing = [month for month in missing if month > max(existing)]
+
+			if missing:
+				definitions = ["PARTITION %s VALUES LESS THAN ('%s')" % (partitionName(month), nextMonth(month).strftime('%Y-%m-%d')) for month in missing]
+				connection.exec_driver_sql("ALTER TABLE %s REORGANIZE PARTITION pmax INTO (%s, PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+					% (table.name, ', '.join(definitions)))
+		else:
+			for month in missing:
+				self.monthTable(table, month).create(connection)
+
+		return missing
+
+	def expire(self, connection, table, before):
+		"""Drop the partitions whose whole month is before the given time, returns their month starts"""
+
+		expired = [month for month in self.partitions(connection, table) if nextMonth(month) <= before]
+
+		if not expired:
+			return expired
+
+		if self._native:
+			connection.exec_driver_sql("ALTER TABLE %s DROP PARTITION %s" % (table.name, ', '.join(partitionName(month) for month in expired)))
+		else:
+			for month in expired:
+				self.monthTable(table, month).drop(connection)
+				self._monthTables.pop(monthTableName(table.name, month), None)
+
+		return expired
+
+	def rotate(self, now = None, ahead = 2, retentionMonths = None, tables = None, dropForeignKeys = False):
+		"""Nightly job: create the partitions of the next ahead months for every Reading table and, with a retention,
+		drop those older than retentionMonths. Each table is changed in its own transaction.
+		On MySQL the first rotation of a table partitions it. InnoDB does not allow foreign keys on partitioned tables, so
+		that fails for a table with foreign keys to the component tables unless dropForeignKeys drops them for good.
+		Nothing checks the component ids of new readings after that."""
+
+		now = now or datetime.now()
+		report = collections.OrderedDict()
+
+		for table in tables or readingTables():
+			with self._engine.begin() as connection:
+				#On SQLite this also moves rows written to the base table since the last rotation
+				if not self._native or not self.partitions(connection, table):
+					self.partitionTable(connection, table, ahead, now, dropForeignKeys)
+
+				created = self.ensure(connection, table, monthStart(now), addMonths(monthStart(now), ahead + 1))
+				dropped = self.expire(connection, table, addMonths(monthStart(now), -retentionMonths)) if retentionMonths else []
+
+			report[table.name] = (created, dropped)
+
+		return report
+
+	#Reads and writes
+
+	def select(self, connection, table, start, end, columns = None):
+		"""Select the rows of [start, end) only from the partitions that can hold them.
+		On MySQL the time range is added and the statement names its partitions, on SQLite it is a UNION ALL of the month tables
+		and of the base table, which holds the rows written to it since the last rotation. A key written to both comes back
+		twice until the next rotation merges it."""
+
+		_, timeColumn = readingLoader.keyColumns(table)
+		existing = self.partitions(connection, table)
+		wanted = [month for month in months(start, end) if month in existing]
+		names = columns or [column.name for column in table.columns]
+
+		if self._native:
+			query = select(*[table.c[name] for name in names]).where(and_(timeColumn >= start, timeColumn < end))
+
+			if not existing:
+				return query
+
+			#The first partition also holds anything older than its month and pmax anything after the last one
+			partitions = []
+			for month in months(start, end):
+				name = partitionName(existing[0]) if month < existing[0] else ('pmax' if month > existing[-1] else partitionName(month))
+				if name not in partitions:
+					partitions.append(name)
+
+			return query.with_hint(table, 'PARTITION (%s)' % ', '.join(partitions), 'mysql')
+
+		selects = [select(*[table.c[name] for name in names]).where(and_(timeColumn >= start, timeColumn < end))]
+
+		for month in wanted:
+			monthTable = self.monthTable(table, month)
+			monthTime = monthTable.c[timeColumn.name]
+			selects.append(select(*[monthTable.c[name] for name in names]).where(and_(monthTime >= start, monthTime < end)))
+
+		return selects[0] if len(selects) == 1 else union_all(*selects)
+
+	def loadBlock(self, connection, block, chunkSize = readingLoader.CHUNK_SIZE):
+		"""Write a ReadingBlock, on SQLite split into the month tables it falls in"""
+
+		if self._native:
+			return readingLoader.loadBlock(connection, block, chunkSize)
+
+		begin = time.time()
+		table = block.readingClass.__table__
+		_, timeColumn = readingLoader.keyColumns(table)
+		rows = readingLoader.blockRows(block)
+
+		byMonth = collections.defaultdict(list)
+		for row in rows:
+			stamp = row[timeColumn.name]
+			if isinstance(stamp, str):
+				stamp = datetime.fromisoformat(stamp)
+			byMonth[monthStart(stamp)].append(row)
+
+		existing = set(self.partitions(connection, table))
+
+		for month, monthRows in sorted(byMonth.items()):
+			monthTable = self.monthTable(table, month)
+
+			if month not in existing:
+				monthTable.create(connection)
+
+			stmt = readingLoader.upsertStatement(monthTable, list(block.columns.keys()), connection.dialect.name)
+			for first in range(0, len(monthRows), chunkSize):
+				connection.execute(stmt, monthRows[first:first + chunkSize])
+
+		return readingLoader.LoadStats(len(rows), time.time() - begin)
@@ -0,0 +1,235 @@
+import time
+import collections
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select, and_, or_, inspect, Integer, Float, Boolean, DateTime
+
+from hvacDBMapping import *
+from readingLoader import keyColumns
+from readingRollups import valueColumns
+
+PAGE_SIZE = 10000
+
+#Reading class of every component class
+READING_CLASSES = {AHU: AHUReading, Fan: FanReading, Damper: DamperReading, Filter: FilterReading, HEC: HECReading,
+	SAV: SAVReading, VAV: VAVReading, Thermafuser: ThermafuserReading}
+
+
+def componentTarget(components):
+	"""Reading class and ids of one component or of a list of components of the same class"""
+
+	if not isinstance(components, (list, tuple, set)):
+		components = [components]
+
+	classes = set(type(component) for component in components)
+
+	if len(classes) != 1:
+		raise ValueError("readings of components of different classes go to different tables, query them separately")
+
+	componentClass = classes.pop()
+	mapper = inspect(componentClass)
+
+	return READING_CLASSES[componentClass], [mapper.primary_key_from_instance(component)[0] for component in components]
+
+def readingPages(connection, readingClass, componentIds, start, end, columns = None, pageSize = PAGE_SIZE, partitions = None):
+	"""Stream the readings of the components in [start, end) one page at a time, ordered by (id, time stamp).
+	Pages are fetched with keyset pagination, every query starts right after the last (id, time stamp) seen,
+	so memory stays at one page whatever the range. Each page is a dict of NumPy arrays: 'id', the time column
+	as datetime64[s] and one float64 array per value column (NULL is NaN)."""
+
+	table = readingClass.__table__
+	idColumn, timeColumn = keyColumns(table)
+	columns = columns or valueColumns(table)
+	names = [idColumn.name, timeColumn.name] + list(columns)
+
+	if partitions is not None:
+		source = partitions.select(connection, table, start, end, names).subquery()
+	else:
+		source = select(*[table.c[name] for name in names]).where(and_(timeColumn >= start, timeColumn < end)).subquery()
+
+	sourceId = source.c[idColumn.name]
+	sourceTime = source.c[timeColumn.name]
+	query = select(source).where(sourceId.in_(list(componentIds))).order_by(sourceId, sourceTime).limit(pageSize)
+
+	last = None
+
+	while True:
+		#Expanded row comparison, (id, t) > (lastId, lastTime), which MySQL can serve from the primary key
+		pageQuery = query if last is None else query.where(or_(sourceId > last[0], and_(sourceId == last[0], sourceTime > last[1])))
+		rows = connection.execute(pageQuery).all()
+
+		if not rows:
+			return
+
+		fields = list(zip(*rows))
+		page = collections.OrderedDict()
+		page[idColumn.name] = np.array(fields[0], dtype = np.int64)
+		page[timeColumn.name] = np.array(fields[1], dtype = 'datetime64[s]')
+
+		for name, values in zip(columns, fields[2:]):
+			page[name] = np.array(values, dtype = np.float64)
+
+		yield page
+
+		if len(rows) < pageSize:
+			return
+
+		last = rows[-1][0], rows[-1][1]
+
+def readings(connection, components, start, end, columns = None, pageSize = PAGE_SIZE, asFrame = False, partitions = None):
+	"""Stream the readings of a component (or a list of components of one class) in [start, end), one page at a time,
+	as dicts of NumPy arrays or as DataFrames with asFrame. No ORM objects are built."""
+
+	readingClass, componentIds = componentTarget(components)
+
+	for page in readingPages(connection, readingClass, componentIds, start, end, columns, pageSize, partitions):
+		if asFrame:
+			import pandas as pd
+			yield pd.DataFrame(page)
+		else:
+			yield page
+
+def readingsArray(connection, components, start, end, columns = None, pageSize = PAGE_SIZE, partitions = None):
+	"""All the readings of the range in one dict of arrays, for ranges that fit in memory"""
+
+	pages = list(readings(connection, components, start, end, columns, pageSize, partitions = partitions))
+
+	if not pages:
+		readingClass, componentIds = componentTarget(components)
+		idColumn, timeColumn = keyColumns(readingClass.__table__)
+		empty = collections.OrderedDict([(idColumn.name, np.zeros(0, dtype = np.int64)), (timeColumn.name, np.zeros(0, dtype = 'datetime64[s]'))])
+		for name in columns or valueColumns(readingClass.__table__):
+			empty[name] = np.zeros(0)
+		return empty
+
+	return collections.OrderedDict((name, np.concatenate([page[name] for page in pages])) for name in pages[0])
+
+
+#Column projections
+
+_rowClasses = {}
+
+def projectedColumns(readingClass, attributes = None):
+	"""Map the public names of a Reading class ('zoneTemperature', the property around _zoneTemperature) or its DB column
+	names ('ZoneTemperature') to (public name, column) pairs, all the columns when attributes is None"""
+
+	byName = collections.OrderedDict()
+
+	for attribute in inspect(readingClass).column_attrs:
+		column = attribute.columns[0]
+		public = attribute.key.lstrip('_')
+		byName[public] = (public, column)
+		byName.setdefault(column.name, (public, column))
+
+	if attributes is None:
+		return [pair for name, pair in byName.items() if name == pair[0]]
+
+	try:
+		return [byName[name] for name in attributes]
+	except KeyError as e:
+		raise ValueError(readingClass.__name__ + " has no column " + str(e))
+
+def _dtype(column):
+
+	if isinstance(column.type, DateTime):
+		return 'datetime64[s]'
+	elif isinstance(column.type, Integer) and column.primary_key:
+		return np.int64
+	elif isinstance(column.type, (Float, Integer, Boolean)):
+		return np.float64 #NULL is NaN
+
+	return object
+
+def rowClass(readingClass, names):
+	"""Named tuple class for rows of the given public names of a Reading class, built once per projection"""
+
+	key = (readingClass, tuple(names))
+
+	if key not in _rowClasses:
+		_rowClasses[key] = collections.namedtuple(readingClass.__name__ + 'Row', names)
+
+	return _rowClasses[key]
+
+def projection(connection, readingClass, attributes = None, where = None, asTuples = False, chunkSize = PAGE_SIZE):
+	"""Read some columns of a Reading class with a Core select, bypassing ORM instances.
+	Returns a NumPy structured array with one field per public name (time stamps as datetime64[s], NULL numbers as NaN),
+	or a list of named tuples with asTuples. where is an optional SQL expression on the class attributes."""
+
+	pairs = projectedColumns(readingClass, attributes)
+	names = [public for public, column in pairs]
+	query = select(*[column for public, column in pairs])
+
+	if where is not None:
+		query = query.where(where)
+
+	result = connection.execution_options(stream_results = True, yield_per = chunkSize).execute(query)
+
+	if asTuples:
+		Row = rowClass(readingClass, names)
+		return [Row._make(row) for row in result]
+
+	dtype = np.dtype([(name, _dtype(column)) for name, column in pairs])
+	chunks = []
+
+	for rows in result.partitions():
+		chunk = np.empty(len(rows), dtype = dtype)
+		for name, values in zip(names, zip(*rows)):
+			chunk[name] = np.array(values, dtype = dtype[name])
+		chunks.append(chunk)
+
+	return np.concatenate(chunks) if chunks else np.empty(0, dtype = dtype)
+
+
+def benchmark(numRows = 300000):
+	"""Rows per second and peak memory of session.query(ThermafuserReading) against the projection, on SQLite in memory"""
+
+	import sqlalchemy
+	from sqlalchemy.orm import Session
+	import hvacDB
+	import readingLoader
+
+	engine = sqlalchemy.create_engine('sqlite://')
+	hvacDB.createSchema(engine)
+
+	numComponents = 10
+	epochs = int((datetime(2017, 3, 1) - readingLoader.EPOCH).total_seconds()) + 300*np.arange(numRows//numComponents, dtype = np.int64)
+	ids = np.repeat(np.arange(1, numComponents + 1), len(epochs))
+	columns = dict((name, np.random.rand(len(ids))) for name in ['ZoneTemperature', 'SupplyAir', 'AirflowFeedback', 'OccupiedCoolingSetpoint'])
+	print("loaded " + str(readingLoader.loadBlocks(engine, [readingLoader.ReadingBlock(ThermafuserReading, ids, np.tile(epochs, numComponents), columns)])))
+
+	def measure(read):
+		#Timed without tracemalloc, it slows allocation heavy code down several times
+		begin = time.time()
+		count = len(read())
+		elapsed = time.time() - begin
+
+		tracemalloc.start()
+		read()
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+		return count, elapsed, peak
+
+	with Session(engine) as session:
+		def ormRead():
+			readings = session.query(ThermafuserReading).all()
+			session.expunge_all()
+			return readings
+
+		results = [('ORM instances', measure(ormRead))]
+
+		connection = session.connection()
+		results.append(('structured array, all columns', measure(lambda: projection(connection, ThermafuserReading))))
+		results.append(('structured array, 3 columns', measure(lambda: projection(connection, ThermafuserReading,
+			['thermafuserId', 'time_stamp', 'zoneTemperature']))))
+		results.append(('named tuples, 3 columns', measure(lambda: projection(connection, ThermafuserReading,
+			['thermafuserId', 'time_stamp', 'zoneTemperature'], asTuples = True))))
+
+	for label, (count, elapsed, peak) in results:
+		print("%-30s %d rows in %.2f s (%.0f rows/s), peak %.0f MB" % (label, count, elapsed, count/elapsed, peak/1e6))
+
+
+if __name__ == '__main__':
+	benchmark()
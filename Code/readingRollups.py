@@ -0,0 +1,263 @@
+import time
+import collections
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import Table, Column, Integer, String, Float, Boolean, DateTime, select, and_
+
+import hvacDBMapping
+import readingLoader
+from readingLoader import EPOCH, keyColumns
+
+HOUR = 3600
+DAY = 86400
+
+#M2 is the sum of the squared deviations from the bucket's Mean, buckets combine with the pooled (mean, M2) formula
+#instead of a sum of squares that loses the variance to cancellation when the mean is large
+STAT_COLUMNS = ['SampleCount', 'Minimum', 'Maximum', 'Mean', 'M2', 'LastValue', 'LastTime']
+
+def _rollupTable(name):
+
+	return Table(name, hvacDBMapping.Base.metadata,
+		Column('ReadingTable', String(64), primary_key = True),
+		Column('ComponentId', Integer, primary_key = True),
+		Column('ColumnName', String(64), primary_key = True),
+		Column('PeriodStart', DateTime, primary_key = True),
+		Column('SampleCount', Integer),
+		Column('Minimum', Float),
+		Column('Maximum', Float),
+		Column('Mean', Float),
+		Column('M2', Float),
+		Column('LastValue', Float),
+		Column('LastTime', DateTime))
+
+#One row per (Reading table, component, column, hour or day), created with the rest of the schema
+hourlyRollups = _rollupTable('Reading_Rollup_Hourly')
+dailyRollups = _rollupTable('Reading_Rollup_Daily')
+
+Rollup = collections.namedtuple('Rollup', ['ids', 'periods', 'count', 'minimum', 'maximum', 'mean', 'm2', 'last', 'lastEpoch'])
+Rollup.__doc__ = """Aggregates of one column, one entry per (component id, period start epoch)"""
+
+
+def toEpochs(stamps):
+	"""Time stamps read from the DB as int64 epoch seconds"""
+
+	return np.array(stamps, dtype = 'datetime64[s]').astype(np.int64)
+
+def toDatetime(epoch):
+
+	return EPOCH + timedelta(seconds = int(epoch))
+
+def valueColumns(table):
+	"""Numeric value columns of a Reading table, the ones rollups are kept for"""
+
+	return [column.name for column in table.columns if not column.primary_key and isinstance(column.type, (Float, Integer, Boolean))]
+
+def aggregate(ids, epochs, values, period):
+	"""Count, min, max, mean, M2 (sum of squared deviations from the mean) and last value per (id, period) of the non NaN samples"""
+
+	ids = np.asarray(ids, dtype = np.int64)
+	epochs = np.asarray(epochs, dtype = np.int64)
+	values = np.asarray(values, dtype = np.float64)
+
+	valid = ~np.isnan(values)
+	ids, epochs, values = ids[valid], epochs[valid], values[valid]
+
+	periods = epochs - epochs % period
+	order = np.lexsort((epochs, periods, ids))
+	ids, periods, epochs, values = ids[order], periods[order], epochs[order], values[order]
+
+	if not len(values):
+		return Rollup(ids, periods, ids, values, values, values, values, values, epochs)
+
+	starts = np.flatnonzero(np.r_[True, (ids[1:] != ids[:-1]) | (periods[1:] != periods[:-1])])
+	ends = np.r_[starts[1:], len(ids)] - 1
+	count = np.diff(np.r_[starts, len(ids)])
+
+	#Two passes, the deviations are taken from the bucket's own mean
+	mean = np.add.reduceat(values, starts)/count
+	deviations = values - np.repeat(mean, count)
+
+	return Rollup(ids[starts], periods[starts], count, np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts),
+		mean, np.add.reduceat(deviations*deviations, starts), values[ends], epochs[ends])
+
+def merge(ids, periods, rollups, period):
+	"""Combine finer rollups (e.g. hourly) into coarser ones (e.g. daily), rollups maps every STAT_COLUMNS name to an array"""
+
+	ids = np.asarray(ids, dtype = np.int64)
+	periods = np.asarray(periods, dtype = np.int64)
+	coarse = periods - periods % period
+
+	order = np.lexsort((rollups['LastTime'], coarse, ids))
+	ids, coarse = ids[order], coarse[order]
+	stats = dict((name, np.asarray(values)[order]) for name, values in rollups.items())
+
+	starts = np.flatnonzero(np.r_[True, (ids[1:] != ids[:-1]) | (coarse[1:] != coarse[:-1])])
+	ends = np.r_[starts[1:], len(ids)] - 1
+	count = np.add.reduceat(stats['SampleCount'], starts)
+	mean = np.add.reduceat(stats['Mean']*stats['SampleCount'], starts)/count
+
+	#Pooled M2: the parts' own M2 plus their count times the squared distance of their mean to the combined one
+	shift = stats['Mean'] - np.repeat(mean, np.diff(np.r_[starts, len(ids)]))
+	m2 = np.add.reduceat(stats['M2'] + stats['SampleCount']*shift*shift, starts)
+
+	return Rollup(ids[starts], coarse[starts], count, np.minimum.reduceat(stats['Minimum'], starts), np.maximum.reduceat(stats['Maximum'], starts),
+		mean, m2, stats['LastValue'][ends], stats['LastTime'][ends])
+
+def _rollupRows(tableName, column, rollup):
+
+	return [{'ReadingTable': tableName, 'ComponentId': componentId, 'ColumnName': column, 'PeriodStart': toDatetime(periodStart),
+		'SampleCount': count, 'Minimum': minimum, 'Maximum': maximum, 'Mean': mean, 'M2': m2, 'LastValue': last,
+		'LastTime': toDatetime(lastEpoch)}
+		for componentId, periodStart, count, minimum, maximum, mean, m2, last, lastEpoch in zip(*[np.asarray(field).tolist() for field in rollup])]
+
+def _replace(connection, rollupTable, tableName, componentIds, start, end, rows, chunkSize):
+	"""Replace the rollups of the components in [start, end), buckets that lost all their samples disappear"""
+
+	connection.execute(rollupTable.delete().where(and_(rollupTable.c.ReadingTable == tableName, rollupTable.c.ComponentId.in_(componentIds),
+		rollupTable.c.PeriodStart >= start, rollupTable.c.PeriodStart < end)))
+
+	for first in range(0, len(rows), chunkSize):
+		connection.execute(rollupTable.insert(), rows[first:first + chunkSize])
+
+def refresh(connection, readingClass, componentIds, start, end, partitions = None, chunkSize = readingLoader.CHUNK_SIZE):
+	"""Recompute the hourly rollups of the components over the hours touched by [start, end] from the raw readings,
+	and the daily rollups of the days touched from the hourly ones. Only the touched buckets are read and written,
+	so it can run after every load and running it twice changes nothing. With a readingPartitions.PartitionManager
+	the raw readings are read through it. Returns the number of rollup rows written."""
+
+	table = readingClass.__table__
+	idColumn, timeColumn = keyColumns(table)
+	columns = valueColumns(table)
+	componentIds = sorted(set(int(componentId) for componentId in componentIds))
+
+	firstHour = start - timedelta(seconds = (start - EPOCH).total_seconds() % HOUR)
+	lastHour = end - timedelta(seconds = (end - EPOCH).total_seconds() % HOUR) + timedelta(seconds = HOUR)
+	firstDay = datetime(firstHour.year, firstHour.month, firstHour.day)
+	lastDay = datetime(end.year, end.month, end.day) + timedelta(1)
+
+	names = [idColumn.name, timeColumn.name] + columns
+
+	if partitions is not None:
+		source = partitions.select(connection, table, firstHour, lastHour, names).subquery()
+	else:
+		source = select(*[table.c[name] for name in names]).where(and_(timeColumn >= firstHour, timeColumn < lastHour)).subquery()
+
+	raw = connection.execute(select(source).where(source.c[idColumn.name].in_(componentIds))).all()
+
+	fields = list(zip(*raw)) if raw else [()]*len(names)
+	ids = np.array(fields[0], dtype = np.int64)
+	epochs = toEpochs(fields[1])
+
+	rows = []
+
+	for name, values in zip(columns, fields[2:]):
+		values = np.array([np.nan if value is None else float(value) for value in values])
+		rows.extend(_rollupRows(table.name, name, aggregate(ids, epochs, values, HOUR)))
+
+	_replace(connection, hourlyRollups, table.name, componentIds, firstHour, lastHour, rows, chunkSize)
+	written = len(rows)
+
+	hourly = connection.execute(select(hourlyRollups).where(and_(hourlyRollups.c.ReadingTable == table.name,
+		hourlyRollups.c.ComponentId.in_(componentIds), hourlyRollups.c.PeriodStart >= firstDay, hourlyRollups.c.PeriodStart < lastDay))
+		.order_by(hourlyRollups.c.ColumnName)).mappings().all()
+
+	byColumn = collections.defaultdict(list)
+	for row in hourly:
+		byColumn[row['ColumnName']].append(row)
+
+	rows = []
+
+	for name, hours in byColumn.items():
+		stats = dict((stat, np.array([row[stat] for row in hours], dtype = np.float64)) for stat in STAT_COLUMNS if stat != 'LastTime')
+		stats['LastTime'] = toEpochs([row['LastTime'] for row in hours])
+		daily = merge([row['ComponentId'] for row in hours], toEpochs([row['PeriodStart'] for row in hours]), stats, DAY)
+		rows.extend(_rollupRows(table.name, name, daily._replace(count = daily.count.astype(np.int64))))
+
+	_replace(connection, dailyRollups, table.name, componentIds, firstDay, lastDay, rows, chunkSize)
+
+	return written + len(rows)
+
+def refreshBlock(connection, block, partitions = None):
+	"""Refresh the rollups touched by a ReadingBlock that was just loaded"""
+
+	if len(block.ids) == 0:
+		return 0
+
+	return refresh(connection, block.readingClass, np.unique(block.ids), toDatetime(np.min(block.epochs)), toDatetime(np.max(block.epochs)),
+		partitions)
+
+def summarize(connection, readingClass, column, start, end, componentIds = None, resolution = DAY):
+	"""Per component count, mean, std, min, max and last value of a column over [start, end), read from the
+	daily (or hourly) rollups instead of the raw readings. The range is taken in whole days (hours)."""
+
+	rollupTable = dailyRollups if resolution == DAY else hourlyRollups
+	conditions = [rollupTable.c.ReadingTable == readingClass.__tablename__, rollupTable.c.ColumnName == column,
+		rollupTable.c.PeriodStart >= start, rollupTable.c.PeriodStart < end]
+
+	if componentIds is not None:
+		conditions.append(rollupTable.c.ComponentId.in_(list(componentIds)))
+
+	rows = connection.execute(select(rollupTable).where(and_(*conditions))).mappings().all()
+
+	summary = collections.OrderedDict()
+
+	if not rows:
+		return summary
+
+	stats = dict((stat, np.array([row[stat] for row in rows], dtype = np.float64)) for stat in STAT_COLUMNS if stat != 'LastTime')
+	stats['LastTime'] = toEpochs([row['LastTime'] for row in rows])
+	total = merge([row['ComponentId'] for row in rows], np.zeros(len(rows), dtype = np.int64), stats, 1 << 62)
+
+	for componentId, count, minimum, maximum, mean, m2, last in zip(total.ids.tolist(), total.count.tolist(), total.minimum.tolist(),
+		total.maximum.tolist(), total.mean.tolist(), total.m2.tolist(), total.last.tolist()):
+
+		variance = m2/(count - 1) if count > 1 else float('nan')
+		summary[componentId] = {'count': int(count), 'mean': mean, 'std': max(variance, 0.0)**0.5 if count > 1 else float('nan'),
+			'min': minimum, 'max': maximum, 'last': last}
+
+	return summary
+
+
+def benchmark(numComponents = 40, days = 30):
+	"""Per component statistics of a month of 5 minute thermafuser readings, from the raw table and from the daily rollups"""
+
+	import sqlalchemy
+
+	engine = sqlalchemy.create_engine('sqlite://')
+	hvacDBMapping.Base.metadata.create_all(engine)
+
+	start = datetime(2017, 3, 1)
+	epochs = int((start - EPOCH).total_seconds()) + 300*np.arange(days*288, dtype = np.int64)
+	ids = np.repeat(np.arange(1, numComponents + 1), len(epochs))
+	block = readingLoader.ReadingBlock(hvacDBMapping.ThermafuserReading, ids, np.tile(epochs, numComponents),
+		{'ZoneTemperature': 70 + np.random.standard_normal(len(ids))})
+
+	print("loaded " + str(readingLoader.loadBlocks(engine, [block])))
+
+	begin = time.time()
+	with engine.begin() as connection:
+		written = refreshBlock(connection, block)
+	refreshTime = time.time() - begin
+
+	table = hvacDBMapping.ThermafuserReading.__table__
+	end = start + timedelta(days)
+
+	with engine.connect() as connection:
+		begin = time.time()
+		raw = connection.execute(select(table.c.ThermafuserId, table.c.ZoneTemperature).where(and_(table.c.Time_stamp >= start,
+			table.c.Time_stamp < end))).all()
+		rawIds, values = [np.array(field) for field in zip(*raw)]
+		rawStats = [(values[rawIds == componentId].mean(), values[rawIds == componentId].std(ddof = 1)) for componentId in np.unique(rawIds)]
+		rawTime = time.time() - begin
+
+		begin = time.time()
+		summary = summarize(connection, hvacDBMapping.ThermafuserReading, 'ZoneTemperature', start, end)
+		rollupTime = time.time() - begin
+
+	print("%d raw rows, %d rollup rows written in %.2f s. Statistics of %d components: raw scan %.1f ms, daily rollups %.1f ms"
+		% (len(ids), written, refreshTime, len(summary), rawTime*1000, rollupTime*1000))
+
+
+if __name__ == '__main__':
+	benchmark()
@@ -1,12 +1,12 @@
 #!/usr/bin/python
-import MySQLdb
+import hvacDB
 
 def connect_db():
 
 	db = None
 
 	try:
-		db = MySQLdb.connect(host="localhost", user="dlaredorazo", passwd="@Dexsys13", db="HVAC2")
+		db = hvacDB.getEngine(database = "HVAC2").raw_connection() #pooled DBAPI connection
 		cursor = db.cursor()
 		cursor.execute("SELECT VERSION()")
 		results = cursor.fetchone()
@@ -0,0 +1,54 @@
+import os
+
+from sqlalchemy.orm import Session
+
+import hvacDB
+import componentSync
+import componentTopology
+import componentDiscovery
+import pointInventory
+from hvacDBMapping import AHU, VAV, Thermafuser
+
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'csv_files')
+
+
+def _engine():
+	"""Fresh in-memory database with the Zone3+4 components, one thermafuser linked to a VAV"""
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+	points = pointInventory.PointInventory.fromCsv([os.path.join(CSV_DIR, 'Zone3.csv'), os.path.join(CSV_DIR, 'Zone4.csv')], ['3', '4'])
+
+	with engine.begin() as connection:
+		componentSync.sync(connection, componentDiscovery.discover(points))
+
+	with Session(engine) as session:
+		session.query(Thermafuser).order_by(Thermafuser._thermafuserId).first().VAVId = session.query(VAV).first().VAVId
+		session.commit()
+
+	return engine
+
+
+def test_load_topology_query_count():
+
+	engine = _engine()
+
+	with Session(engine) as session, componentTopology.countQueries(engine) as statements:
+		topology = componentTopology.loadTopology(session)
+
+	assert len(statements) <= componentTopology.TOPOLOGY_QUERIES
+
+	with Session(engine) as session:
+		assert topology.counts()['Thermafuser'] == session.query(Thermafuser).count()
+		assert topology.counts()['VAV'] == session.query(VAV).count()
+		assert sum(len(vav.thermafusers) for ahu in topology.ahus for vav in ahu.vavs) == 1
+
+def test_load_topology_keeps_caller_objects():
+
+	engine = _engine()
+
+	with Session(engine) as session:
+		ahu = session.query(AHU).order_by(AHU._AHUNumber).first()
+		topology = componentTopology.loadTopology(session)
+
+		assert ahu in session
+		assert len(ahu.fans) == len(topology.ahu(ahu.AHUNumber).fans)
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+import fileFeatures
+from fileFeatures import STATISTICS
+
+DAY = """Time,path0,path1
+2017-03-01 00:00:00,1.0,10.0
+2017-03-01 00:05:00,2.0,
+2017-03-01 00:10:00,3.0,30.0
+"""
+
+
+def _write(directory, name, text):
+
+	filepath = os.path.join(str(directory), name)
+
+	with open(filepath, 'w') as csvfile:
+		csvfile.write(text)
+
+	return filepath
+
+
+def test_summarize_matches_describe():
+
+	values = np.array([[1.0, 10.0], [2.0, np.nan], [3.0, 30.0]])
+	summary = fileFeatures.summarize(values)
+
+	assert summary.shape == (len(STATISTICS), 2)
+	assert np.allclose(summary[:, 0], [3, 2, 1, 1, 1.5, 2, 2.5, 3])
+	assert summary[0, 1] == 2 and summary[1, 1] == 20
+
+def test_summarize_empty():
+
+	for shape in [(0, 3), (4, 0), (0, 0)]:
+		summary = fileFeatures.summarize(np.empty(shape))
+
+		assert summary.shape == (len(STATISTICS), shape[1])
+		assert np.all(summary[0] == 0) and np.all(np.isnan(summary[1:]))
+
+def test_files_without_data_columns_or_rows(tmp_path):
+
+	headerOnly = fileFeatures.fileFeatures(_write(tmp_path, 'header.csv', "Time,path0,path1\n"))
+	timeOnly = fileFeatures.fileFeatures(_write(tmp_path, 'time.csv', "Time\n2017-03-02 00:00:00\n2017-03-02 00:05:00\n"))
+	empty = fileFeatures.fileFeatures(_write(tmp_path, 'empty.csv', ""))
+
+	assert headerOnly == fileFeatures.FileFeatures(None, [], [])
+	assert empty == fileFeatures.FileFeatures(None, [], [])
+	assert timeOnly == fileFeatures.FileFeatures('2017-03-02', [], [])
+
+def test_extract_skips_empty_files_in_the_pool(tmp_path):
+
+	filepaths = [_write(tmp_path, 'day.csv', DAY), _write(tmp_path, 'header.csv', "Time,path0,path1\n"),
+		_write(tmp_path, 'time.csv', "Time\n")]
+	cachePath = os.path.join(str(tmp_path), 'cache', 'features.json')
+
+	features = fileFeatures.extractFeatures(filepaths, cachePath, maxWorkers = 2)
+	frame = fileFeatures.featureFrame(features)
+
+	assert list(frame.columns) == ['2017-03-01']
+	assert frame['2017-03-01']['path0_mean'] == 2.0
+	assert fileFeatures.extractFeatures(filepaths, cachePath, maxWorkers = 2) == features
+	#Only the cache is left in its directory, no temporary files
+	assert os.listdir(os.path.dirname(cachePath)) == ['features.json']
@@ -0,0 +1,68 @@
+from sqlalchemy import select, func
+
+import hvacDB
+import inventoryLoader
+from hvacDBMapping import DataPoint
+
+ZONE_CSV = """server,location,branch,sub_branch,control_program,point,path
+10.20.0.47,Science & Engineering 2: 0206,First Floor,Short bar,1C1A,Air Flow Feedback,#1c1a_thermafuser/m073
+10.20.0.47,Science & Engineering 2: 0206,First Floor,Long bar,Breakout 120J VAV-1-23,Cool Stpt,#vav-1-23/cl_stpt_tn
+10.20.0.47,Science & Engineering 2: 0206,First  Floor ,Annex,AHU-1,Fan Speed,#ahu-1/fan_speed
+10.20.0.47,Science & Engineering 2: 0206,First Floor,Short Bar,1C1A,clg setpt
+"""
+
+
+def _zoneCsv(tmp_path):
+
+	filepath = tmp_path / 'Zone4.csv'
+	filepath.write_text(ZONE_CSV)
+
+	return str(filepath)
+
+def _dataPoints(engine):
+
+	table = DataPoint.__table__
+
+	with engine.connect() as connection:
+		return connection.execute(select(table).order_by(table.c.Path)).mappings().all()
+
+
+def test_read_zone_csv_normalizes_rows(tmp_path):
+
+	rows = dict((row['Path'], row) for row in inventoryLoader.readZoneCsv(_zoneCsv(tmp_path), 4))
+
+	assert sorted(rows) == ['#1c1a_thermafuser/m073', '#ahu-1/fan_speed', '#vav-1-23/cl_stpt_tn']
+	assert rows['#vav-1-23/cl_stpt_tn']['ControlProgram'] == 'VAV-1-23'
+	assert rows['#1c1a_thermafuser/m073']['ControlProgram'] == '1C1A'
+	assert rows['#1c1a_thermafuser/m073']['SubBranch'] == 'Short Bar'
+	assert rows['#vav-1-23/cl_stpt_tn']['SubBranch'] == 'Long Bar'
+	assert rows['#ahu-1/fan_speed']['SubBranch'] == 'Annex'
+	assert rows['#ahu-1/fan_speed']['Branch'] == 'First Floor'
+	assert rows['#ahu-1/fan_speed']['Zone'] == '4'
+
+def test_load_zone_csv_twice_is_idempotent(tmp_path):
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+	filepath = _zoneCsv(tmp_path)
+
+	assert inventoryLoader.loadZoneCsvs(engine, [filepath], ['4']).rows == 3
+	first = _dataPoints(engine)
+	assert inventoryLoader.loadZoneCsvs(engine, [filepath], ['4']).rows == 3
+
+	assert len(first) == 3
+	assert _dataPoints(engine) == first
+
+def test_load_overwrites_changed_rows(tmp_path):
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+	filepath = _zoneCsv(tmp_path)
+
+	inventoryLoader.loadZoneCsvs(engine, [filepath], ['4'])
+	(tmp_path / 'Zone4.csv').write_text(ZONE_CSV.replace('Fan Speed', 'Supply Fan Speed').replace('Short bar', ''))
+	inventoryLoader.loadZoneCsvs(engine, [filepath], ['4'])
+
+	rows = dict((row['Path'], row) for row in _dataPoints(engine))
+
+	assert len(rows) == 3
+	assert rows['#ahu-1/fan_speed']['Point'] == 'Supply Fan Speed'
+	assert rows['#1c1a_thermafuser/m073']['SubBranch'] is None
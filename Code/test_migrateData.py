@@ -0,0 +1,61 @@
+import os
+
+from sqlalchemy.orm import Session
+
+import hvacDB
+import migrateData
+import inventoryLoader
+import componentDiscovery
+import pointInventory
+from hvacDBMapping import Thermafuser
+
+CSV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'csv_files')
+
+
+def _legacyEngine():
+	"""Fresh in-memory database with the Zone4 DataPoints and its thermafusers stored under their old positional numbers.
+	Returns the engine and the map from the old to the current thermafuser numbers."""
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+	filepath = os.path.join(CSV_DIR, 'Zone4.csv')
+	inventoryLoader.loadZoneCsvs(engine, [filepath], ['4'])
+
+	assert migrateData.StoreAHUDataPoints(Session(engine))
+
+	topology = componentDiscovery.discover(pointInventory.PointInventory.fromCsv([filepath], ['4']))
+	legacy = dict((key[1], old[1]) for old, key in componentDiscovery.legacyThermafuserRenames(topology).items())
+
+	with Session(engine) as session:
+		for thermafuser in session.query(Thermafuser):
+			thermafuser._thermafuserNumber = legacy[thermafuser._thermafuserNumber]
+		session.commit()
+
+	return engine, dict((old, new) for new, old in legacy.items())
+
+def _thermafusers(engine):
+
+	with Session(engine) as session:
+		return dict((thermafuser._thermafuserId, thermafuser._thermafuserNumber) for thermafuser in session.query(Thermafuser))
+
+
+def test_legacy_numbers_migrated_in_place_on_request():
+
+	engine, current = _legacyEngine()
+	before = _thermafusers(engine)
+
+	assert migrateData.StoreAHUDataPoints(Session(engine), migrateLegacyNumbers = True)
+
+	assert _thermafusers(engine) == dict((thermafuserId, current[number]) for thermafuserId, number in before.items())
+
+def test_legacy_numbers_left_alone_by_default():
+
+	engine, current = _legacyEngine()
+	before = _thermafusers(engine)
+
+	assert migrateData.StoreAHUDataPoints(Session(engine))
+
+	after = _thermafusers(engine)
+
+	#The legacy rows are pruned and the thermafusers stored again under new ids
+	assert sorted(after.values()) == sorted(current.values())
+	assert not set(after) & set(before)
@@ -0,0 +1,92 @@
+import numpy
+
+import pmvIndex
+from pmvIndex import CLO, MET
+
+
+def _samples(numSamples, seed):
+	"""Random indoor conditions inside the grid"""
+
+	random = numpy.random.RandomState(seed)
+	Tai = random.uniform(12, 33, numSamples)
+	Tr = Tai + random.uniform(-2, 2, numSamples)
+	Hai = random.uniform(0, 100, numSamples)
+	Va = random.uniform(0, 1.5, numSamples)
+
+	return Tai, Tr, Hai, Va
+
+
+def test_iso7730_table_d1():
+
+	pmvIndex.check()
+
+
+def test_newton_matches_brute_force():
+
+	random = numpy.random.RandomState(0)
+	numSamples = 20
+	Tai = random.uniform(18, 30, numSamples)
+	Tr = Tai + random.uniform(-2, 2, numSamples)
+	Va = random.uniform(0.05, 0.5, numSamples)
+	Icl = random.uniform(0.3, 1.2, numSamples)*CLO
+	M = random.uniform(1.0, 2.0, numSamples)*MET
+	fcl = pmvIndex.ratioBodySurfaceAreaCoveredComputation(Icl)
+
+	brute = numpy.array([pmvIndex.TclBruteForce(*sample) for sample in zip(Tai, Tr, Va, Icl, M)])
+	newton, iterations = pmvIndex.surfaceTemperatureClothingNewton(M, 0, Icl, fcl, Tai, Tr, Va)
+
+	assert not numpy.isnan(brute).any()
+	assert numpy.max(numpy.abs(newton - brute)) < 1e-3
+	assert numpy.max(numpy.abs(pmvIndex.TclResidual(newton, M, 0, Icl, fcl, Tai, Tr, Va))) < 1e-6
+	assert iterations.max() <= pmvIndex.NEWTON_MAX_ITERATIONS
+
+
+def test_grid_error_within_tolerance():
+
+	for clo, met in [(0.5, 1.1), (1.0, 2.0)]:
+		grid = pmvIndex.PmvGrid(clo*CLO, met*MET, validationSamples = 2000)
+		Tai, Tr, Hai, Va = _samples(2000, 1)
+		exact = pmvIndex.pmvComputation(Tai, Tr, Hai, Va, clo*CLO, met*MET)
+
+		assert grid.error <= pmvIndex.GRID_TOLERANCE
+		assert numpy.max(numpy.abs(grid.pmv(Tai, Tr, Hai, Va) - exact)) <= pmvIndex.GRID_TOLERANCE
+
+
+def test_grid_fallback_outside_and_nan():
+
+	Icl, M = 0.7*CLO, 1.4*MET
+	grid = pmvIndex.PmvGrid(Icl, M, validationSamples = 100)
+
+	#Above the air temperature, radiant temperature and air speed ranges, below the air temperature range
+	Tai = numpy.array([40.0, 22.0, 22.0, 5.0, numpy.nan, 22.0])
+	Tr = numpy.array([22.0, 38.0, 22.0, 5.0, 22.0, 22.0])
+	Hai = numpy.array([50.0, 50.0, 50.0, 50.0, 50.0, numpy.nan])
+	Va = numpy.array([0.1, 0.1, 2.0, 0.1, 0.1, 0.1])
+
+	pmv = grid.pmv(Tai, Tr, Hai, Va)
+	exact = pmvIndex.pmvComputation(Tai[:4], Tr[:4], Hai[:4], Va[:4], Icl, M)
+
+	assert numpy.max(numpy.abs(pmv[:4] - exact)) < 1e-9
+	assert numpy.isnan(pmv[4:]).all()
+
+
+def test_grid_cache_evicts_least_recently_used(monkeypatch):
+
+	class Grid(object):
+
+		def __init__(self, Icl, M, W = 0):
+			self.key = (Icl, M, W)
+
+	monkeypatch.setattr(pmvIndex, 'PmvGrid', Grid)
+	monkeypatch.setattr(pmvIndex, 'GRID_CACHE_SIZE', 2)
+	monkeypatch.setattr(pmvIndex, '_grids', pmvIndex.collections.OrderedDict())
+
+	first = pmvIndex.pmvGrid(0.5*CLO, 1.0*MET)
+	second = pmvIndex.pmvGrid(0.5*CLO, 1.2*MET)
+
+	assert pmvIndex.pmvGrid(0.5*CLO, 1.0*MET) is first
+	pmvIndex.pmvGrid(0.5*CLO, 1.4*MET)
+
+	assert len(pmvIndex._grids) == 2
+	assert pmvIndex.pmvGrid(0.5*CLO, 1.0*MET) is first
+	assert pmvIndex.pmvGrid(0.5*CLO, 1.2*MET) is not second
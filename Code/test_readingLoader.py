@@ -0,0 +1,62 @@
+import numpy as np
+import sqlalchemy
+from datetime import datetime
+
+import hvacDB
+import readingLoader
+from hvacDBMapping import ThermafuserReading
+
+
+def _engine():
+
+	engine = sqlalchemy.create_engine('sqlite://')
+	hvacDB.createSchema(engine)
+
+	return engine
+
+def _readings(engine):
+
+	with engine.connect() as connection:
+		return connection.execute(sqlalchemy.select(ThermafuserReading.__table__)
+			.order_by(ThermafuserReading.__table__.c.Time_stamp)).mappings().all()
+
+def _block(epochs, **columns):
+
+	return readingLoader.ReadingBlock(ThermafuserReading, np.ones(len(epochs), dtype = np.int64), np.asarray(epochs, dtype = np.int64),
+		dict((name, np.asarray(values, dtype = np.float64)) for name, values in columns.items()))
+
+
+def test_overlapping_load_keeps_existing_values():
+
+	engine = _engine()
+
+	readingLoader.loadBlocks(engine, [_block([0, 300], ZoneTemperature = [70.0, 71.0], SupplyAir = [55.0, 56.0])])
+	#Second block overlaps the slot 300, lacks ZoneTemperature and has a missing SupplyAir there
+	readingLoader.loadBlocks(engine, [_block([300, 600], SupplyAir = [np.nan, 57.0], CO2Input = [400.0, 410.0])])
+
+	rows = _readings(engine)
+
+	assert [row['Time_stamp'] for row in rows] == [datetime(1970, 1, 1, 0, 0), datetime(1970, 1, 1, 0, 5), datetime(1970, 1, 1, 0, 10)]
+	assert [row['ZoneTemperature'] for row in rows] == [70.0, 71.0, None]
+	assert [row['SupplyAir'] for row in rows] == [55.0, 56.0, 57.0]
+	assert [row['CO2Input'] for row in rows] == [None, 400.0, 410.0]
+
+def test_overlapping_load_updates_given_values():
+
+	engine = _engine()
+
+	readingLoader.loadBlocks(engine, [_block([0], ZoneTemperature = [70.0])])
+	readingLoader.loadBlocks(engine, [_block([0], ZoneTemperature = [72.5])])
+
+	assert [row['ZoneTemperature'] for row in _readings(engine)] == [72.5]
+
+def test_reload_is_idempotent():
+
+	engine = _engine()
+	block = _block([0, 300], ZoneTemperature = [70.0, np.nan])
+
+	readingLoader.loadBlocks(engine, [block])
+	first = _readings(engine)
+	readingLoader.loadBlocks(engine, [block])
+
+	assert _readings(engine) == first
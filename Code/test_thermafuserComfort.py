@@ -0,0 +1,61 @@
+import numpy as np
+from datetime import datetime
+from sqlalchemy import select, func
+
+import hvacDB
+import readingLoader
+import thermafuserComfort
+from hvacDBMapping import ThermafuserReading
+from thermafuserComfort import comfortTable
+
+START = int((datetime(2017, 3, 1) - readingLoader.EPOCH).total_seconds())
+
+
+def _block(thermafuserId, slots):
+
+	epochs = START + 300*np.asarray(slots, dtype = np.int64)
+
+	return readingLoader.ReadingBlock(ThermafuserReading, np.full(len(epochs), thermafuserId, dtype = np.int64), epochs,
+		{'ZoneTemperature': np.full(len(epochs), 72.0), 'AirflowFeedback': np.full(len(epochs), 200.0),
+		'MaxAirflow': np.full(len(epochs), 400.0)})
+
+def _comfortRows(engine):
+
+	with engine.connect() as connection:
+		return connection.execute(select(comfortTable.c.ThermafuserId, func.count()).group_by(comfortTable.c.ThermafuserId)
+			.order_by(comfortTable.c.ThermafuserId)).all()
+
+
+def test_memory_schema_has_comfort_table():
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+
+	with engine.connect() as connection:
+		assert connection.execute(select(func.count()).select_from(comfortTable)).scalar() == 0
+
+def test_load_computes_comfort_of_new_readings():
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+
+	readingLoader.loadBlocks(engine, [_block(1, range(12)), _block(2, range(12))], comfort = True)
+	readingLoader.loadBlocks(engine, [_block(2, range(12, 24))], comfort = True)
+
+	assert _comfortRows(engine) == [(1, 12), (2, 24)]
+
+def test_stale_thermafuser_does_not_hold_back_the_others():
+
+	engine = hvacDB.createEngine(hvacDB.MEMORY_PROFILE)
+
+	#Thermafuser 1 stopped reporting a day before the others
+	readingLoader.loadBlocks(engine, [_block(1, range(12)), _block(2, range(288, 300)), _block(3, range(5))])
+
+	with engine.begin() as connection:
+		assert thermafuserComfort.updateComfort(connection).rows == 29
+
+	readingLoader.loadBlocks(engine, [_block(2, range(300, 310)), _block(3, range(5, 8)), _block(4, range(300, 302))])
+
+	with engine.begin() as connection:
+		assert thermafuserComfort.updateComfort(connection).rows == 15
+		assert thermafuserComfort.updateComfort(connection).rows == 0
+
+	assert _comfortRows(engine) == [(1, 12), (2, 22), (3, 8), (4, 2)]
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import requests
+import zeep.exceptions
+
+import trendPull
+import trendClient
+
+END = datetime(2017, 3, 2)
+REQUEST = trendPull.TrendRequest('#fake_1/m073', 'FAKE', END - timedelta(hours = 1), END)
+
+
+class FailingService(trendPull.FakeTrendService):
+	"""Fake service that raises the given errors on its first calls"""
+
+	def __init__(self, errors):
+
+		trendPull.FakeTrendService.__init__(self, latency = 0)
+		self._errors = list(errors)
+
+	def getTrendData(self, *args):
+
+		with self._lock:
+			error = self._errors.pop(0) if self._errors else None
+
+		if error is not None:
+			raise error
+
+		return trendPull.FakeTrendService.getTrendData(self, *args)
+
+
+def _fetch(errors):
+	"""Fetch REQUEST through a factory with the error handling of trendClientFactory, return the result and the
+	clients that were discarded"""
+
+	service = FailingService(errors)
+	shared = trendClient.trendClientFactory('localhost')
+	discarded = []
+
+	def factory(timeout):
+		return service
+
+	factory.discard = discarded.append
+	factory.transportErrors = shared.transportErrors
+	factory.fatalErrors = shared.fatalErrors
+
+	return trendPull.TrendPuller(factory, maxWorkers = 1, backoff = 0).fetch(REQUEST), discarded
+
+
+def test_fault_is_not_retried():
+
+	result, discarded = _fetch([zeep.exceptions.Fault("unknown path")])
+
+	assert result.attempts == 1 and isinstance(result.error, zeep.exceptions.Fault)
+	assert discarded == []
+
+def test_connection_error_replaces_client():
+
+	result, discarded = _fetch([requests.exceptions.ConnectionError("connection reset")])
+
+	assert result.error is None and result.attempts == 2
+	assert len(discarded) == 1
+
+def test_other_error_retried_with_same_client():
+
+	result, discarded = _fetch([ValueError("malformed response"), zeep.exceptions.TransportError("502", 502)])
+
+	assert result.error is None and result.attempts == 3
+	assert len(discarded) == 1
+
+def test_gives_up_after_retries():
+
+	result, discarded = _fetch([IOError("down")]*5)
+
+	assert result.attempts == 4 and isinstance(result.error, IOError)
+	assert len(discarded) == 3
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import trendPull
+import trendWindows
+
+END = datetime(2017, 3, 2)
+START = END - timedelta(1)
+
+
+class StuckService(trendPull.FakeTrendService):
+	"""Fake service that fills every limited response with samples stamped at the start of the window"""
+
+	def getTrendData(self, user, password, path, startTime, endTime, limitFromStart, maxRecords):
+
+		with self._lock:
+			self.calls += 1
+
+		return [startTime, '1.0']*(maxRecords or 1)
+
+
+def _pull(service, planner):
+
+	puller = trendPull.TrendPuller(lambda timeout: service, maxWorkers = 4, retries = 0)
+
+	return list(trendWindows.pullAdaptive(puller, planner, {'#fake_1/m073': 'FAKE'}, START, END))
+
+
+def test_no_progress_is_bisected_until_given_up():
+
+	service = StuckService(latency = 0)
+	planner = trendWindows.WindowPlanner(minWindow = timedelta(hours = 2), maxRecords = 10)
+
+	assert _pull(service, planner) == []
+	#Every bisection halves the window, 24 h down to 1.5 h is 16 windows
+	assert service.calls < 64
+
+def test_truncated_windows_cover_the_range():
+
+	service = trendPull.FakeTrendService(latency = 0, step = 300)
+	planner = trendWindows.WindowPlanner(targetSamples = 100, minWindow = timedelta(hours = 1), maxRecords = 50)
+
+	epochs = sorted(epoch for request, pieceEpochs, values in _pull(service, planner) for epoch in pieceEpochs.tolist())
+
+	#Consecutive pieces share their boundary sample
+	assert sorted(set(epochs))[-1] - sorted(set(epochs))[0] == 24*3600 - 300
+	assert len(set(epochs)) == 288
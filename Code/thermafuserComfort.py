@@ -0,0 +1,291 @@
+import time
+import collections
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import Table, Column, Integer, Float, DateTime, select, and_, or_, func
+
+import hvacDBMapping
+import readingLoader
+import pmvIndex
+from hvacDBMapping import ThermafuserReading
+from readingLoader import keyColumns
+from readingRollups import toEpochs
+
+#The BMS reports zone temperatures and setpoints in Fahrenheit
+FAHRENHEIT = True
+
+#Used when the Reading table has no humidity column, and as the radiant temperature proxy when it has no radiant one
+DEFAULT_HUMIDITY = 50.0 #%
+HUMIDITY_COLUMNS = ['ZoneHumidity', 'RelativeHumidity']
+RADIANT_COLUMNS = ['RadiantTemperature', 'ZoneRadiantTemperature']
+
+#Air speed in the occupied zone, from the share of the box's maximum airflow it is delivering
+MIN_AIR_SPEED = 0.05 #m/s
+MAX_AIR_SPEED = 0.2
+
+ComfortProfile = collections.namedtuple('ComfortProfile', ['Icl', 'M'])
+ComfortProfile.__doc__ = """Clothing insulation (m2K/W) and metabolic rate (W/m2) of the occupants"""
+
+SUMMER = ComfortProfile(0.5*pmvIndex.CLO, 1.1*pmvIndex.MET)
+WINTER = ComfortProfile(1.0*pmvIndex.CLO, 1.1*pmvIndex.MET)
+SUMMER_MONTHS = (5, 6, 7, 8, 9, 10)
+
+#Read PMV from the per profile interpolation grids of pmvIndex (within pmvIndex.GRID_TOLERANCE) instead of solving it
+INTERPOLATE = True
+
+READ_SIZE = 50000
+
+#One row per thermafuser reading, created with the rest of the schema
+comfortTable = Table('Thermafuser_Comfort', hvacDBMapping.Base.metadata,
+	Column('ThermafuserId', Integer, primary_key = True),
+	Column('Time_stamp', DateTime, primary_key = True),
+	Column('PMV', Float),
+	Column('PPD', Float),
+	Column('AirTemperature', Float), #C
+	Column('RadiantTemperature', Float), #C
+	Column('RelativeHumidity', Float),
+	Column('AirSpeed', Float),
+	Column('ClothingInsulation', Float),
+	Column('MetabolicRate', Float),
+	Column('SetpointDeviation', Float)) #K outside the active heating/cooling band, 0 inside it
+
+COMFORT_COLUMNS = [column.name for column in comfortTable.columns if not column.primary_key]
+
+ComfortStats = collections.namedtuple('ComfortStats', ['rows', 'seconds'])
+
+
+def toCelsius(values):
+
+	values = np.asarray(values, dtype = np.float64)
+
+	return (values - 32)/1.8 if FAHRENHEIT else values
+
+def seasonalProfiles(epochs):
+	"""Icl and M arrays for every time stamp, SUMMER in SUMMER_MONTHS and WINTER otherwise"""
+
+	monthNumbers = np.asarray(epochs, dtype = 'datetime64[s]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+	summer = np.isin(monthNumbers, SUMMER_MONTHS)
+
+	return np.where(summer, SUMMER.Icl, WINTER.Icl), np.where(summer, SUMMER.M, WINTER.M)
+
+def airSpeed(airflow, maxAirflow):
+	"""Air speed proxy from the airflow feedback, MIN_AIR_SPEED when it or the box maximum is unknown"""
+
+	with np.errstate(invalid = 'ignore', divide = 'ignore'):
+		share = np.clip(np.asarray(airflow, dtype = np.float64)/np.asarray(maxAirflow, dtype = np.float64), 0, 1)
+
+	return MIN_AIR_SPEED + (MAX_AIR_SPEED - MIN_AIR_SPEED)*np.nan_to_num(share)
+
+def setpointDeviation(temperature, occupied, occupiedHeating, occupiedCooling, unoccupiedHeating, unoccupiedCooling):
+	"""How far the zone temperature is below the heating or above the cooling setpoint in force, NaN without setpoints.
+	All temperatures in the same unit, comfortRows passes them in C so the deviation is in K."""
+
+	occupied = np.asarray(occupied, dtype = np.float64) != 0
+	heating = np.where(occupied, occupiedHeating, unoccupiedHeating)
+	cooling = np.where(occupied, occupiedCooling, unoccupiedCooling)
+
+	return np.maximum(heating - temperature, 0) + np.maximum(temperature - cooling, 0)
+
+def pmvPpd(Tai, Tr, Hai, Va, Icl, M):
+	"""PMV and PPD of readings whose Icl and M arrays hold a few profiles, one grid lookup per profile with INTERPOLATE"""
+
+	if not INTERPOLATE:
+		return pmvIndex.pmvPpdComputation(Tai, Tr, Hai, Va, Icl, M)
+
+	pmv = np.empty(len(Tai))
+	ppd = np.empty(len(Tai))
+	profiles = np.stack([Icl, M], axis = 1)
+
+	for Iclp, Mp in np.unique(profiles, axis = 0):
+		profile = (Icl == Iclp) & (M == Mp)
+		pmv[profile], ppd[profile] = pmvIndex.pmvPpdInterpolated(Tai[profile], Tr[profile], Hai[profile], Va[profile], Iclp, Mp)
+
+	return pmv, ppd
+
+def _inputColumns(table):
+
+	names = ['ZoneTemperature', 'AirflowFeedback', 'MaxAirflow', 'RoomOccupied', 'OccupiedHeatingSetpoint', 'OccupiedCoolingSetpoint',
+		'UnoccupiedHeatingSetpoint', 'UnoccupiedCoolingSetpoint']
+	humidity = [name for name in HUMIDITY_COLUMNS if name in table.c][:1]
+	radiant = [name for name in RADIANT_COLUMNS if name in table.c][:1]
+
+	return names + humidity + radiant, humidity, radiant
+
+def comfortRows(ids, epochs, columns, humidityColumn = None, radiantColumn = None):
+	"""Comfort rows of a batch of readings, columns maps the input column names to float arrays (NULL is NaN)"""
+
+	Tai = toCelsius(columns['ZoneTemperature'])
+	Tr = toCelsius(columns[radiantColumn]) if radiantColumn else Tai
+	Hai = columns[humidityColumn] if humidityColumn else np.full(len(Tai), DEFAULT_HUMIDITY)
+	Hai = np.where(np.isnan(Hai), DEFAULT_HUMIDITY, Hai)
+	Va = airSpeed(columns['AirflowFeedback'], columns['MaxAirflow'])
+	Icl, M = seasonalProfiles(epochs)
+
+	pmv, ppd = pmvPpd(Tai, Tr, Hai, Va, Icl, M)
+	deviation = setpointDeviation(Tai, np.nan_to_num(columns['RoomOccupied']), toCelsius(columns['OccupiedHeatingSetpoint']),
+		toCelsius(columns['OccupiedCoolingSetpoint']), toCelsius(columns['UnoccupiedHeatingSetpoint']), toCelsius(columns['UnoccupiedCoolingSetpoint']))
+
+	values = [pmv, ppd, Tai, Tr, Hai, Va, Icl, M, deviation]
+	stamps = np.asarray(epochs, dtype = 'datetime64[s]').astype(datetime)
+	rows = []
+
+	for row in zip(np.asarray(ids).tolist(), stamps.tolist(), *[value.tolist() for value in values]):
+		record = {'ThermafuserId': row[0], 'Time_stamp': row[1]}
+		for name, value in zip(COMFORT_COLUMNS, row[2:]):
+			record[name] = None if value != value else value #NaN is stored as NULL
+		rows.append(record)
+
+	return rows
+
+def _compute(connection, source, query, names, humidity, radiant, readSize):
+
+	begin = time.time()
+	#A recomputed row replaces the old one whole, a NULL PMV means the inputs are gone
+	stmt = readingLoader.upsertStatement(comfortTable, COMFORT_COLUMNS, connection.dialect.name, coalesce = False)
+	sourceId = source.c.ThermafuserId
+	sourceTime = source.c.Time_stamp
+	query = query.order_by(sourceId, sourceTime).limit(readSize)
+	written = 0
+	last = None
+
+	#Keyset pages, each one is fetched whole before its rows are written, so reads and writes can share the connection
+	while True:
+		pageQuery = query if last is None else query.where(or_(sourceId > last[0], and_(sourceId == last[0], sourceTime > last[1])))
+		batch = connection.execute(pageQuery).all()
+
+		if not batch:
+			break
+
+		fields = list(zip(*batch))
+		columns = dict((name, np.array(values, dtype = np.float64)) for name, values in zip(names, fields[2:]))
+		rows = comfortRows(np.array(fields[0], dtype = np.int64), toEpochs(fields[1]), columns,
+			humidity[0] if humidity else None, radiant[0] if radiant else None)
+
+		for first in range(0, len(rows), readingLoader.CHUNK_SIZE):
+			connection.execute(stmt, rows[first:first + readingLoader.CHUNK_SIZE])
+
+		written += len(rows)
+
+		if len(batch) < readSize:
+			break
+
+		last = batch[-1][0], batch[-1][1]
+
+	return ComfortStats(written, time.time() - begin)
+
+def _source(connection, table, names, start, end, partitions):
+
+	idColumn, timeColumn = keyColumns(table)
+	names = [idColumn.name, timeColumn.name] + names
+
+	if partitions is not None:
+		return partitions.select(connection, table, start, end, names).subquery()
+
+	return select(*[table.c[name] for name in names]).where(and_(timeColumn >= start, timeColumn < end)).subquery()
+
+def computeComfort(connection, start, end, thermafuserIds = None, partitions = None, readSize = READ_SIZE):
+	"""Batch job: (re)compute the comfort rows of the readings in [start, end), e.g. to backfill history or after
+	changing the profiles. Rows already computed are overwritten."""
+
+	table = ThermafuserReading.__table__
+	names, humidity, radiant = _inputColumns(table)
+	source = _source(connection, table, names, start, end, partitions)
+	query = select(source)
+
+	if thermafuserIds is not None:
+		query = query.where(source.c.ThermafuserId.in_(list(thermafuserIds)))
+
+	return _compute(connection, source, query, names, humidity, radiant, readSize)
+
+def lastComputed(connection):
+	"""Time stamp of the newest comfort row of every thermafuser"""
+
+	return dict(connection.execute(select(comfortTable.c.ThermafuserId, func.max(comfortTable.c.Time_stamp))
+		.group_by(comfortTable.c.ThermafuserId)).all())
+
+def updateComfort(connection, since = None, end = None, partitions = None, readSize = READ_SIZE):
+	"""Incremental job for every collection cycle: compute the comfort rows of the readings newer than the last comfort
+	row of their thermafuser. Thermafusers without comfort rows start at since (all their readings by default).
+	Readings that arrive later than newer ones of the same thermafuser are left to computeComfort."""
+
+	table = ThermafuserReading.__table__
+	names, humidity, radiant = _inputColumns(table)
+	marks = lastComputed(connection)
+	end = end or datetime.now() + timedelta(1)
+
+	#Thermafusers sharing a mark are read together from their mark on, so one that stopped reporting long ago only
+	#rescans its own readings instead of moving the start of every thermafuser back. After a normal cycle all share one.
+	groups = collections.defaultdict(list)
+	for thermafuserId, mark in marks.items():
+		groups[mark].append(thermafuserId)
+
+	stats = []
+
+	for mark, thermafuserIds in sorted(groups.items()):
+		start = mark if since is None else max(mark, since)
+		source = _source(connection, table, names, start, end, partitions)
+		query = select(source).where(and_(source.c.ThermafuserId.in_(thermafuserIds), source.c.Time_stamp > mark))
+		stats.append(_compute(connection, source, query, names, humidity, radiant, readSize))
+
+	start = since
+
+	if start is None:
+		unmarked = select(func.min(table.c.Time_stamp))
+		if marks:
+			unmarked = unmarked.where(table.c.ThermafuserId.notin_(list(marks)))
+		start = connection.execute(unmarked).scalar()
+
+	if start is not None:
+		source = _source(connection, table, names, start, end, partitions)
+		query = select(source)
+		if marks:
+			query = query.where(source.c.ThermafuserId.notin_(list(marks)))
+		stats.append(_compute(connection, source, query, names, humidity, radiant, readSize))
+
+	return ComfortStats(sum(stat.rows for stat in stats), sum(stat.seconds for stat in stats))
+
+
+def benchmark(numThermafusers = 40, days = 30):
+	"""Backfill a month of 5 minute readings, then one incremental cycle of new readings"""
+
+	import sqlalchemy
+
+	engine = sqlalchemy.create_engine('sqlite://')
+	hvacDBMapping.Base.metadata.create_all(engine)
+
+	perThermafuser = days*288
+	epochs = int((datetime(2017, 3, 1) - readingLoader.EPOCH).total_seconds()) + 300*np.arange(perThermafuser + 12, dtype = np.int64)
+	ids = np.repeat(np.arange(1, numThermafusers + 1), perThermafuser + 12)
+	allEpochs = np.tile(epochs, numThermafusers)
+	size = len(ids)
+	columns = {'ZoneTemperature': np.random.uniform(66, 80, size), 'AirflowFeedback': np.random.uniform(0, 400, size),
+		'MaxAirflow': np.full(size, 400.0), 'RoomOccupied': np.random.randint(0, 2, size).astype(np.float64),
+		'OccupiedHeatingSetpoint': np.full(size, 70.0), 'OccupiedCoolingSetpoint': np.full(size, 74.0),
+		'UnoccupiedHeatingSetpoint': np.full(size, 65.0), 'UnoccupiedCoolingSetpoint': np.full(size, 80.0)}
+
+	history = np.tile(np.arange(perThermafuser + 12) < perThermafuser, numThermafusers)
+	loaded = readingLoader.loadBlocks(engine, [readingLoader.ReadingBlock(ThermafuserReading, ids[history], allEpochs[history],
+		dict((name, values[history]) for name, values in columns.items()))])
+	print("loaded " + str(loaded))
+
+	with engine.begin() as connection:
+		backfill = updateComfort(connection)
+
+	loaded = readingLoader.loadBlocks(engine, [readingLoader.ReadingBlock(ThermafuserReading, ids[~history], allEpochs[~history],
+		dict((name, values[~history]) for name, values in columns.items()))])
+	print("loaded " + str(loaded))
+
+	with engine.begin() as connection:
+		cycle = updateComfort(connection)
+		again = updateComfort(connection)
+		total = connection.execute(select(func.count()).select_from(comfortTable)).scalar()
+
+	assert total == size and cycle.rows == 12*numThermafusers and again.rows == 0
+
+	print("backfill: %d rows in %.1f s, cycle: %d rows in %.2f s, nothing new: %d rows" % (backfill.rows, backfill.seconds, cycle.rows,
+		cycle.seconds, again.rows))
+
+
+if __name__ == '__main__':
+	benchmark()
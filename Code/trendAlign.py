@@ -0,0 +1,75 @@
+import numpy as np
+
+EXACT = 'exact'
+NEAREST = 'nearest'
+LOCF = 'locf'
+
+
+def toEpochs(timestamps):
+	"""Convert a sequence of naive datetimes to int64 epoch seconds"""
+
+	return np.asarray(timestamps, dtype = 'datetime64[s]').astype(np.int64)
+
+def slotGrid(startTime, endTime, step = 300):
+	"""Epoch seconds of the slots in (startTime, endTime], one every step seconds"""
+
+	start, end = toEpochs([startTime, endTime])
+
+	return np.arange(start + step, end + 1, step, dtype = np.int64)
+
+def alignToSlots(slots, epochs, values, mode = EXACT, tolerance = None, fill = -1):
+	"""Place the samples (epochs, values) onto the slot grid in one pass.
+
+	exact: a slot takes the value of the first sample with exactly the same time stamp.
+	nearest: a slot takes the value of the closest sample, if it is at most tolerance seconds away.
+	locf: a slot takes the value of the last sample at or before it, if it is at most tolerance seconds old.
+	Slots without a sample are set to fill. A tolerance of None means no limit."""
+
+	slots = np.asarray(slots, dtype = np.int64)
+	epochs = np.asarray(epochs, dtype = np.int64)
+	values = np.asarray(values, dtype = np.float64)
+
+	aligned = np.full(len(slots), fill, dtype = np.float64)
+
+	if len(epochs) == 0 or len(slots) == 0:
+		return aligned
+
+	#The service returns samples in order, only sort when it did not
+	if np.any(epochs[1:] < epochs[:-1]):
+		order = np.argsort(epochs, kind = 'stable')
+		epochs = epochs[order]
+		values = values[order]
+
+	n = len(epochs)
+
+	if mode == EXACT:
+		index = np.searchsorted(epochs, slots, side = 'left')
+		clipped = np.minimum(index, n - 1)
+		match = (index < n) & (epochs[clipped] == slots)
+		aligned[match] = values[clipped[match]]
+
+	elif mode == NEAREST:
+		right = np.minimum(np.searchsorted(epochs, slots, side = 'left'), n - 1)
+		left = np.maximum(right - 1, 0)
+		useLeft = np.abs(slots - epochs[left]) <= np.abs(epochs[right] - slots)
+		index = np.where(useLeft, left, right)
+		match = np.ones(len(slots), dtype = bool)
+
+		if tolerance is not None:
+			match = np.abs(epochs[index] - slots) <= tolerance
+
+		aligned[match] = values[index[match]]
+
+	elif mode == LOCF:
+		index = np.searchsorted(epochs, slots, side = 'right') - 1
+		match = index >= 0
+
+		if tolerance is not None:
+			match &= (slots - epochs[np.maximum(index, 0)]) <= tolerance
+
+		aligned[match] = values[index[match]]
+
+	else:
+		raise ValueError("Unknown alignment mode " + str(mode))
+
+	return aligned
@@ -0,0 +1,96 @@
+import os
+import threading
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+#Raw WSDL/XSD documents are kept here so a cold start does not need to download them, zeep still parses them
+WSDL_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.hvac', 'wsdl_cache.db')
+WSDL_CACHE_TIMEOUT = 30*24*3600
+
+_clients = {}
+_clientsLock = threading.Lock()
+
+
+def serviceUrl(server, service = 'TrendService'):
+	"""Return the WSDL url of the given WebCTRL service"""
+
+	return 'http://' + server + '/_common/services/' + service + '?wsdl'
+
+def createSession(poolSize = 16, user = 'soap', password = ""):
+	"""Create an HTTP session with keep-alive and a connection pool large enough for all the pull workers"""
+
+	session = Session()
+	session.auth = HTTPBasicAuth(user, password)
+
+	adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = poolSize)
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+
+	return session
+
+def createClient(server, service = 'TrendService', timeout = 60, poolSize = 16, cachePath = WSDL_CACHE_PATH):
+	"""Build a zeep client whose transport uses a pooled session and the on-disk WSDL cache"""
+
+	import zeep
+	from zeep.cache import SqliteCache
+	from zeep.transports import Transport
+
+	cache = None
+
+	if cachePath is not None:
+		cacheDir = os.path.dirname(cachePath)
+		if cacheDir and not os.path.exists(cacheDir):
+			os.makedirs(cacheDir)
+		cache = SqliteCache(path = cachePath, timeout = WSDL_CACHE_TIMEOUT)
+
+	transport = Transport(cache = cache, session = createSession(poolSize), timeout = timeout, operation_timeout = timeout)
+
+	return zeep.Client(wsdl = serviceUrl(server, service), transport = transport)
+
+def getClient(server, service = 'TrendService', timeout = 60, poolSize = 16, cachePath = WSDL_CACHE_PATH):
+	"""Return the long-lived client for these settings, building it on first use"""
+
+	key = (server, service, timeout, poolSize, cachePath)
+
+	with _clientsLock:
+		client = _clients.get(key)
+
+		if client is None:
+			client = createClient(server, service, timeout, poolSize, cachePath)
+			_clients[key] = client
+
+	return client
+
+def evictClient(client):
+	"""Forget a client that failed so the next getClient builds a new one. Its session is not closed,
+	other workers may still be using it."""
+
+	with _clientsLock:
+		for key in [key for key, cached in _clients.items() if cached is client]:
+			del _clients[key]
+
+def clearClients():
+	"""Forget all the cached clients, closing their sessions"""
+
+	with _clientsLock:
+		for client in _clients.values():
+			client.transport.session.close()
+		_clients.clear()
+
+def trendClientFactory(server, poolSize = 16, cachePath = WSDL_CACHE_PATH):
+	"""Client factory for trendPull.TrendPuller that hands every worker the same long-lived client"""
+
+	import zeep.exceptions
+	import trendPull
+
+	def factory(timeout):
+		return getClient(server, 'TrendService', timeout, poolSize, cachePath)
+
+	#TrendPuller calls it with a client whose connection failed
+	factory.discard = evictClient
+	factory.transportErrors = trendPull.TRANSPORT_ERRORS + (zeep.exceptions.TransportError,)
+	#A fault is the service rejecting the request, sending it again gets the same fault
+	factory.fatalErrors = (zeep.exceptions.Fault,)
+
+	return factory
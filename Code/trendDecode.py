@@ -0,0 +1,141 @@
+import time
+import calendar
+from datetime import datetime, timedelta
+import numpy as np
+
+from trendPull import TREND_DATE_FORMAT
+
+#Fixed layout of a zero padded time stamp, e.g. "03/01/2017 12:05:00 AM"
+STAMP_LENGTH = 22
+_separators = {2: b'/', 5: b'/', 10: b' ', 13: b':', 16: b':', 19: b' ', 21: b'M'}
+
+
+def _field(chars, start, width):
+	"""Read the digits chars[:, start:start + width] as integers"""
+
+	digits = chars[:, start:start + width].astype(np.int64) - ord('0')
+	number = np.zeros(len(chars), dtype = np.int64)
+
+	for k in range(width):
+		number = number*10 + digits[:, k]
+
+	return number
+
+def _daysFromCivil(year, month, day):
+	"""Days since 1970-01-01 for arrays of proleptic Gregorian dates"""
+
+	year = year - (month <= 2)
+	era = np.floor_divide(year, 400)
+	yoe = year - era*400
+	mp = (month + 9) % 12
+	doy = (153*mp + 2)//5 + day - 1
+	doe = yoe*365 + yoe//4 - yoe//100 + doy
+
+	return era*146097 + doe - 719468
+
+def _decodeFixed(stamps):
+	"""Vectorized parse of zero padded stamps, returns None if any stamp does not follow the layout"""
+
+	try:
+		raw = np.array(stamps, dtype = 'S%d' % STAMP_LENGTH)
+	except UnicodeEncodeError:
+		return None
+
+	chars = raw.view(np.uint8).reshape(len(stamps), STAMP_LENGTH)
+
+	for position, separator in _separators.items():
+		if np.any(chars[:, position] != ord(separator)):
+			return None
+
+	digitColumns = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+	digits = chars[:, digitColumns]
+	if np.any((digits < ord('0')) | (digits > ord('9'))):
+		return None
+
+	meridian = chars[:, 20]
+	if np.any((meridian != ord('A')) & (meridian != ord('P'))):
+		return None
+
+	month = _field(chars, 0, 2)
+	day = _field(chars, 3, 2)
+	year = _field(chars, 6, 4)
+	hour = _field(chars, 11, 2) % 12 + np.where(meridian == ord('P'), 12, 0)
+	minute = _field(chars, 14, 2)
+	second = _field(chars, 17, 2)
+
+	return _daysFromCivil(year, month, day)*86400 + hour*3600 + minute*60 + second
+
+def _decodeCached(stamps):
+	"""Parse stamps of any width, running strptime only once per distinct date"""
+
+	dayEpochs = {}
+	epochs = np.empty(len(stamps), dtype = np.int64)
+
+	for i, stamp in enumerate(stamps):
+		datePart, timePart, meridian = stamp.split()
+
+		dayEpoch = dayEpochs.get(datePart)
+		if dayEpoch is None:
+			dayEpoch = calendar.timegm(datetime.strptime(datePart, "%m/%d/%Y").timetuple())
+			dayEpochs[datePart] = dayEpoch
+
+		hour, minute, second = timePart.split(':')
+		hour = int(hour) % 12
+		if meridian.upper() == 'PM':
+			hour += 12
+
+		epochs[i] = dayEpoch + hour*3600 + int(minute)*60 + int(second)
+
+	return epochs
+
+def decodeTrendData(data):
+	"""Turn the alternating time stamp/value list returned by getTrendData into
+	(epochs, values) arrays of int64 epoch seconds and float64 values"""
+
+	if not data:
+		return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.float64)
+
+	stamps = data[0::2]
+	values = np.array(data[1::2], dtype = np.float64)
+
+	epochs = None
+	if all(len(stamp) == STAMP_LENGTH for stamp in stamps):
+		epochs = _decodeFixed(stamps)
+
+	if epochs is None:
+		epochs = _decodeCached(stamps)
+
+	return epochs, values
+
+
+def benchmark(numSamples = 1000000):
+	"""Compare decodeTrendData against the per element strptime loop on a synthetic response"""
+
+	start = datetime(2015, 1, 1)
+	step = timedelta(minutes = 5)
+	data = []
+
+	for i in range(numSamples):
+		data.append((start + step*i).strftime(TREND_DATE_FORMAT))
+		data.append(str(float(i % 100)))
+
+	begin = time.time()
+	tStmps = []
+	values = []
+	for k in range(0, len(data), 2):
+		tStmps.append(datetime.strptime(data[k], TREND_DATE_FORMAT))
+		values.append(float(data[k + 1]))
+	loopTime = time.time() - begin
+
+	begin = time.time()
+	epochs, decoded = decodeTrendData(data)
+	decodeTime = time.time() - begin
+
+	expected = np.asarray(tStmps, dtype = 'datetime64[s]').astype(np.int64)
+	assert np.array_equal(expected, epochs) and np.array_equal(np.asarray(values), decoded)
+
+	print("%d samples: strptime loop %.2f s, decodeTrendData %.2f s (%.1fx)" % (numSamples, loopTime, decodeTime, loopTime/decodeTime))
+
+
+if __name__ == '__main__':
+	benchmark()
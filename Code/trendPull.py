@@ -0,0 +1,205 @@
+import time
+import random
+import threading
+import collections
+import concurrent.futures
+from datetime import datetime, timedelta
+
+#Format used by the TrendService for the start/end arguments and for the returned time stamps
+TREND_DATE_FORMAT = "%m/%d/20%y %I:%M:%S %p"
+
+#maxRecords = 0 asks the service for every sample in the window
+TrendRequest = collections.namedtuple('TrendRequest', ['path', 'controlProgram', 'startTime', 'endTime', 'maxRecords'], defaults = (0,))
+TrendResult = collections.namedtuple('TrendResult', ['request', 'data', 'attempts', 'error'])
+
+
+class TrendTimeout(Exception):
+	"""Raised when a getTrendData call takes longer than the allowed timeout"""
+	pass
+
+#Failures of the connection rather than answers of the service, the client is replaced after them (the requests
+#exceptions are OSErrors). A client factory can widen them with a transportErrors attribute.
+TRANSPORT_ERRORS = (OSError, TrendTimeout)
+
+
+def getTrendData(client, request):
+	"""Issue one getTrendData SOAP call for the given request. Only requests with maxRecords, the windows planned by
+	trendWindows, ask for the earliest maxRecords samples, the others get the whole window as before (False, 0)."""
+
+	limited = request.maxRecords > 0
+
+	return client.service.getTrendData('soap', "", request.path, request.startTime.strftime(TREND_DATE_FORMAT),
+		request.endTime.strftime(TREND_DATE_FORMAT), limited, request.maxRecords if limited else 0)
+
+
+class TrendPuller(object):
+	"""Fan getTrendData requests out over a bounded pool of worker threads"""
+
+	def __init__(self, clientFactory, maxWorkers = 8, timeout = 60, retries = 3, backoff = 1.0):
+
+		self._clientFactory = clientFactory
+		#Errors the factory knows are final answers of the service, e.g. SOAP faults, are not retried
+		self._fatalErrors = getattr(clientFactory, 'fatalErrors', ())
+		self._transportErrors = getattr(clientFactory, 'transportErrors', TRANSPORT_ERRORS)
+		self._maxWorkers = maxWorkers
+		self._timeout = timeout
+		self._retries = retries
+		self._backoff = backoff
+		self._local = threading.local()
+
+	#Properties
+
+	@property
+	def maxWorkers(self):
+		return self._maxWorkers
+
+	@property
+	def timeout(self):
+		return self._timeout
+
+	@property
+	def retries(self):
+		return self._retries
+
+	def _client(self):
+		"""Ask the factory for a client on first use in each worker thread"""
+
+		client = getattr(self._local, 'client', None)
+
+		if client is None:
+			client = self._clientFactory(self._timeout)
+			self._local.client = client
+
+		return client
+
+	def fetch(self, request):
+		"""Fetch a single request, retrying with exponential backoff on failure. The client is only replaced after
+		transport errors, and errors in the factory's fatalErrors are returned at once."""
+
+		attempts = 0
+
+		while True:
+			attempts += 1
+
+			try:
+				data = getTrendData(self._client(), request)
+				return TrendResult(request, data, attempts, None)
+			except Exception as e:
+				if attempts > self._retries or isinstance(e, self._fatalErrors):
+					return TrendResult(request, None, attempts, e)
+
+				#Drop the client in case the failure left its connection in a bad state, a shared client is evicted
+				#from its factory's cache too or the factory would hand the same one back
+				if isinstance(e, self._transportErrors):
+					client = getattr(self._local, 'client', None)
+					self._local.client = None
+					discard = getattr(self._clientFactory, 'discard', None)
+					if client is not None and discard is not None:
+						discard(client)
+
+				time.sleep(self._backoff * 2**(attempts - 1))
+
+	def pull(self, requests):
+		"""Yield a TrendResult for every request as soon as it completes.
+		At most 2*maxWorkers requests are in flight so arbitrarily long request lists can be streamed."""
+
+		requests = iter(requests)
+		maxPending = 2*self._maxWorkers
+
+		with concurrent.futures.ThreadPoolExecutor(max_workers = self._maxWorkers) as executor:
+			pending = set()
+
+			for request in requests:
+				pending.add(executor.submit(self.fetch, request))
+
+				if len(pending) >= maxPending:
+					done, pending = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+
+					for future in done:
+						yield future.result()
+
+			for future in concurrent.futures.as_completed(pending):
+				yield future.result()
+
+
+class FakeTrendService(object):
+	"""Offline stand-in for the WebCTRL TrendService, used to benchmark the pull engine"""
+
+	def __init__(self, latency = 0.05, step = 300, failureRate = 0.0, timeout = None, seed = None, steps = None, timePerSample = 0.0):
+
+		self._latency = latency
+		self._step = step
+		self._steps = steps or {}
+		self._timePerSample = timePerSample
+		self._failureRate = failureRate
+		self._timeout = timeout
+		self._random = random.Random(seed)
+		self._lock = threading.Lock()
+		self.calls = 0
+
+	@property
+	def service(self):
+		return self
+
+	def getTrendData(self, user, password, path, startTime, endTime, limitFromStart, maxRecords):
+		"""Return the alternating time stamp/value list the real service returns for (startTime, endTime].
+		Samples are spaced steps[path] seconds apart and at most maxRecords are returned when it is not 0."""
+
+		with self._lock:
+			self.calls += 1
+			fail = self._random.random() < self._failureRate
+
+		start = datetime.strptime(startTime, TREND_DATE_FORMAT)
+		end = datetime.strptime(endTime, TREND_DATE_FORMAT)
+		step = timedelta(seconds = self._steps.get(path, self._step))
+		numSamples = int((end - start).total_seconds()//step.total_seconds())
+
+		if maxRecords:
+			numSamples = min(numSamples, maxRecords)
+
+		latency = self._latency + self._timePerSample*numSamples
+
+		if self._timeout is not None and latency > self._timeout:
+			time.sleep(self._timeout)
+			raise TrendTimeout("getTrendData for " + path + " timed out")
+
+		time.sleep(latency)
+
+		if fail:
+			raise IOError("simulated TrendService failure for " + path)
+
+		seed = sum(map(ord, path)) % 100
+
+		data = []
+		current = start + step
+
+		for index in range(numSamples):
+			data.append(current.strftime(TREND_DATE_FORMAT))
+			data.append(str(float(seed + index % 10)))
+			current += step
+
+		return data
+
+
+def benchmark(numPaths = 200, latency = 0.05, workerCounts = (1, 4, 16, 32)):
+	"""Compare the throughput of the pull engine for several pool sizes against the fake service"""
+
+	endTime = datetime(2017, 3, 2)
+	startTime = endTime - timedelta(1)
+	requests = [TrendRequest('#fake_%d/m073' % i, 'FAKE', startTime, endTime) for i in range(numPaths)]
+
+	for workers in workerCounts:
+		service = FakeTrendService(latency = latency)
+		puller = TrendPuller(lambda timeout: service, maxWorkers = workers)
+
+		start = time.time()
+		samples = 0
+		for result in puller.pull(requests):
+			samples += len(result.data)//2
+		elapsed = time.time() - start
+
+		print("workers = %d: %d requests in %.2f s (%.1f requests/s, %d samples)" % (workers, numPaths, elapsed, numPaths/elapsed, samples))
+
+
+if __name__ == '__main__':
+	benchmark()
@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def toDatetime(epoch):
+	"""Convert epoch seconds back to the naive datetime used for the TrendService requests"""
+
+	return EPOCH + timedelta(seconds = int(epoch))
+
+def toEpoch(moment):
+	"""Convert a naive datetime to epoch seconds"""
+
+	return int((moment - EPOCH).total_seconds())
+
+
+class HighWaterMarks(object):
+	"""Time stamp (epoch seconds) of the last sample fetched for every DataPoint path, persisted in a JSON state file"""
+
+	def __init__(self, filepath):
+
+		self._filepath = filepath
+		self._marks = {}
+		self._lock = threading.Lock()
+
+		if os.path.exists(filepath):
+			with open(filepath, 'r') as stateFile:
+				self._marks = json.load(stateFile)
+
+	#Properties
+
+	@property
+	def filepath(self):
+		return self._filepath
+
+	def __len__(self):
+		return len(self._marks)
+
+	def get(self, path, default = None):
+		"""Return the mark of the path or default if it was never fetched"""
+
+		return self._marks.get(path, default)
+
+	def update(self, path, epoch):
+		"""Move the mark of the path forward, marks never go back"""
+
+		epoch = int(epoch)
+
+		with self._lock:
+			if epoch > self._marks.get(path, -1):
+				self._marks[path] = epoch
+
+	def save(self):
+		"""Write the marks atomically so a crash never leaves a truncated state file"""
+
+		with self._lock:
+			marks = dict(self._marks)
+
+		stateDir = os.path.dirname(self._filepath)
+		if stateDir and not os.path.exists(stateDir):
+			os.makedirs(stateDir)
+
+		tmpPath = self._filepath + '.tmp'
+		with open(tmpPath, 'w') as stateFile:
+			json.dump(marks, stateFile)
+			stateFile.flush()
+			os.fsync(stateFile.fileno())
+
+		os.replace(tmpPath, self._filepath)
+
+
+def windowStart(marks, path, now, lookback):
+	"""Start of the next window for the path, (last_seen, now] or (now - lookback, now] for a new path"""
+
+	lastSeen = marks.get(path)
+
+	if lastSeen is None:
+		return now - lookback
+
+	return toDatetime(lastSeen)
+
+def newSamples(marks, path, epochs, values):
+	"""Drop the samples at or before the mark of the path, the service may return the window start inclusively"""
+
+	lastSeen = marks.get(path)
+
+	if lastSeen is None:
+		return epochs, values
+
+	keep = epochs > lastSeen
+
+	return epochs[keep], values[keep]
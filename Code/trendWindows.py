@@ -0,0 +1,207 @@
+import os
+import json
+import time
+from datetime import datetime, timedelta
+
+import trendPull
+import trendDecode
+import trendState
+
+DEFAULT_DENSITY = 1.0/300 #Samples per second assumed for a path never seen, one every 5 minutes
+
+
+class WindowPlanner(object):
+	"""Choose request windows per path from the sample density observed for it.
+	Windows aim at targetSamples samples each, so sparse paths get long windows (few round-trips)
+	and dense paths get short ones (no timeouts), always within [minWindow, maxWindow]."""
+
+	def __init__(self, targetSamples = 5000, minWindow = timedelta(hours = 1), maxWindow = timedelta(days = 90), maxRecords = 10000,
+		densities = None):
+
+		self._targetSamples = targetSamples
+		self._minWindow = minWindow
+		self._maxWindow = maxWindow
+		self._maxRecords = maxRecords
+		self._densities = densities or {}
+
+	#Properties
+
+	@property
+	def minWindow(self):
+		return self._minWindow
+
+	@property
+	def maxRecords(self):
+		return self._maxRecords
+
+	@property
+	def densities(self):
+		return self._densities
+
+	def density(self, path):
+		"""Samples per second observed for the path"""
+
+		return self._densities.get(path, DEFAULT_DENSITY)
+
+	def observe(self, path, numSamples, seconds):
+		"""Blend the density seen in a window into the estimate of the path"""
+
+		if seconds <= 0:
+			return
+
+		observed = max(numSamples, 1)/float(seconds)
+		previous = self._densities.get(path)
+
+		if previous is None:
+			self._densities[path] = observed
+		else:
+			self._densities[path] = 0.5*previous + 0.5*observed
+
+	def windowLength(self, path):
+		"""Length of the windows to request for the path"""
+
+		seconds = self._targetSamples/self.density(path)
+		seconds = min(max(seconds, self._minWindow.total_seconds()), self._maxWindow.total_seconds())
+
+		return timedelta(seconds = seconds)
+
+	def plan(self, path, controlProgram, startTime, endTime):
+		"""Split (startTime, endTime] into the requests for the path"""
+
+		length = self.windowLength(path)
+		requests = []
+		current = startTime
+
+		while current < endTime:
+			windowEnd = min(current + length, endTime)
+			requests.append(trendPull.TrendRequest(path, controlProgram, current, windowEnd, self._maxRecords))
+			current = windowEnd
+
+		return requests
+
+	def save(self, filepath):
+		"""Keep the densities for the next backfill"""
+
+		with open(filepath, 'w') as densityFile:
+			json.dump(self._densities, densityFile)
+
+	@classmethod
+	def load(cls, filepath, **kwargs):
+
+		densities = {}
+
+		if os.path.exists(filepath):
+			with open(filepath, 'r') as densityFile:
+				densities = json.load(densityFile)
+
+		return cls(densities = densities, **kwargs)
+
+
+def bisect(request):
+	"""Split a request in two halves"""
+
+	middle = request.startTime + (request.endTime - request.startTime)//2
+	middle = middle.replace(microsecond = 0)
+
+	return [request._replace(endTime = middle), request._replace(startTime = middle)]
+
+def pullAdaptive(puller, planner, points, startTime, endTime, probe = timedelta(days = 1)):
+	"""Backfill (startTime, endTime] for the points (path -> control program) in as few round-trips as possible.
+
+	Paths without a known density are probed with a short window first. The rest of the range is then planned
+	from the densities and pulled concurrently. Windows that fail or come back truncated (maxRecords samples)
+	are bisected and pulled again in the next round until they are shorter than planner.minWindow. Every window pulled
+	again starts after the start of the window it came from, or is half of it, so the pull always ends.
+	Yields (request, epochs, values) for every piece of data and returns once every window is done or given up."""
+
+	rounds = []
+	remaining = []
+
+	for path, controlProgram in points.items():
+		if path in planner.densities or startTime + probe >= endTime:
+			remaining.extend(planner.plan(path, controlProgram, startTime, endTime))
+		else:
+			rounds.append(trendPull.TrendRequest(path, controlProgram, startTime, startTime + probe, planner.maxRecords))
+			remaining.append(trendPull.TrendRequest(path, controlProgram, startTime + probe, endTime))
+
+	#Probe round first, the rest is only planned once the densities are known
+	requests = rounds
+
+	while requests or remaining:
+		retry = []
+
+		for result in puller.pull(requests):
+			request = result.request
+			seconds = (request.endTime - request.startTime).total_seconds()
+
+			if result.error is not None:
+				if request.endTime - request.startTime > planner.minWindow:
+					retry.extend(bisect(request))
+				else:
+					print("giving up on " + request.path + " " + str(request.startTime) + " - " + str(request.endTime) + ": " + str(result.error))
+				continue
+
+			epochs, values = trendDecode.decodeTrendData(result.data)
+
+			if request.maxRecords and len(epochs) >= request.maxRecords:
+				lastSeen = trendState.toDatetime(epochs.max())
+
+				if lastSeen <= request.startTime:
+					#Nothing after the start came back, asking from the same start again would never end, so bisect
+					#the whole window until it is shorter than minWindow
+					if request.endTime - request.startTime > planner.minWindow:
+						retry.extend(bisect(request))
+					else:
+						print("giving up on " + request.path + " " + str(request.startTime) + " - " + str(request.endTime) + ": no samples after the start")
+					continue
+
+				#Truncated, keep what came back and bisect what is left of the window, which starts after the old start
+				planner.observe(request.path, len(epochs), (lastSeen - request.startTime).total_seconds())
+				rest = request._replace(startTime = lastSeen)
+
+				if rest.endTime - rest.startTime > planner.minWindow:
+					retry.extend(bisect(rest))
+				elif rest.startTime < rest.endTime:
+					retry.append(rest)
+			else:
+				planner.observe(request.path, len(epochs), seconds)
+
+			yield request, epochs, values
+
+		for request in remaining:
+			retry.extend(planner.plan(request.path, request.controlProgram, request.startTime, request.endTime))
+
+		remaining = []
+		requests = retry
+
+
+def benchmark(days = 90, numPaths = 40):
+	"""Count the round-trips of a backfill with fixed one day windows against the adaptive planner"""
+
+	endTime = datetime(2017, 6, 1)
+	startTime = endTime - timedelta(days)
+	points = {}
+	steps = {}
+
+	for i in range(numPaths):
+		#A mix of sparse occupancy points logged hourly and dense fan trends logged every minute
+		path = '#fake_%d/%s' % (i, 'm078' if i % 2 else 'sf_cfm_tnd')
+		points[path] = 'FAKE'
+		steps[path] = 3600 if i % 2 else 60
+
+	service = trendPull.FakeTrendService(latency = 0.01, steps = steps, timePerSample = 1e-6, timeout = 0.05)
+	puller = trendPull.TrendPuller(lambda timeout: service, maxWorkers = 16, retries = 0)
+	requests = [trendPull.TrendRequest(path, 'FAKE', startTime + timedelta(d), startTime + timedelta(d + 1)) for path in points for d in range(days)]
+
+	begin = time.time()
+	samples = sum(len(result.data)//2 for result in puller.pull(requests) if result.data)
+	print("one day windows: %d calls, %d samples in %.2f s" % (service.calls, samples, time.time() - begin))
+
+	service.calls = 0
+	begin = time.time()
+	samples = sum(len(epochs) for request, epochs, values in pullAdaptive(puller, WindowPlanner(), points, startTime, endTime))
+	print("adaptive windows: %d calls, %d samples in %.2f s" % (service.calls, samples, time.time() - begin))
+
+
+if __name__ == '__main__':
+	benchmark()
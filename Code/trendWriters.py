@@ -0,0 +1,359 @@
+import io
+import os
+import abc
+import csv
+import time
+import numpy as np
+
+
+def slotLabels(slots):
+	"""Format epoch second slots as 'YYYY-MM-DD HH:MM:SS' labels"""
+
+	labels = np.datetime_as_string(np.asarray(slots, dtype = np.int64).astype('datetime64[s]'), unit = 's')
+
+	return np.char.replace(labels, 'T', ' ')
+
+def labelSlots(labels):
+	"""Epoch second slots of 'YYYY-MM-DD HH:MM:SS' labels"""
+
+	return np.array([label.replace(' ', 'T') for label in labels], dtype = 'datetime64[s]').astype(np.int64)
+
+
+class TrendWriter(abc.ABC):
+	"""Base class of the output stage. A block is the aligned (slots x paths) matrix of one control program"""
+
+	def prepare(self, layout, slots = None):
+		"""Check the files a run will extend against its layout, {controlProgram: paths}, before any block is written,
+		so a mismatch stops the run up front instead of half way. slots are those the run covers, None for all of them."""
+		pass
+
+	@abc.abstractmethod
+	def write(self, controlProgram, slots, paths, block):
+		pass
+
+	def close(self):
+		pass
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, tb):
+		self.close()
+
+
+class CsvTrendWriter(TrendWriter):
+	"""Write blocks as csv with a Time column and one column per path.
+	With daily=False every control program goes to one dataset file, with daily=True every block goes to
+	directory/cprog/cprog date.csv like zonepull used to do. Files from an earlier run are replaced unless append=True,
+	then blocks are appended and the slots the file already holds are skipped, so a re-run does not duplicate rows."""
+
+	def __init__(self, directory, daily = False, append = False, fmt = '%.10g', bufferSize = 1 << 20):
+
+		self._directory = directory
+		self._daily = daily
+		self._append = append
+		self._fmt = fmt
+		self._bufferSize = bufferSize
+		self._opened = {}
+		self._existing = {}
+
+	def filepath(self, controlProgram, slots):
+
+		if self._daily:
+			day = str(np.asarray(slots[0], dtype = np.int64).astype('datetime64[s]').astype('datetime64[D]'))
+			return os.path.join(self._directory, controlProgram, controlProgram + ' ' + day + '.csv')
+
+		return os.path.join(self._directory, controlProgram + '.csv')
+
+	def _filepaths(self, controlProgram, slots):
+		"""Files the slots of a control program go to, every existing one of it when slots is None"""
+
+		if slots is not None:
+			if not self._daily:
+				return [self.filepath(controlProgram, slots)]
+
+			days = np.unique(np.asarray(slots, dtype = np.int64).astype('datetime64[s]').astype('datetime64[D]'))
+			return [self.filepath(controlProgram, [day.astype('datetime64[s]').astype(np.int64)]) for day in days]
+
+		if not self._daily:
+			return [self.filepath(controlProgram, None)]
+
+		directory = os.path.join(self._directory, controlProgram)
+		if not os.path.isdir(directory):
+			return []
+
+		return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.startswith(controlProgram + ' ') and name.endswith('.csv')]
+
+	def _check(self, filepath, controlProgram, header):
+		"""Raise when a file from an earlier run has other columns than header"""
+
+		with open(filepath, 'r', newline = '') as csvfile:
+			existing = next(csv.reader(csvfile), None)
+
+		if existing != header:
+			raise ValueError("Columns of " + filepath + " do not match the paths of " + controlProgram)
+
+	def prepare(self, layout, slots = None):
+
+		if not self._append:
+			return
+
+		for controlProgram, paths in layout.items():
+			header = ['Time'] + list(paths)
+
+			for filepath in self._filepaths(controlProgram, slots):
+				if filepath not in self._opened and os.path.exists(filepath):
+					self._check(filepath, controlProgram, header)
+
+	def _existingSlots(self, filepath):
+		"""Slots a file from an earlier run already holds"""
+
+		with open(filepath, 'r', newline = '') as csvfile:
+			reader = csv.reader(csvfile)
+			next(reader, None)
+			labels = [row[0] for row in reader if row]
+
+		return labelSlots(labels)
+
+	def write(self, controlProgram, slots, paths, block):
+
+		filepath = self.filepath(controlProgram, slots)
+		header = ['Time'] + list(paths)
+		slots = np.asarray(slots, dtype = np.int64)
+		block = np.asarray(block, dtype = np.float64)
+
+		directory = os.path.dirname(filepath)
+		if directory and not os.path.exists(directory):
+			os.makedirs(directory)
+
+		#Only append to a file written by an earlier block or run when appending is on
+		exists = os.path.exists(filepath) and (self._append or filepath in self._opened)
+
+		if exists and filepath not in self._opened:
+			self._check(filepath, controlProgram, header)
+			self._existing[filepath] = self._existingSlots(filepath)
+
+		elif exists and self._opened[filepath] != header:
+			raise ValueError("Columns of " + filepath + " do not match the paths of " + controlProgram)
+
+		#Slots an earlier run already wrote are not written twice
+		existing = self._existing.get(filepath)
+		if existing is not None and len(existing):
+			keep = ~np.isin(slots, existing)
+			slots, block = slots[keep], block[keep]
+
+		self._opened[filepath] = header
+
+		if exists and not len(slots):
+			return
+
+		body = io.StringIO()
+		np.savetxt(body, block, delimiter = ',', fmt = self._fmt)
+		rows = body.getvalue().splitlines()
+
+		with open(filepath, 'a' if exists else 'w', newline = '', buffering = self._bufferSize) as csvfile:
+			if not exists:
+				csv.writer(csvfile).writerow(header)
+
+			if rows:
+				csvfile.write('\n'.join(label + ',' + row for label, row in zip(slotLabels(slots), rows)))
+				csvfile.write('\n')
+
+
+class NpzTrendWriter(TrendWriter):
+	"""Collect the blocks of each control program and save them as one compressed npz dataset on close.
+	With append=True an existing dataset is extended instead of replaced, a slot written again keeps its latest values."""
+
+	def __init__(self, directory, append = False):
+
+		self._directory = directory
+		self._append = append
+		self._blocks = {}
+
+	def filepath(self, controlProgram):
+		return os.path.join(self._directory, controlProgram + '.npz')
+
+	def prepare(self, layout, slots = None):
+
+		if not self._append:
+			return
+
+		for controlProgram, paths in layout.items():
+			filepath = self.filepath(controlProgram)
+
+			if controlProgram not in self._blocks and os.path.exists(filepath):
+				with np.load(filepath) as dataset:
+					if list(dataset['paths']) != list(paths):
+						raise ValueError("Columns of the " + controlProgram + " dataset do not match its paths")
+
+	def write(self, controlProgram, slots, paths, block):
+
+		paths = list(paths)
+		stored = self._blocks.get(controlProgram)
+
+		if stored is None:
+			stored = {'paths': paths, 'slots': [], 'values': []}
+			filepath = self.filepath(controlProgram)
+
+			if self._append and os.path.exists(filepath):
+				with np.load(filepath) as dataset:
+					stored['paths'] = list(dataset['paths'])
+					stored['slots'].append(dataset['slots'])
+					stored['values'].append(dataset['values'])
+
+			self._blocks[controlProgram] = stored
+
+		if stored['paths'] != paths:
+			raise ValueError("Columns of the " + controlProgram + " dataset do not match its paths")
+
+		stored['slots'].append(np.asarray(slots, dtype = np.int64))
+		stored['values'].append(np.asarray(block, dtype = np.float64))
+
+	def close(self):
+
+		if self._blocks and not os.path.exists(self._directory):
+			os.makedirs(self._directory)
+
+		for controlProgram, stored in self._blocks.items():
+			slots = np.concatenate(stored['slots'])
+			values = np.concatenate(stored['values'])
+
+			#np.unique keeps the first occurrence, on the reversed rows that is the block written last
+			slots, last = np.unique(slots[::-1], return_index = True)
+			values = values[::-1][last]
+
+			np.savez_compressed(self.filepath(controlProgram), slots = slots, values = values, paths = np.array(stored['paths']))
+
+		self._blocks = {}
+
+
+class ParquetTrendWriter(TrendWriter):
+	"""Stream the blocks of each control program into one Parquet file, one row group per block. Needs pyarrow."""
+
+	def __init__(self, directory, compression = 'zstd'):
+
+		import pyarrow
+
+		self._directory = directory
+		self._compression = compression
+		self._writers = {}
+
+	def filepath(self, controlProgram):
+		return os.path.join(self._directory, controlProgram + '.parquet')
+
+	def write(self, controlProgram, slots, paths, block):
+
+		import pyarrow
+		import pyarrow.parquet
+
+		block = np.asarray(block, dtype = np.float64)
+		columns = [pyarrow.array(np.asarray(slots, dtype = np.int64).astype('datetime64[s]'))]
+		columns.extend(pyarrow.array(block[:, j]) for j in range(block.shape[1]))
+		table = pyarrow.Table.from_arrays(columns, names = ['Time'] + list(paths))
+
+		writer = self._writers.get(controlProgram)
+
+		if writer is None:
+			if not os.path.exists(self._directory):
+				os.makedirs(self._directory)
+
+			writer = pyarrow.parquet.ParquetWriter(self.filepath(controlProgram), table.schema, compression = self._compression)
+			self._writers[controlProgram] = writer
+
+		writer.write_table(table)
+
+	def close(self):
+
+		for writer in self._writers.values():
+			writer.close()
+
+		self._writers = {}
+
+
+def createWriter(outputFormat, directory, **kwargs):
+	"""Build the writer for 'csv', 'npz' or 'parquet'"""
+
+	writers = {'csv': CsvTrendWriter, 'npz': NpzTrendWriter, 'parquet': ParquetTrendWriter}
+
+	if outputFormat not in writers:
+		raise ValueError("Unknown output format " + str(outputFormat))
+
+	return writers[outputFormat](directory, **kwargs)
+
+
+def _legacyWrite(directory, controlProgram, slots, paths, block):
+	"""The cell by cell writer zonepull3 used, kept for the benchmark"""
+
+	if not os.path.exists(os.path.join(directory, controlProgram)):
+		os.makedirs(os.path.join(directory, controlProgram))
+
+	labels = slotLabels(slots)
+	FILE = open(os.path.join(directory, controlProgram, controlProgram + ' ' + labels[0][:10] + '.csv'), 'w')
+	FILE.write("Time," + str(paths) + '\n')
+
+	for f in range(0, len(slots), 1):
+		FILE.write(str(labels[f]) + ",")
+		for a in range(0, len(paths), 1):
+			FILE.write(str(block[f, a]) + ",")
+		FILE.write('\n')
+
+	FILE.close()
+
+def _directorySize(directory):
+
+	total = 0
+
+	for root, dirs, files in os.walk(directory):
+		for name in files:
+			total += os.path.getsize(os.path.join(root, name))
+
+	return total
+
+def benchmark(directory = 'writer_benchmark', days = 30, controlPrograms = 40, pathsPerProgram = 30):
+	"""Write a month of synthetic Zone4 sized data with the legacy writer and every available writer"""
+
+	import shutil
+
+	rng = np.random.default_rng(0)
+	start = np.datetime64('2017-03-01T00:00:00').astype(np.int64)
+	blocks = []
+
+	for d in range(days):
+		slots = start + d*86400 + 300*np.arange(1, 289, dtype = np.int64)
+		for c in range(controlPrograms):
+			paths = ['#cprog_%d/m%03d' % (c, p) for p in range(pathsPerProgram)]
+			blocks.append(('CPROG%d' % c, slots, paths, np.round(rng.normal(70, 5, (288, pathsPerProgram)), 1)))
+
+	def run(name, writeBlocks):
+		target = os.path.join(directory, name)
+		shutil.rmtree(target, ignore_errors = True)
+		begin = time.time()
+		writeBlocks(target)
+		elapsed = time.time() - begin
+		print("%-8s %7.2f s %10.1f MB %6d files" % (name, elapsed, _directorySize(target)/1e6, sum(len(f) for r, d, f in os.walk(target))))
+
+	def legacy(target):
+		for block in blocks:
+			_legacyWrite(target, *block)
+
+	def using(outputFormat):
+		def writeBlocks(target):
+			with createWriter(outputFormat, target) as writer:
+				for block in blocks:
+					writer.write(*block)
+		return writeBlocks
+
+	run('legacy', legacy)
+	run('csv', using('csv'))
+	run('npz', using('npz'))
+
+	try:
+		run('parquet', using('parquet'))
+	except ImportError:
+		print("parquet  skipped, pyarrow is not installed")
+
+	shutil.rmtree(directory, ignore_errors = True)
+
+
+if __name__ == '__main__':
+	benchmark()
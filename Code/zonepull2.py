@@ -39,7 +39,7 @@ def getdata(path,cprog,point,date,d):
     print(cprog)
     server= "10.20.0.47"
     host = 'http://'+server+'/_common/services/TrendService?wsdl'
-    serverSP = zeep.Client(wsdl=host)
+    serverSP = trendClient.getClient(server)
     #serverSP = SOAPpy.SOAPProxy(host)
     #serverPt = SOAPpy.SOAPProxy('http://'+server+'/_common/services/EvalService?wsdl')
 
@@ -246,7 +246,7 @@ def getdata(path,cprog,point,date,d):
 
 ############################################################################################################################################################################################################################################################################################################
 
-import zeep
+import trendClient
 import sys, time, calendar
 import smtplib
 import math
@@ -10,9 +10,8 @@
 #
 #
 #
-def format_data(startTime, endTime, serverSP, path):
+def format_data(data):
 
-    data = serverSP.service.getTrendData('soap',"", path, startTime.strftime("%m/%d/20%y %I:%M:%S %p"), endTime.strftime("%m/%d/20%y %I:%M:%S %p"), False, 0)
     tStmps = []
     values = []
     tStamp = []
@@ -20,30 +19,16 @@ def format_data(startTime, endTime, serverSP, path):
     #print data
 
 
-    # SEPERATE DATA INTO TWO ARRAYS: TIME STAMPS AND VALUE
+    # SEPERATE DATA INTO TWO ARRAYS: TIME STAMPS (EPOCH SECONDS) AND VALUE
 
-    for k in range(0,len(data),2):
-        tmpDate = datetime.datetime.strptime(data[k],"%m/%d/20%y %I:%M:%S %p")
-        tStmps.append(tmpDate)
-        values.append(float(data[k+1]))
+    tStmps,values = trendDecode.decodeTrendData(data)
     tStamp = None
     vals = None
 
     print(len(tStmps))
     return values,vals,tStmps,tStamp,data
 ############################################################################################################################################################################################################################################################################################################
-def getdata(path,cprog,point,date2,d):
-    print(cprog)
-    server= "10.20.0.47"
-    host = 'http://'+server+'/_common/services/TrendService?wsdl'
-    serverSP = zeep.Client(wsdl=host)
-
-
-
-
-    today = datetime.today()
-
-
+def gettimerange(d):
 
     #SET YEAR, MONTH HERE!!<<<<---------------------------------------------------------------
 
@@ -63,9 +48,16 @@ def getdata(path,cprog,point,date2,d):
     end = datetime.combine(custdate, moment)
 
     endTime = end
-    print(endTime)
     startTime  = endTime - timedelta(1,0,0,0,0,0,0)
 
+    return startTime,endTime,filedate
+############################################################################################################################################################################################################################################################################################################
+def getdata(path,cprog,point,date2,d,trends):
+    print(cprog)
+
+    startTime,endTime,filedate = gettimerange(d)
+    print(endTime)
+
     #print endTime
     #print startTime
     print(cprog)
@@ -86,19 +78,12 @@ def getdata(path,cprog,point,date2,d):
     # time in 5 minute slots
     global numSlots
 
-    numSlots = totalSecs/(60*5)
+    numSlots = int(totalSecs/(60*5))
 
     delta = timedelta(0,0,0,0,5,0,0)
 
 
 
-    #Make folder for new date ,and control program
-
-
-    if not os.path.exists('Desktop/hvac_data_test/Zone4/'+cprog+''):
-        os.makedirs('Desktop/hvac_data_test/Zone4/'+cprog+'')
-
-
     #Wu's Per Time Stamp Method writes one time stamped row at a time and pulls each value from the bacnetrend; proven but very. very. slow.
 
     #FILE = open('/Users/Student/Dropbox/HVAC/Data/Zone44444/'str(startTime)'+"-"+'str(custdate)+'/'+cprog+' '+str(yesterday)+'.csv','w')
@@ -138,14 +123,7 @@ def getdata(path,cprog,point,date2,d):
 #tStmps=[]
 
 
-    tStmp=[]
-
-##USED THIS TO HARDCODE TIMESTAMPS: NOT SAFE!
-
-    for h in range (0,numSlots,1):
-        start=startTime+timedelta(0,0,0,0,5,0,0)
-        next=start+timedelta(0,0,0,0,5*h,0,0)
-        tStmp.append(next)
+    slots = trendAlign.slotGrid(startTime, endTime, 5*60)
 
 
     M = np.empty(shape=(numSlots, len(path)), dtype=float)
@@ -155,7 +133,7 @@ def getdata(path,cprog,point,date2,d):
         try:
             print(path[j])
             b=path[j]
-            values,vals,tStmps,tStamp,data = format_data(startTime,endTime, serverSP, path[j])
+            values,vals,tStmps,tStamp,data = format_data(trends[path[j]])
 
 
         except:
@@ -177,75 +155,27 @@ def getdata(path,cprog,point,date2,d):
         print(tStmps)
         print(values)
 
-        if len(tStmps)==len(tStmp):
-
-
-            try:
-                print(values)
-                M[:,j]=(values)
-            except:
-
-                print("dimension problem, check timestamps")
-
-                continue
-
-
-        else:
-
-
+        # place the samples on the 5 minute slots in one pass, see trendAlign for the modes
 
-            print("Initiate WU TANG STYLE for "+path[j])
-            for h in range (0,len(tStmp),1):
-                start=startTime+timedelta(0,0,0,0,5,0,0)
-                next=start+timedelta(0,0,0,0,5*h,0,0)
-                for t in range(0,len(tStmps),1):
-                    delt=next-tStmps[t]
-                #print next
-                    if delt.total_seconds()<0:
-                    #print "HEYYYYYYYYYYYYYYYYYY"
-                    #print delt
-                    #print tStmps[t]
-                        continue
-                    elif delt.total_seconds()==0:
-                        #print "THIS IS A MATCH!!!"
-                        M[h,j]=values[t]
-                        break
-                    else:
-                        #print "THERE SEEMS TO BE A MISTAKE"
-                        continue
+        M[:,j]=trendAlign.alignToSlots(slots, tStmps, values, alignmode, aligntolerance)
         print(M[:,j])
 
 
 
 
-# Formatting CSV
-#print M
-    a= "Time"
-    b= str(path)
+# Writing the aligned block, see trendWriters for the formats
 
-    FILE = open('Desktop/hvac_data_test/Zone4/'+cprog+'/'+cprog+' '+str(filedate)+'.csv','w')
-    FILE.write(str(a)+","+str(b)+'\n')
-
-    for f in range(0,len(tStmp),1):
-
-        FILE.write(str(tStmp[f])+",")
-        for a in range(0,len(path),1):
-            FILE.write(str(M[f,a])+",")
-        FILE.write('\n')
-
-
-
-#np.savetxt('/Users/Student/Dropbox/HVAC/Data/Zone4/'+cprog+'/'+cprog+' '+str(filedate)+'.csv', str(row_label) + M, delimiter=",",fmt='%10.5f')
-
-
-
-    FILE.close()
+    writer.write(cprog, slots, path, M)
     return 1
 
 
 ############################################################################################################################################################################################################################################################################################################
 
-import zeep
+import trendPull
+import trendClient
+import trendAlign
+import trendDecode
+import trendWriters
 import sys, time, calendar
 import smtplib
 import math
@@ -255,7 +185,6 @@ from datetime import datetime, timedelta, date, time
 import csv
 import numpy as np
 from collections import defaultdict
-import os
 import string
 
 print(datetime.now())
@@ -298,11 +227,59 @@ for i, row in enumerate(csv.reader(open('Zone4.csv', 'r'))):
 
 #SET DATE RANGE HERE!! (MAKE SURE YOU PUT THE DAY AFTER DATE OF INTEREST eg:Dec 9 = 10 <<<<---------------------------------------------------------------
 
-for d in range(1,11,1):
+days = range(1,11,1)
+
+
+#SET ALIGNMENT HERE!! ('exact', 'nearest' or 'locf', tolerance in seconds or None for no limit) <<<<---------------------------------------------------------------
+
+alignmode = 'exact'
+aligntolerance = None
+
+
+#SET CONCURRENCY HERE!! (KEEP IT LOW ENOUGH NOT TO OVERLOAD THE WEBCTRL SERVER) <<<<---------------------------------------------------------------
+
+server = "10.20.0.47"
+maxWorkers = 8
+puller = trendPull.TrendPuller(trendClient.trendClientFactory(server, poolSize=maxWorkers), maxWorkers=maxWorkers, timeout=60, retries=3)
+
+
+#SET OUTPUT HERE!! ('csv', 'npz' or 'parquet'; daily=True keeps one csv per control program per day, daily=False appends to one file per control program) <<<<---------------------------------------------------------------
+
+writer = trendWriters.CsvTrendWriter('Desktop/hvac_data_test/Zone4', daily=True)
+#writer = trendWriters.createWriter('npz', 'Desktop/hvac_data_test/Zone4')
+
+# with append=True the files of an earlier run are checked against the paths before anything is pulled
+writer.prepare(stuff, [trendAlign.slotGrid(*gettimerange(d)[:2], 5*60)[0] for d in days])
+
+
+# every path of every control program for every day is requested at once, the pool bounds how many are in flight.
+# a control program is written as soon as all of its paths for that day are back.
+
+requests = []
+dayof = {}
+for d in days:
+    startTime,endTime,filedate = gettimerange(d)
+    dayof[endTime] = d
     for cprog,path in stuff.items():
-        print(cprog, path)
+        for p in path:
+            requests.append(trendPull.TrendRequest(p, cprog, startTime, endTime))
 
-        test=getdata(path,cprog,point,date2,d)
+pending = defaultdict(dict)
+
+for result in puller.pull(requests):
+    request = result.request
+    d = dayof[request.endTime]
+    key = (d, request.controlProgram)
+
+    if result.error is not None:
+        print("no data from path "+request.path+" after "+str(result.attempts)+" attempts: "+str(result.error))
+
+    pending[key][request.path] = result.data
+
+    if len(pending[key]) == len(set(stuff[request.controlProgram])):
+        print(request.controlProgram, stuff[request.controlProgram])
+
+        test=getdata(stuff[request.controlProgram],request.controlProgram,point,date2,d,pending.pop(key))
 
         if (test==1):
 
@@ -310,3 +287,5 @@ for d in range(1,11,1):
 
         else:
             print("no data from path")
+
+writer.close()